@@ -0,0 +1,242 @@
+# answer_render.py
+"""
+Answer common result shapes from templates instead of the final LLM call:
+
+    scalar count      "How many employees are in HR?"        -> There are 12 employees.
+    scalar aggregate  "What is the average salary?"          -> The average salary is 84,512.30.
+    single row        "Show John Smith's details"            -> Here is what I found: first name John, ...
+    name list         "List employees in HR"                 -> Here are the 12 employees: John Smith, ...
+    small group-by    "How many employees per department?"   -> Here is the number of employees by department: ...
+
+Anything else returns None and generate_answer falls back to the model, as do yes/no and "who" questions
+the result can't answer directly, and columns whose names say nothing (COUNT(*) beside other values, n, c).
+"""
+import os
+import re
+import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from states import ResultSet
+from metrics import Counter, Gauge, register, register_collector
+
+ANSWERS = register(Counter("sqlagent_answers_total", "Final answers by how they were produced", ("path",)))
+ANSWERS_WITHOUT_LLM = register(Gauge("sqlagent_answers_without_llm_ratio", "Share of answers served without the LLM"))
+
+stats = {"template": 0, "cache": 0, "llm": 0}
+
+COUNT_INTENT = re.compile(r"\b(how many|number of|count|total number)\b")
+LIST_INTENT = re.compile(r"^\s*(list|show|give|display|name|which|who|what are)\b")
+GROUP_INTENT = re.compile(r"\b(per|by|each|for every|breakdown)\b")
+# "Is there...", "Does HR have..." want a yes/no the templates can't phrase; "Can you list..." is a request
+YES_NO_INTENT = re.compile(r"^\s*(is|are|was|were|do|does|did|has|have|had|can|could|will|would|should)\b(?!\s+(you|u)\b)")
+WHO_INTENT = re.compile(r"^\s*(who|whose|whom)\b")
+AGGREGATES = {"avg": "average", "average": "average", "mean": "average", "sum": "total", "total": "total",
+              "max": "highest", "maximum": "highest", "highest": "highest", "min": "lowest",
+              "minimum": "lowest", "lowest": "lowest", "count": "number of"}
+SUBJECT_STOP = {"are", "is", "were", "was", "do", "does", "did", "in", "of", "from", "with", "who", "that",
+                "which", "where", "have", "has", "work", "works", "working", "by", "per", "for", "each", "there"}
+# Labels that say nothing about the value: bare aggregates and short aliases like n, c, cnt
+GENERIC_LABELS = {"number of", "value", "count", "cnt", "num", "total", "average", "highest", "lowest", "result"}
+NAME_PARTS = {"name", "first name", "last name", "middle name", "given name", "family name", "surname", "full name"}
+
+
+def enabled() -> bool:
+    return os.getenv("ANSWER_TEMPLATES", "true").lower() in ("1", "true", "yes")
+
+
+def list_limit() -> int:
+    return int(os.getenv("ANSWER_LIST_MAX", "50"))
+
+
+def record(path: str):
+    """path is "template" (rendered locally), "cache" (an earlier model answer) or "llm"."""
+    stats[path] += 1
+    ANSWERS.inc(path=path)
+
+
+def without_llm_rate() -> float:
+    total = sum(stats.values())
+    return (total - stats["llm"]) / total if total else 0.0
+
+
+@register_collector
+def _export_metrics():
+    ANSWERS_WITHOUT_LLM.set(without_llm_rate())
+
+
+# -- formatting ---------------------------------------------------------------
+
+def fmt(value) -> str:
+    if value is None:
+        return "none"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, Decimal):
+        value = int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return " ".join(str(value).split())
+
+
+def humanize(column: str) -> str:
+    """AVG(e.salary) -> average salary, first_name -> first name, HireDate -> hire date."""
+    match = re.match(r"^\s*(\w+)\s*\(\s*(?:distinct\s+)?(?:\w+\.)?([\w*]+)\s*\)\s*$", column, re.I)
+    if match:
+        func, arg = match.group(1).lower(), match.group(2)
+        label = AGGREGATES.get(func, func)
+        return label if arg == "*" else f"{label} {humanize(arg)}"
+    words = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", column).replace("_", " ").lower().split()
+    if words and words[0] in AGGREGATES and len(words) > 1:
+        words[0] = AGGREGATES[words[0]]
+    return " ".join(words) or "value"
+
+
+def label(column: str) -> Optional[str]:
+    """humanize(column), or None when it wouldn't mean anything to the reader."""
+    text = humanize(column)
+    if text in GENERIC_LABELS or len(re.sub(r"\W", "", column)) <= 2:
+        return None
+    return text
+
+
+def singular(noun: str) -> str:
+    if noun.endswith("ies") and len(noun) > 4:
+        return noun[:-3] + "y"
+    if noun.endswith("s") and not noun.endswith(("ss", "us", "is")):
+        return noun[:-1]
+    return noun
+
+
+def subject(question: str) -> Optional[str]:
+    """The thing being counted or listed: 'how many active employees are in HR' -> 'active employees'."""
+    q = question.lower()
+    match = re.search(r"\b(?:how many|number of|count(?: of)?|list(?: all)?(?: of)?|show(?: me)?(?: all)?(?: the)?|"
+                      r"which|name(?: all)?(?: the)?)\s+(?:the\s+|all\s+)?([a-z][a-z ]*)", q)
+    if not match:
+        return None
+    words = []
+    for word in match.group(1).split():
+        if word in SUBJECT_STOP:
+            break
+        words.append(word)
+        if len(words) == 3:
+            break
+    return " ".join(words) or None
+
+
+def _numeric(value) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _join(items: List[str]) -> str:
+    if len(items) <= 2:
+        return " and ".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+# -- shapes -------------------------------------------------------------------
+
+def render_scalar(question: str, column: str, value) -> str:
+    q = question.lower()
+    if value is None:
+        return "I couldn't find a value for that in the database."
+    text = label(column)
+    if COUNT_INTENT.search(q) and _numeric(value):
+        noun = subject(question)
+        if noun is None and text is not None and text.startswith("number of "):
+            noun = text[len("number of "):]
+        noun = noun or text or "records"
+        if value == 1:
+            return f"There is 1 {singular(noun)}."
+        return f"There are {fmt(value)} {noun}."
+    if text is None:
+        return None
+    return f"The {text} is {fmt(value)}."
+
+
+def render_row(columns: List[str], row: tuple) -> Optional[str]:
+    labels = [label(c) for c in columns]
+    if len(columns) > 8 or None in labels:
+        return None
+    parts = [f"{text} {fmt(v)}" for text, v in zip(labels, row)]
+    return f"Here is what I found: {_join(parts)}."
+
+
+def render_list(question: str, result: ResultSet) -> Optional[str]:
+    limit = list_limit()
+    # Name-like rows: every value is text, e.g. (first_name, last_name)
+    if len(result.columns) > 3 or not all(isinstance(v, str) or v is None for row in result.rows for v in row):
+        return None
+    if len(result.columns) > 1:
+        # Several columns are joined into one item per row, which only reads right for name parts
+        if any(humanize(c) not in NAME_PARTS for c in result.columns):
+            return None
+        noun = subject(question)
+    else:
+        noun = subject(question) or label(result.columns[0])
+    if noun is None:
+        return None
+    items = [" ".join(fmt(v) for v in row if v is not None) for row in result.rows[:limit]]
+    total = result.total_rows if result.total_rows is not None else len(result.rows)
+    shown = len(items)
+    if result.truncated and result.total_rows is None:
+        head = f"Here are the first {shown} {noun} (there are more)"
+    elif total > shown:
+        head = f"Here are {shown} of the {fmt(total)} {noun}"
+    elif total == 1:
+        return f"I found one {singular(noun)}: {items[0]}."
+    else:
+        head = f"Here are the {fmt(total)} {noun}"
+    return f"{head}: {_join(items)}."
+
+
+def render_groups(question: str, result: ResultSet) -> Optional[str]:
+    if len(result.columns) != 2 or len(result.rows) > 20 or result.truncated:
+        return None
+    label_col, value_col = result.columns
+    if not all(_numeric(row[1]) for row in result.rows) or any(_numeric(row[0]) for row in result.rows):
+        return None
+    q = question.lower()
+    group = label(label_col)
+    if COUNT_INTENT.search(q):
+        metric = f"number of {subject(question) or 'records'}"
+    else:
+        metric = label(value_col)
+    if group is None or metric is None:
+        return None
+    lines = [f"- {fmt(name)}: {fmt(value)}" for name, value in result.rows]
+    return f"Here is the {metric} by {group}:\n" + "\n".join(lines)
+
+
+def render_answer(question: str, result) -> Optional[str]:
+    """A finished answer for common result shapes, or None when the model should write it."""
+    if not enabled() or not isinstance(result, ResultSet) or not result.columns:
+        return None
+    q = question.lower()
+    rows = result.rows
+    if YES_NO_INTENT.search(q):
+        return None
+    if WHO_INTENT.search(q) and not any(isinstance(v, str) for row in rows[:1] for v in row):
+        # "Who earns the most?" answered with only MAX(salary) doesn't say who
+        return None
+    if not rows:
+        noun = subject(question)
+        return f"I couldn't find any matching {noun}." if noun else "I couldn't find any matching records."
+    if len(rows) == 1 and len(result.columns) == 1:
+        return render_scalar(question, result.columns[0], rows[0][0])
+    if len(result.columns) == 2 and GROUP_INTENT.search(q):
+        answer = render_groups(question, result)
+        if answer:
+            return answer
+    if LIST_INTENT.search(q) or len(result.columns) == 1:
+        answer = render_list(question, result)
+        if answer:
+            return answer
+    if len(rows) == 1:
+        return render_row(result.columns, rows[0])
+    return render_groups(question, result)
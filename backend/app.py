@@ -1,77 +1,280 @@
-# app.py
-
-import os
-import re
-import uvicorn
-from dotenv import load_dotenv
-from typing import Union
-from pydantic import BaseModel
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-
-from nodes import load_db, load_azure_db
-from graph import graph
-
-# 1. Load all .env variables
-load_dotenv()
-
-app = FastAPI()
-
-class CustomCORSMiddleware(CORSMiddleware):
-    def is_allowed_origin(self, origin: str) -> bool:
-        return bool(re.match(r"^http:\/\/[\w\-]+\.employez\.ai:3000$", origin))
-
-app.add_middleware(
-    CustomCORSMiddleware,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-class QuestionRequest(BaseModel):
-    text: str
-    clientId: str
-
-@app.post("/ask")
-async def ask(body: QuestionRequest):
-    print("Received Question:", body.text)
-    print("From Client DB:", body.clientId)
-
-    # 2. Choose Azure vs MySQL based on USE_AZURE flag in .env
-    use_azure = os.getenv("USE_AZURE", "true").lower() in ("1", "true", "yes")
-
-    if use_azure:
-        print("→ Loading Azure SQL Database…")
-        db = load_azure_db()
-    else:
-        print("→ Loading local MySQL Database…")
-        db = load_db(
-            name=os.getenv("MYSQL_USER"),
-            pwd=os.getenv("MYSQL_PASSWORD"),
-            ht=os.getenv("MYSQL_HOST"),
-            dbname=body.clientId
-        )
-
-    # 3. Run your graph with the selected DB
-    result = graph.invoke(
-        {
-            "question": body.text,
-            "max_attempts": 2,
-        },
-        config={"configurable": {"db": db, "thread_id": "1"}}
-    )
-
-    # 4. Return answer or error
-    if "answer" in result:
-        return {"answer": result["answer"]}
-    else:
-        return {"answer": result.get("error_message", "Unknown error")}
-
-def main(argv=None):
-    try:
-        uvicorn.run("app:app", host="0.0.0.0", port=8181)
-    except KeyboardInterrupt:
-        pass
-
-if __name__ == "__main__":
-    main()
+# app.py
+
+import os
+import re
+import json
+import time
+from typing import List, Union, Optional
+from pydantic import BaseModel
+from contextlib import aclosing, asynccontextmanager, nullcontext
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+
+from settings import get_settings, configure_environment
+from concurrency import run_db, shutdown as shutdown_executors
+from scheduler import scheduler, Overloaded, StageTimeout
+from replicas import NoHealthyEndpoint
+from metrics import REQUEST_SECONDS, install_llm_metrics, log_event, render as render_metrics
+from batch import run_batch
+import profiling
+
+# 1. Load all .env variables into typed settings (no prompts, no connections at import)
+settings = get_settings()
+
+def preload():
+    # Imports only: nothing here opens a connection or starts a thread, so it is safe before a pre-fork
+    import graph, db_registry, checkpointer, llm, nodes  # noqa: F401
+
+if settings.preload:
+    preload()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy modules, the graph (and its checkpointer connection) and the registry are built per worker
+    from graph import build_graph
+    from db_registry import get_registry, close_registry
+    from checkpointer import start_compaction, stop_compaction
+    from llm import close_models
+
+    configure_environment(settings, interactive=False)
+    install_llm_metrics()
+    app.state.graph = build_graph()
+    get_registry()  # DB pools are created lazily per tenant on first request
+    start_compaction(app.state.graph.checkpointer)
+    yield
+    stop_compaction()
+    close_registry()
+    close_models()
+    shutdown_executors()
+
+app = FastAPI(lifespan=lifespan)
+
+class CustomCORSMiddleware(CORSMiddleware):
+    def is_allowed_origin(self, origin: str) -> bool:
+        return bool(re.match(r"^http:\/\/[\w\-]+\.employez\.ai:3000$", origin))
+
+app.add_middleware(
+    CustomCORSMiddleware,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse({"error": str(exc)}, status_code=429, headers={"Retry-After": str(int(exc.retry_after + 0.999))})
+
+@app.exception_handler(NoHealthyEndpoint)
+async def no_healthy_endpoint(request: Request, exc: NoHealthyEndpoint):
+    log_event("database_unavailable", tenant=exc.tenant)
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": str(int(exc.retry_after + 0.999))})
+
+@app.exception_handler(StageTimeout)
+async def stage_timeout(request: Request, exc: StageTimeout):
+    log_event("stage_timeout", stage=exc.stage, seconds=exc.seconds)
+    return JSONResponse({"error": str(exc)}, status_code=504)
+
+class QuestionRequest(BaseModel):
+    text: str
+    clientId: str
+    sessionId: Optional[str] = None
+
+async def graph_config(body: QuestionRequest) -> dict:
+    # Reuse the pooled Azure/MySQL database for this client (USE_AZURE flag in .env)
+    from db_registry import get_registry
+    registry = get_registry()
+    db = await run_db(body.clientId, registry.get, body.clientId)
+    catalog = registry.catalog(body.clientId)
+    # One conversation thread per client session, never shared across tenants
+    thread_id = f"{body.clientId}:{body.sessionId or 'default'}"
+    return {"configurable": {"db": db, "catalog": catalog, "replicas": registry.replicas(body.clientId),
+                             "client_id": body.clientId, "thread_id": thread_id}}
+
+def final_answer(result: dict) -> str:
+    if "answer" in result:
+        return result["answer"]
+    return result.get("error_message", "Unknown error")
+
+@app.post("/ask")
+async def ask(body: QuestionRequest, request: Request, response: Response):
+    log_event("question_received", tenant=body.clientId, question=body.text)
+    start = time.perf_counter()
+    trigger = profiling.trigger(request.headers, body.clientId)
+
+    async with scheduler.slot(body.clientId):
+        # 2. Select the client's DB
+        config = await graph_config(body)
+
+        # 3. Run your graph with the selected DB without blocking the event loop
+        async with profiling.profiled(body.clientId, body.text, trigger) if trigger else nullcontext() as profile:
+            result = await app.state.graph.ainvoke(
+                {
+                    "question": body.text,
+                    "max_attempts": 2,
+                },
+                config=config
+            )
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile.id
+
+    # 4. Return answer or error
+    elapsed = time.perf_counter() - start
+    REQUEST_SECONDS.observe(elapsed, endpoint="/ask")
+    log_event("question_answered", tenant=body.clientId, seconds=round(elapsed, 3))
+    return {"answer": final_answer(result)}
+
+STREAMED_NODES = ("generate_answer", "general_chat")
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def node_event(node: str, output: dict) -> dict:
+    data = {"node": node}
+    if node == "select_relevant_schemas":
+        data["status"] = "no_relevant_tables" if output.get("error_message") else "schema_selected"
+    elif node == "generate_query" and output.get("queries"):
+        data["sql"] = output["queries"][-1].statement
+    elif node == "execute_query" and output.get("queries"):
+        query = output["queries"][-1]
+        data["status"] = "rows_fetched" if query.is_valid else "query_failed"
+        if query.is_valid and not isinstance(query.result, str):
+            data["rows"] = len(query.result.rows)
+            data["total_rows"] = query.result.total_rows
+    return data
+
+@app.post("/ask/stream")
+async def ask_stream(body: QuestionRequest, request: Request):
+    log_event("question_received", tenant=body.clientId, question=body.text, stream=True)
+    trigger = profiling.trigger(request.headers, body.clientId)
+
+    async def graph_events():
+        start = time.perf_counter()
+        async with scheduler.slot(body.clientId):
+            config = await graph_config(body)
+            async with profiling.profiled(body.clientId, body.text, trigger) if trigger else nullcontext() as profile:
+                async with aclosing(stream_graph(config, start)) as chunks:
+                    async for chunk in chunks:
+                        yield chunk
+                if profile is not None:
+                    # Headers are long gone, so the id arrives as the last event
+                    yield sse("profile", {"id": profile.id})
+
+    async def stream_graph(config: dict, start: float):
+        finished = set()
+        # Closing the connection cancels this generator, which cancels the running graph
+        async for event in app.state.graph.astream_events(
+            {"question": body.text, "max_attempts": 2}, config=config, version="v2"
+        ):
+            if await request.is_disconnected():
+                log_event("client_disconnected", tenant=body.clientId)
+                return
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+            if kind == "on_chat_model_stream" and node in STREAMED_NODES:
+                token = event["data"]["chunk"].content
+                if token:
+                    yield sse("token", {"node": node, "text": token})
+            elif kind == "on_chain_end" and event["name"] == node and isinstance(event["data"].get("output"), dict):
+                # The node task and its runnable both end under the node's name; report each step once
+                step = (node, event["metadata"].get("langgraph_step"))
+                if step not in finished:
+                    finished.add(step)
+                    yield sse("node", node_event(node, event["data"]["output"]))
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/ask/stream")
+                yield sse("answer", {"answer": final_answer(event["data"]["output"])})
+
+    async def events():
+        # Headers are already sent, so late rejections and deadlines arrive as an error event
+        try:
+            async for chunk in graph_events():
+                yield chunk
+        except (Overloaded, StageTimeout, NoHealthyEndpoint) as e:
+            yield sse("error", {"error": str(e)})
+
+    # Reject before the 200 goes out when the tenant's queue is already full
+    scheduler.check(body.clientId)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BatchRequest(BaseModel):
+    clientId: str
+    questions: List[str]
+    workers: Optional[int] = None
+
+@app.post("/ask/batch")
+async def ask_batch(body: BatchRequest, request: Request):
+    log_event("batch_received", tenant=body.clientId, questions=len(body.questions))
+
+    async def lines():
+        # run_batch takes a request slot per question, so the batch counts against the tenant's cap
+        async for row in run_batch(body.clientId, body.questions, body.workers):
+            if await request.is_disconnected():
+                log_event("client_disconnected", tenant=body.clientId, batch=True)
+                return
+            yield json.dumps(row, default=str) + "\n"
+
+    scheduler.check(body.clientId)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def serve_gunicorn(workers: int) -> bool:
+    """Pre-forking server: the master imports the app once and forks workers that share those pages."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        return False
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{settings.host}:{settings.port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
+            # The lifespan (graph, registry, executors) runs in each worker after the fork
+            self.cfg.set("graceful_timeout", int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+
+        def load(self):
+            from app import app as application
+            return application
+
+    Server().run()
+    return True
+
+def main(argv=None):
+    import argparse
+    import uvicorn
+    from settings import reset_settings
+
+    parser = argparse.ArgumentParser(description="Serve the SQL agent API")
+    parser.add_argument("--workers", default=None, help="worker processes, or 'auto' for one per core (env WORKERS)")
+    args = parser.parse_args(argv)
+    if args.workers is not None:
+        # Workers and the shared-cache defaults read this from the environment
+        os.environ["WORKERS"] = str(args.workers)
+        reset_settings()
+    workers = get_settings().workers
+
+    try:
+        if workers == 1:
+            uvicorn.run("app:app", host=settings.host, port=settings.port)
+            return
+        # Catalog files, the SQL/answer cache and the checkpointer are SQLite/JSON on local disk,
+        # so every worker sees what the others reflected, generated and answered
+        print(f"Starting {workers} workers on {settings.host}:{settings.port}")
+        preload()
+        if not serve_gunicorn(workers):
+            # uvicorn spawns fresh interpreters instead of forking, so each worker imports on its own
+            uvicorn.run("app:app", host=settings.host, port=settings.port, workers=workers)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# batch.py
+"""
+Run many questions for one tenant in a single pass.
+
+The tenant's database, catalog and table index are loaded once, repeated questions run once,
+questions the table index can't settle share one table-selection LLM call per chunk, and graph
+runs execute concurrently. Results are yielded in completion order.
+
+    from batch import ask_batch
+    results = ask_batch("acme", ["How many employees are there?", "List all departments"], workers=8)
+"""
+import os
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from concurrency import run_db
+from scheduler import scheduler
+from query_cache import normalize_question
+from metrics import REQUEST_SECONDS, log_event
+
+_graph = None
+
+
+def batch_graph():
+    # Batch questions are independent, so they skip the conversation checkpointer
+    global _graph
+    if _graph is None:
+        from graph import build_graph
+        _graph = build_graph(persistent=False)
+    return _graph
+
+
+def default_workers() -> int:
+    return int(os.getenv("BATCH_WORKERS", "8"))
+
+
+def max_workers() -> int:
+    return int(os.getenv("BATCH_MAX_WORKERS", "32"))
+
+
+def rank_all(db, catalog, questions: List[str]) -> Dict[str, tuple]:
+    from nodes import rank_tables
+    if catalog:
+        catalog.snapshot()
+    return {q: rank_tables(db, catalog, q) for q in questions}
+
+
+def chunk_candidates(ranked: List[tuple], limit: int) -> list:
+    # Union of each question's candidates, best-ranked first
+    seen = []
+    for _, _, candidates in ranked:
+        for table in candidates:
+            if table not in seen:
+                seen.append(table)
+    return seen[:limit]
+
+
+async def select_tables(tenant: str, ranked: Dict[str, tuple]) -> Tuple[Dict[str, asyncio.Future], list]:
+    """One future per question resolving to its table list (None lets the graph choose), plus the LLM tasks."""
+    from nodes import abatch_select_tables
+
+    loop = asyncio.get_running_loop()
+    futures = {}
+    ambiguous = []
+    for question, (_, relevant, _) in ranked.items():
+        futures[question] = loop.create_future()
+        if relevant is not None:
+            futures[question].set_result(relevant)
+        else:
+            ambiguous.append(question)
+
+    size = int(os.getenv("BATCH_SELECT_SIZE", "10"))
+    limit = 2 * int(os.getenv("TABLE_CANDIDATES", "25"))
+
+    async def chunk(questions: List[str]):
+        candidates = chunk_candidates([ranked[q] for q in questions], limit)
+        selections = [None] * len(questions)
+        try:
+            selections = await abatch_select_tables(questions, candidates, tenant)
+        finally:
+            # Never leave a question waiting on a chunk that failed
+            for question, tables in zip(questions, selections):
+                if not futures[question].done():
+                    futures[question].set_result(tables)
+
+    tasks = [asyncio.create_task(chunk(ambiguous[i:i + size])) for i in range(0, len(ambiguous), size)]
+    return futures, tasks
+
+
+def result_row(index: int, question: str, result: Optional[dict], error: Optional[str], seconds: float,
+               duplicate_of: Optional[int]) -> dict:
+    row = {"index": index, "question": question, "seconds": round(seconds, 3)}
+    if duplicate_of is not None:
+        row["duplicate_of"] = duplicate_of
+    if error is not None:
+        row["error"] = error
+        return row
+    row["answer"] = result.get("answer") or result.get("error_message", "Unknown error")
+    queries = result.get("queries") or []
+    if queries:
+        row["sql"] = queries[-1].statement
+    return row
+
+
+async def run_batch(client_id: str, questions: List[str], workers: Optional[int] = None,
+                    registry=None, graph=None) -> AsyncIterator[dict]:
+    """Yield one result row per input question (including duplicates) as each finishes."""
+    from db_registry import get_registry
+
+    registry = registry or get_registry()
+    graph = graph or batch_graph()
+    workers = max(1, min(workers or default_workers(), max_workers()))
+    start = time.perf_counter()
+
+    # First occurrence of each normalized question does the work; repeats share its result
+    groups: Dict[str, List[int]] = {}
+    unique: Dict[str, str] = {}
+    for i, question in enumerate(questions):
+        key = normalize_question(question)
+        groups.setdefault(key, []).append(i)
+        unique.setdefault(key, question)
+
+    db = await run_db(client_id, registry.get, client_id)
+    catalog = registry.catalog(client_id)
+    replicas = registry.replicas(client_id)
+    ranked = await run_db(client_id, rank_all, db, catalog, list(unique.values()))
+    selections, select_tasks = await select_tables(client_id, ranked)
+    log_event("batch_started", tenant=client_id, questions=len(questions), unique=len(unique),
+              llm_selection=sum(1 for r in ranked.values() if r[1] is None), workers=workers)
+
+    sem = asyncio.Semaphore(workers)
+
+    async def one(key: str):
+        question = unique[key]
+        async with sem:
+            began = time.perf_counter()
+            try:
+                relevant = await selections[question]
+                configurable = {"db": db, "catalog": catalog, "replicas": replicas, "client_id": client_id}
+                if relevant is not None:
+                    configurable["relevant_tables"] = relevant
+                # Each graph run takes its own request slot, so a batch stays within the tenant's cap
+                async with scheduler.slot(client_id):
+                    result = await graph.ainvoke({"question": question, "max_attempts": 2},
+                                                 config={"configurable": configurable})
+                return key, result, None, time.perf_counter() - began
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return key, None, f"{type(e).__name__}: {e}", time.perf_counter() - began
+
+    tasks = [asyncio.create_task(one(key)) for key in unique]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            key, result, error, seconds = await finished
+            first = groups[key][0]
+            for index in groups[key]:
+                yield result_row(index, questions[index], result, error, seconds,
+                                 None if index == first else first)
+    finally:
+        for task in tasks + select_tasks:
+            if not task.done():
+                task.cancel()
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.observe(elapsed, endpoint="/ask/batch")
+        log_event("batch_finished", tenant=client_id, questions=len(questions), seconds=round(elapsed, 3))
+
+
+async def aask_batch(client_id: str, questions: List[str], workers: Optional[int] = None, **kwargs) -> List[dict]:
+    rows = [row async for row in run_batch(client_id, questions, workers, **kwargs)]
+    return sorted(rows, key=lambda row: row["index"])
+
+
+def ask_batch(client_id: str, questions: List[str], workers: Optional[int] = None, **kwargs) -> List[dict]:
+    """Blocking helper returning rows in input order."""
+    return asyncio.run(aask_batch(client_id, questions, workers, **kwargs))
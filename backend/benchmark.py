@@ -0,0 +1,312 @@
+# benchmark.py
+"""
+Offline benchmark: local SQLite tenants, a fake chat model and no network.
+
+    python benchmark.py --tenants 2 --tables 200 --rows 100000 --requests 200 --concurrency 20 --mode ainvoke
+
+--llm server routes the real ChatGroq client pool through a local fake_groq_server instead.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import statistics
+from collections import defaultdict
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+
+NODES = ("select_relevant_schemas", "generate_query", "execute_query", "generate_answer", "general_chat")
+FIRST_NAMES = ["John", "Maria", "Wei", "Aisha", "Carlos", "Olga", "Kenji", "Fatima", "Liam", "Priya"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Khan", "Silva", "Ivanova", "Sato", "Haddad", "Murphy", "Patel"]
+DEPARTMENTS = ["HR", "Engineering", "Sales", "Finance", "Support", "Marketing", "Legal", "Operations"]
+QUESTIONS = [
+    "How many employees are there?",
+    "List employees in HR department",
+    "How many departments do we have?",
+    "Show the salary of employees in Engineering",
+    "Hello, who are you?",
+    "List all departments",
+]
+
+
+def make_tenant_db(path: str, tables: int = 50, rows: int = 10000, seed: int = 0):
+    """Employee-style schema: employee_information and departments plus filler tables up to `tables`."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE departments (department_id INTEGER PRIMARY KEY, department_name TEXT, location TEXT)")
+    conn.executemany(
+        "INSERT INTO departments VALUES (?, ?, ?)",
+        [(i + 1, name, rng.choice(["NYC", "London", "Pune", "Berlin"])) for i, name in enumerate(DEPARTMENTS)],
+    )
+    conn.execute(
+        "CREATE TABLE employee_information (EmployeeID INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, "
+        "department_id INTEGER REFERENCES departments(department_id), salary REAL, hire_date TEXT)"
+    )
+    batch = []
+    for i in range(rows):
+        batch.append((i + 1, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.randint(1, len(DEPARTMENTS)),
+                      round(rng.uniform(30000, 180000), 2), f"20{rng.randint(10, 24):02d}-{rng.randint(1, 12):02d}-01"))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO employee_information VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO employee_information VALUES (?, ?, ?, ?, ?, ?)", batch)
+    prefixes = ["emp_payroll", "emp_leave", "emp_training", "dept_budget", "project", "asset", "timesheet"]
+    for t in range(max(0, tables - 2)):
+        name = f"{prefixes[t % len(prefixes)]}_{t:04d}"
+        conn.execute(f"CREATE TABLE {name} (id INTEGER PRIMARY KEY, EmployeeID INTEGER, amount REAL, note TEXT)")
+        conn.executemany(
+            f"INSERT INTO {name} VALUES (?, ?, ?, ?)",
+            [(r + 1, rng.randint(1, max(rows, 1)), rng.random() * 1000, f"note {r}") for r in range(20)],
+        )
+    conn.commit()
+    conn.close()
+
+
+class NodeTimer:
+    """Callback handler collecting wall time per graph node across all runs."""
+
+    def __init__(self):
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        timer = self
+
+        class Handler(BaseCallbackHandler):
+            def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+                timer.start(kwargs.get("name"), run_id, parent_run_id, metadata or {})
+
+            def on_chain_end(self, outputs, *, run_id, **kwargs):
+                timer.end(run_id)
+
+            def on_chain_error(self, error, *, run_id, **kwargs):
+                timer.end(run_id)
+
+        self.handler = Handler()
+        self.times = defaultdict(list)
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def start(self, name, run_id, parent_run_id, metadata):
+        if name not in NODES or metadata.get("langgraph_node") != name:
+            return
+        with self._lock:
+            # The node task and the runnable inside it share a name; time only the outer one
+            parent = self._open.get(parent_run_id)
+            if parent is None or parent[0] != name:
+                self._open[run_id] = (name, time.perf_counter())
+
+    def end(self, run_id):
+        with self._lock:
+            item = self._open.pop(run_id, None)
+            if item is not None:
+                self.times[item[0]].append(time.perf_counter() - item[1])
+
+
+def percentiles(values):
+    if len(values) < 2:
+        v = values[0] if values else 0.0
+        return {"p50": v, "p95": v, "p99": v}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+def setup_environment(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sqlbench_")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.update({
+        "DB_BACKEND": "sqlite",
+        "SQLITE_DIR": workdir,
+        "CATALOG_DIR": os.path.join(workdir, "catalog"),
+        "CHECKPOINTER": "memory",
+        "QUERY_CACHE": "memory" if args.cache else "off",
+        "SPECULATIVE_GRAPH": "1" if args.speculative else "0",
+        "LANGCHAIN_TRACING_V2": "false",
+    })
+    # Keys the fake model never uses, so nothing prompts for them
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("LANGCHAIN_API_KEY", "benchmark")
+    tenants = []
+    for i in range(args.tenants):
+        name = f"tenant{i}"
+        path = os.path.join(workdir, f"{name}.db")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            make_tenant_db(path, tables=args.tables, rows=args.rows, seed=i)
+            print(f"Created {path} ({args.tables} tables, {args.rows} rows) in {time.perf_counter() - start:.1f}s")
+        tenants.append(name)
+    return workdir, tenants
+
+
+async def run_ainvoke(graph, registry, jobs, concurrency, callbacks):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(tenant, question):
+        async with sem:
+            start = time.perf_counter()
+            config = {"configurable": {"db": registry.get(tenant), "catalog": registry.catalog(tenant),
+                                       "replicas": registry.replicas(tenant), "client_id": tenant, "thread_id": f"{tenant}:bench"},
+                      "callbacks": callbacks}
+            await graph.ainvoke({"question": question, "max_attempts": 2}, config=config)
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(one(t, q) for t, q in jobs))
+
+
+def run_invoke(graph, registry, jobs, concurrency, callbacks):
+    def one(job):
+        tenant, question = job
+        start = time.perf_counter()
+        config = {"configurable": {"db": registry.get(tenant), "catalog": registry.catalog(tenant),
+                                   "replicas": registry.replicas(tenant), "client_id": tenant, "thread_id": f"{tenant}:bench"},
+                  "callbacks": callbacks}
+        graph.invoke({"question": question, "max_attempts": 2}, config=config)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, jobs))
+
+
+async def run_batch_mode(registry, jobs, concurrency, callbacks):
+    from batch import run_batch, batch_graph
+
+    graph = batch_graph().with_config(callbacks=callbacks)
+    by_tenant = defaultdict(list)
+    for tenant, question in jobs:
+        by_tenant[tenant].append(question)
+    start = time.perf_counter()
+    latencies = []
+
+    async def one(tenant, questions):
+        async for _ in run_batch(tenant, questions, workers=concurrency, registry=registry, graph=graph):
+            # Completion time since the batch started, as a caller reading the stream sees it
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(t, qs) for t, qs in by_tenant.items()))
+    return latencies
+
+
+async def run_api(jobs, concurrency, timer):
+    import httpx
+    from langchain_core.tracers.context import register_configure_hook
+    from app import app
+
+    # Inject the node timer into every graph run started by the endpoint
+    timer_var = ContextVar("benchmark_node_timer", default=None)
+    register_configure_hook(timer_var, inheritable=True)
+    timer_var.set(timer.handler)
+
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport doesn't send lifespan events, and the lifespan builds the graph
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(tenant, question):
+            async with sem:
+                start = time.perf_counter()
+                resp = await client.post("/ask", json={"text": question, "clientId": tenant, "sessionId": "bench"})
+                resp.raise_for_status()
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*(one(t, q) for t, q in jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SQL agent graph offline")
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency per call, seconds")
+    parser.add_argument("--mode", choices=["invoke", "ainvoke", "api", "batch"], default="ainvoke")
+    parser.add_argument("--llm", choices=["fake", "server"], default="fake",
+                        help="in-process fake model, or ChatGroq against a local fake HTTP server")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="server mode: answer every Nth call with 429")
+    parser.add_argument("--cache", action="store_true", help="enable the query cache")
+    parser.add_argument("--speculative", action="store_true", help="build the graph with SPECULATIVE_GRAPH=1")
+    parser.add_argument("--workdir", help="reuse tenant databases from this directory")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    workdir, tenants = setup_environment(args)
+
+    from llm import set_chat_model_factory
+    from fake_llm import FakeChatModel
+    from graph import get_graph
+    from db_registry import get_registry
+    from answer_render import without_llm_rate
+
+    server = None
+    if args.llm == "server":
+        from fake_groq_server import FakeGroqServer
+
+        server = FakeGroqServer(("127.0.0.1", 0), latency=args.latency, rate_limit_every=args.rate_limit_every)
+        server.start()
+        os.environ["GROQ_API_BASE"] = server.base_url
+        set_chat_model_factory(None)
+    else:
+        set_chat_model_factory(lambda model: FakeChatModel(model=model, latency=args.latency))
+    graph = get_graph()
+    registry = get_registry()
+    for tenant in tenants:
+        # Connection, reflection and catalog build are reported separately from request latency
+        start = time.perf_counter()
+        registry.catalog(tenant).snapshot()
+        print(f"Warmed {tenant} in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(0)
+    jobs = [(rng.choice(tenants), QUESTIONS[i % len(QUESTIONS)]) for i in range(args.requests)]
+    timer = NodeTimer()
+
+    start = time.perf_counter()
+    if args.mode == "invoke":
+        latencies = run_invoke(graph, registry, jobs, args.concurrency, [timer.handler])
+    elif args.mode == "ainvoke":
+        latencies = asyncio.run(run_ainvoke(graph, registry, jobs, args.concurrency, [timer.handler]))
+    elif args.mode == "batch":
+        latencies = asyncio.run(run_batch_mode(registry, jobs, args.concurrency, [timer.handler]))
+    else:
+        latencies = asyncio.run(run_api(jobs, args.concurrency, timer))
+    wall = time.perf_counter() - start
+
+    report = {
+        "mode": args.mode,
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "llm_latency_s": args.latency,
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency_s": percentiles(sorted(latencies)),
+        "nodes_s": {n: {"count": len(v), **percentiles(sorted(v))} for n, v in timer.times.items()},
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "upstream_llm_calls": sum(server.requests.values()) if server else None,
+        "answers_without_llm": without_llm_rate(),
+        "workdir": workdir,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+    print(f"\n{args.mode}: {report['requests']} requests @ concurrency {args.concurrency} in {wall:.2f}s "
+          f"({report['throughput_rps']:.1f} req/s), peak RSS {report['peak_rss_mb']:.0f} MB")
+    lat = report["latency_s"]
+    if server:
+        print(f"upstream LLM calls {report['upstream_llm_calls']}")
+    print(f"answers without the LLM {report['answers_without_llm'] * 100:.0f}%")
+    print(f"latency  p50 {lat['p50'] * 1000:8.1f} ms  p95 {lat['p95'] * 1000:8.1f} ms  p99 {lat['p99'] * 1000:8.1f} ms")
+    for node, stats in report["nodes_s"].items():
+        print(f"{node:<24} n={stats['count']:<5} p50 {stats['p50'] * 1000:8.1f} ms  p95 {stats['p95'] * 1000:8.1f} ms")
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,158 @@
+# checkpointer.py
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Optional
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from settings import get_settings
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """SQLite checkpointer (WAL) that keeps the last N checkpoints per thread and drops idle threads."""
+
+    def __init__(self, conn: sqlite3.Connection, keep_last: int = 20, idle_ttl: float = 7 * 24 * 3600):
+        super().__init__(conn)
+        self.keep_last = keep_last
+        self.idle_ttl = idle_ttl
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        # Called by cursor() with self.lock already held
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thread_activity_last_seen ON thread_activity (last_seen);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, last_seen) VALUES (?, ?)",
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+        return saved
+
+    def compact(self) -> dict:
+        cutoff = time.time() - self.idle_ttl
+        with self.cursor() as cur:
+            idle = [r[0] for r in cur.execute("SELECT thread_id FROM thread_activity WHERE last_seen < ?", (cutoff,))]
+            for thread_id in idle:
+                cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+            # Checkpoint ids are time-ordered, so the newest N per thread are the highest ids
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS rn FROM checkpoints
+                    ) WHERE rn > ?
+                )
+                """,
+                (self.keep_last,),
+            )
+            trimmed = cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"idle_threads": len(idle), "trimmed_checkpoints": trimmed}
+
+    # SqliteSaver is sync-only; graph.ainvoke runs its I/O on a worker thread instead
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, **kwargs):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, **kwargs))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, *args, **kwargs)
+
+
+class Compactor:
+    def __init__(self, saver: BoundedSqliteSaver, interval: float):
+        self.saver = saver
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpoint-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                print(f"Checkpoint compaction: {self.saver.compact()}")
+            except Exception as e:
+                print(f"❌ Checkpoint compaction failed: {e}")
+
+
+_compactor: Optional[Compactor] = None
+
+
+def make_checkpointer():
+    """Checkpointer selected by CHECKPOINTER=sqlite|memory|none."""
+    kind = get_settings().checkpointer
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return MemorySaver()
+    path = os.getenv("CHECKPOINT_DB", ".cache/checkpoints.sqlite")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return BoundedSqliteSaver(
+        conn,
+        keep_last=int(os.getenv("CHECKPOINT_KEEP_LAST", "20")),
+        idle_ttl=float(os.getenv("CHECKPOINT_IDLE_TTL", str(7 * 24 * 3600))),
+    )
+
+
+def start_compaction(saver):
+    global _compactor
+    if isinstance(saver, BoundedSqliteSaver) and _compactor is None:
+        _compactor = Compactor(saver, interval=float(os.getenv("CHECKPOINT_COMPACT_INTERVAL", "600")))
+        _compactor.start()
+
+
+def stop_compaction():
+    global _compactor
+    if _compactor is not None:
+        _compactor.stop()
+        _compactor = None
@@ -0,0 +1,116 @@
+# concurrency.py
+import os
+import asyncio
+import contextvars
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from scheduler import with_deadline
+from profiling import in_thread
+
+
+class Limits:
+    """Global and per-tenant semaphores, created lazily inside the running event loop."""
+
+    def __init__(self, global_limit: int, tenant_limit: int):
+        self.global_limit = global_limit
+        self.tenant_limit = tenant_limit
+        self._global: Optional[asyncio.Semaphore] = None
+        self._tenants: Dict[str, asyncio.Semaphore] = {}
+
+    async def acquire(self, tenant: str):
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.global_limit)
+        tenant_sem = self._tenants.get(tenant)
+        if tenant_sem is None:
+            tenant_sem = self._tenants.setdefault(tenant, asyncio.Semaphore(self.tenant_limit))
+        # Tenant first, so one busy tenant queues on its own semaphore without holding global slots
+        await tenant_sem.acquire()
+        try:
+            await self._global.acquire()
+        except BaseException:
+            tenant_sem.release()
+            raise
+
+    def release(self, tenant: str):
+        self._global.release()
+        self._tenants[tenant].release()
+
+    @asynccontextmanager
+    async def slot(self, tenant: str):
+        await self.acquire(tenant)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+
+db_limits = Limits(
+    global_limit=int(os.getenv("DB_GLOBAL_CONCURRENCY", "64")),
+    tenant_limit=int(os.getenv("DB_TENANT_CONCURRENCY", "8")),
+)
+llm_limits = Limits(
+    global_limit=int(os.getenv("LLM_CONCURRENCY", "256")),
+    tenant_limit=int(os.getenv("LLM_TENANT_CONCURRENCY", "64")),
+)
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_llm_executor: Optional[ThreadPoolExecutor] = None
+
+
+def db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=db_limits.global_limit, thread_name_prefix="db")
+    return _db_executor
+
+
+def llm_executor() -> ThreadPoolExecutor:
+    """Threads for LLM calls started alongside another stage on the sync (graph.invoke) path."""
+    global _llm_executor
+    if _llm_executor is None:
+        _llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_THREADS", "32")), thread_name_prefix="llm")
+    return _llm_executor
+
+
+def submit(executor: ThreadPoolExecutor, fn: Callable, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, in_thread(fn), *args, **kwargs)
+
+
+def tenant_of(config: dict) -> str:
+    return config.get("configurable", {}).get("client_id", "default")
+
+
+async def run_db(tenant: str, fn: Callable, *args, **kwargs):
+    """Run a blocking DB call on the DB thread pool under the tenant and global DB limits."""
+    loop = asyncio.get_running_loop()
+    # Carry contextvars (callbacks, tracing) into the worker thread like asyncio.to_thread does
+    call = functools.partial(contextvars.copy_context().run, in_thread(fn), *args, **kwargs)
+    await db_limits.acquire(tenant)
+    future = db_executor().submit(call)
+
+    def release(_):
+        # Only once the thread is done: a caller cancelled at a deadline can't stop a running statement,
+        # so its slot stays taken until the statement really ends
+        try:
+            loop.call_soon_threadsafe(db_limits.release, tenant)
+        except RuntimeError:
+            pass  # loop already closed at shutdown
+
+    future.add_done_callback(release)
+    return await asyncio.wrap_future(future)
+
+
+async def run_llm(tenant: str, runnable, inputs):
+    async with llm_limits.slot(tenant):
+        return await with_deadline("llm", runnable.ainvoke(inputs))
+
+
+def shutdown():
+    global _db_executor, _llm_executor
+    for executor in (_db_executor, _llm_executor):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _db_executor = _llm_executor = None
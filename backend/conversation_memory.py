@@ -0,0 +1,172 @@
+# conversation_memory.py
+"""
+Per-session memory for general_chat: a rolling summary of older turns plus a window of recent turns,
+rendered into the prompt within a fixed token budget. Old turns are folded into the summary by a
+background LLM call after the answer has been returned, never on the request path.
+"""
+import os
+import threading
+from typing import Callable, List, Optional
+
+from pydantic import BaseModel, Field
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from prompts import SUMMARIZE_CONVERSATION_INSTRUCTION
+from query_cache import MemoryBackend, SqliteBackend
+from schema_compact import estimate_tokens
+from concurrency import llm_executor
+from settings import get_settings
+from llm import chat_model
+from metrics import Counter, Histogram, register, log_event
+
+MEMORY_SUMMARIES = register(Counter("sqlagent_memory_summaries_total", "Background conversation summaries", ("outcome",)))
+MEMORY_PROMPT_TOKENS = register(Histogram("sqlagent_memory_prompt_tokens", "Estimated tokens of chat history per prompt",
+                                          buckets=(50, 100, 200, 400, 800, 1600, 3200)))
+
+
+class Turn(BaseModel):
+    seq: int = Field(description="Position of the turn in the session")
+    human: str = Field("", description="Human message")
+    llm: str = Field("", description="answer by LLM")
+
+
+class SessionMemory(BaseModel):
+    summary: str = Field("", description="Rolling summary of every turn before `turns`")
+    turns: List[Turn] = Field(default_factory=list, description="Recent turns, oldest first")
+    next_seq: int = 0
+
+
+def clip(text: str, tokens: int) -> str:
+    limit = tokens * 4
+    return text if len(text) <= limit else text[:max(limit - 3, 0)].rstrip() + "..."
+
+
+def render_turn(turn: Turn) -> str:
+    return f"User: {turn.human}\nAssistant: {turn.llm}"
+
+
+def summarize_turns(summary: str, turns: List[Turn], max_words: int) -> str:
+    transcript = "\n".join(render_turn(t) for t in turns)
+    messages = [
+        SystemMessage(content=SUMMARIZE_CONVERSATION_INSTRUCTION.format(max_words=max_words)),
+        HumanMessage(content=f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{transcript}"),
+    ]
+    return chat_model("llama-3.1-8b-instant").invoke(messages).content.strip()
+
+
+class ConversationMemory:
+    """
+    token_budget bounds the rendered history (summary + recent turns). Once a session holds more than
+    window_turns turns, or its turns exceed two thirds of the budget, all but the newest half of the
+    window are summarized in the background. Until that finishes the oldest turns are simply left out.
+    """
+
+    def __init__(self, backend, token_budget: int = 800, window_turns: int = 6, idle_ttl: float = 7 * 24 * 3600,
+                 summarizer: Optional[Callable[[str, List[Turn], int], str]] = None):
+        self.backend = backend
+        self.token_budget = token_budget
+        self.window_turns = window_turns
+        self.idle_ttl = idle_ttl
+        self.summarizer = summarizer or summarize_turns
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def load(self, session: str) -> SessionMemory:
+        raw = self.backend.get("memory", session, "state")
+        return SessionMemory(**raw) if isinstance(raw, dict) else SessionMemory()
+
+    def _save(self, session: str, memory: SessionMemory):
+        self.backend.set("memory", session, "state", memory.model_dump(), ttl=self.idle_ttl)
+
+    def render(self, session: str) -> str:
+        memory = self.load(session)
+        budget = self.token_budget
+        summary = ""
+        if memory.summary:
+            summary = f"Summary of the earlier conversation: {clip(memory.summary, budget // 3)}"
+            budget -= estimate_tokens(summary)
+        recent = []
+        for turn in reversed(memory.turns):
+            # One long answer must not push every other turn out of the window
+            text = clip(render_turn(turn), self.token_budget // 3)
+            cost = estimate_tokens(text)
+            if cost > budget:
+                break
+            recent.append(text)
+            budget -= cost
+        history = "\n".join(([summary] if summary else []) + recent[::-1])
+        MEMORY_PROMPT_TOKENS.observe(estimate_tokens(history))
+        return history
+
+    def add(self, session: str, human: str, llm: str):
+        with self._lock:
+            memory = self.load(session)
+            memory.turns.append(Turn(seq=memory.next_seq, human=human, llm=llm))
+            memory.next_seq += 1
+            self._save(session, memory)
+            due = session not in self._pending and self._due(memory)
+            if due:
+                self._pending.add(session)
+        if due:
+            # A fresh context, so the summary call is not traced or streamed as part of this request
+            llm_executor().submit(self._summarize, session)
+
+    def _due(self, memory: SessionMemory) -> bool:
+        if len(memory.turns) < 2:
+            return False
+        tokens = sum(estimate_tokens(render_turn(t)) for t in memory.turns)
+        return len(memory.turns) > self.window_turns or tokens > self.token_budget * 2 // 3
+
+    def _summarize(self, session: str):
+        try:
+            memory = self.load(session)
+            keep = max(self.window_turns // 2, 1)
+            fold = memory.turns[:-keep]
+            if not fold:
+                return
+            max_words = max(self.token_budget // 4, 20)
+            summary = clip(self.summarizer(memory.summary, fold, max_words), self.token_budget // 3)
+            with self._lock:
+                current = self.load(session)
+                if current.summary != memory.summary:
+                    # Another worker folded these turns first
+                    MEMORY_SUMMARIES.inc(outcome="superseded")
+                    return
+                current.summary = summary
+                current.turns = [t for t in current.turns if t.seq > fold[-1].seq]
+                self._save(session, current)
+            MEMORY_SUMMARIES.inc(outcome="ok")
+        except Exception as e:
+            MEMORY_SUMMARIES.inc(outcome="error")
+            log_event("memory_summary_failed", session=session, error=str(e))
+        finally:
+            with self._lock:
+                self._pending.discard(session)
+
+
+_memory: Optional[ConversationMemory] = None
+_memory_lock = threading.Lock()
+
+
+def get_memory() -> ConversationMemory:
+    """
+    Process-wide memory configured by CONVERSATION_MEMORY=memory|sqlite. Like the query cache it
+    defaults to sqlite with several workers, so a session can move between them.
+    """
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                kind = os.getenv("CONVERSATION_MEMORY", "sqlite" if get_settings().workers > 1 else "memory").lower()
+                max_sessions = int(os.getenv("MEMORY_MAX_SESSIONS", "100000"))
+                if kind == "sqlite":
+                    backend = SqliteBackend(os.getenv("MEMORY_PATH", ".cache/conversations.sqlite"), max_sessions)
+                else:
+                    backend = MemoryBackend(max_sessions)
+                _memory = ConversationMemory(
+                    backend,
+                    token_budget=int(os.getenv("MEMORY_TOKEN_BUDGET", "800")),
+                    window_turns=int(os.getenv("MEMORY_WINDOW_TURNS", "6")),
+                    idle_ttl=float(os.getenv("MEMORY_IDLE_TTL", str(7 * 24 * 3600))),
+                )
+    return _memory
@@ -0,0 +1,184 @@
+# db_registry.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_community.utilities import SQLDatabase
+
+from nodes import load_db, load_azure_db, load_sqlite_db, mysql_uri, azure_uri
+from schema_catalog import SchemaCatalog
+from replicas import Endpoint, ReplicaSet, breaker_from_env
+from metrics import DB_CONNECT_SECONDS
+from settings import get_settings
+
+
+def db_backend() -> str:
+    # DB_BACKEND=azure|mysql|sqlite, else the older USE_AZURE flag
+    return get_settings().db_backend
+
+
+def replica_hosts(backend: str) -> List[str]:
+    # Comma-separated: MySQL hosts (host[:port]), Azure SQL servers, or directories holding <tenant>.db copies
+    name = {"azure": "AZURE_SQL_REPLICAS", "sqlite": "SQLITE_REPLICA_DIRS"}.get(backend, "MYSQL_REPLICA_HOSTS")
+    return [h.strip() for h in os.getenv(name, "").split(",") if h.strip()]
+
+
+def engine_args_from_env() -> dict:
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        # Health check every connection on checkout so stale sockets never reach a node
+        "pool_pre_ping": True,
+    }
+
+
+class DBRegistry:
+    """Process-wide pool of SQLDatabase instances and schema catalogs, one pooled engine per tenant."""
+
+    def __init__(self, engine_args: Optional[dict] = None, idle_ttl: float = 900, max_tenants: int = 64):
+        self.engine_args = engine_args if engine_args is not None else engine_args_from_env()
+        self.idle_ttl = idle_ttl
+        self.max_tenants = max_tenants
+        self._entries: "OrderedDict[Tuple[str, str], list]" = OrderedDict()  # key -> [db, catalog, last_used, replicas]
+        self._lock = threading.Lock()
+        self._key_locks: dict = {}
+
+    def key(self, client_id: str) -> Tuple[str, str]:
+        backend = db_backend()
+        if backend == "azure":
+            # Azure connects to a single configured database regardless of clientId
+            return ("azure", os.getenv("AZURE_SQL_DATABASE", ""))
+        return (backend, client_id)
+
+    def get(self, client_id: str) -> SQLDatabase:
+        return self._entry(client_id)[0]
+
+    def catalog(self, client_id: str) -> SchemaCatalog:
+        return self._entry(client_id)[1]
+
+    def replicas(self, client_id: str) -> Optional[ReplicaSet]:
+        return self._entry(client_id)[3]
+
+    def _entry(self, client_id: str) -> list:
+        key = self.key(client_id)
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2] = time.monotonic()
+                self._entries.move_to_end(key)
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Build outside the registry lock so one slow tenant doesn't block the others
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return entry
+            db = self._connect(key)
+            catalog = SchemaCatalog(
+                f"{key[0]}:{key[1]}", db,
+                refresh_interval=float(os.getenv("CATALOG_REFRESH_SECONDS", "300")),
+            )
+            entry = [db, catalog, time.monotonic(), self._replicas(key, db)]
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_tenants:
+                    old_key, old_entry = self._entries.popitem(last=False)
+                    self._dispose(old_key, old_entry)
+            return entry
+
+    def _connect(self, key: Tuple[str, str]) -> SQLDatabase:
+        with DB_CONNECT_SECONDS.time(tenant=f"{key[0]}:{key[1]}"):
+            return self._load(key)
+
+    def _load(self, key: Tuple[str, str]) -> SQLDatabase:
+        backend, name = key
+        if backend == "azure":
+            print("→ Loading Azure SQL Database…")
+            return load_azure_db(engine_args=self.engine_args)
+        if backend == "sqlite":
+            path = os.path.join(os.getenv("SQLITE_DIR", "."), f"{name}.db")
+            return load_sqlite_db(path, engine_args=self.engine_args)
+        print("→ Loading local MySQL Database…")
+        return load_db(
+            name=os.getenv("MYSQL_USER"),
+            pwd=os.getenv("MYSQL_PASSWORD"),
+            ht=os.getenv("MYSQL_HOST"),
+            dbname=name,
+            engine_args=self.engine_args,
+        )
+
+    def _replicas(self, key: Tuple[str, str], db: SQLDatabase) -> Optional[ReplicaSet]:
+        backend, name = key
+        hosts = replica_hosts(backend)
+        if not hosts:
+            return None
+        from sqlalchemy import create_engine
+
+        endpoints = []
+        for host in hosts:
+            if backend == "azure":
+                uri = azure_uri(host, os.getenv("AZURE_SQL_DATABASE"), read_only=True)
+            elif backend == "sqlite":
+                uri = f"sqlite:///{os.path.join(host, f'{name}.db')}"
+            else:
+                uri = mysql_uri(os.getenv("MYSQL_USER"), os.getenv("MYSQL_PASSWORD"), host, name)
+            # Engines connect lazily: an unreachable replica only trips its breaker when used
+            endpoints.append(Endpoint(host, create_engine(uri, **self.engine_args), breaker_from_env()))
+        print(f"→ {len(endpoints)} read replica(s) for {backend}:{name}")
+        return ReplicaSet(
+            f"{backend}:{name}", endpoints, primary=db._engine,
+            fallback_primary=os.getenv("REPLICA_FALLBACK_PRIMARY", "true").lower() in ("1", "true", "yes"),
+        )
+
+    def _evict_idle(self):
+        if not self.idle_ttl:
+            return
+        now = time.monotonic()
+        for key in [k for k, entry in self._entries.items() if now - entry[2] > self.idle_ttl]:
+            self._dispose(key, self._entries.pop(key))
+
+    def _dispose(self, key: Tuple[str, str], entry: list):
+        print(f"Closing idle DB pool for {key[0]}:{key[1]}")
+        self._key_locks.pop(key, None)
+        db, _, _, replicas = entry
+        db._engine.dispose()
+        if replicas is not None:
+            replicas.close()
+
+    def close(self):
+        with self._lock:
+            while self._entries:
+                key, entry = self._entries.popitem(last=False)
+                self._dispose(key, entry)
+
+
+_registry: Optional[DBRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DBRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DBRegistry(
+                    idle_ttl=float(os.getenv("DB_IDLE_TTL", "900")),
+                    max_tenants=int(os.getenv("DB_MAX_TENANTS", "64")),
+                )
+    return _registry
+
+
+def close_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+            _registry = None
@@ -0,0 +1,144 @@
+# fake_groq_server.py
+"""
+Local OpenAI-compatible stand-in for the Groq API, answering with FakeChatModel.
+
+    python fake_groq_server.py --port 8282 --latency 0.05 --rate-limit-every 20
+    GROQ_API_BASE=http://127.0.0.1:8282 python benchmark.py --llm server
+
+GET /stats returns upstream request counts per model, which shows how many calls
+the client pool coalesced away.
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from fake_llm import FakeChatModel, _tokens
+
+ROLES = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, rate_limit_every: int = 0):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="fake-groq", daemon=True)
+        thread.start()
+        return thread
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: FakeGroqServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.server.lock:
+                self._json(200, {"requests": dict(self.server.requests), "total": sum(self.server.requests.values())})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = request.get("model", "fake")
+        with self.server.lock:
+            self.server.requests[model] += 1
+            count = sum(self.server.requests.values())
+        every = self.server.rate_limit_every
+        if every and count % every == 0:
+            return self._json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                              {"Retry-After": "0.1"})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        messages = [ROLES.get(m.get("role"), HumanMessage)(content=m.get("content") or "")
+                    for m in request.get("messages", [])]
+        fake = FakeChatModel(model=model)
+        message = {"role": "assistant", "content": ""}
+        if request.get("tools"):
+            name = request["tools"][0]["function"]["name"]
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(fake.generate_query(messages))},
+            }]
+            finish, completion = "tool_calls", message["tool_calls"][0]["function"]["arguments"]
+        else:
+            message["content"] = completion = fake.respond(messages)
+            finish = "stop"
+        prompt_tokens = sum(_tokens(str(m.content)) for m in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _tokens(completion),
+                 "total_tokens": prompt_tokens + _tokens(completion)}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": model}
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            words = message["content"].split(" ") if not request.get("tools") else []
+            chunks = [{"role": "assistant", "content": ""}]
+            chunks += [{"content": w if i == 0 else " " + w} for i, w in enumerate(words)]
+            if request.get("tools"):
+                chunks.append({"tool_calls": [dict(message["tool_calls"][0], index=0)]})
+            for delta in chunks:
+                payload = dict(base, object="chat.completion.chunk",
+                               choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            done = dict(base, object="chat.completion.chunk", x_groq={"usage": usage},
+                        choices=[{"index": 0, "delta": {}, "finish_reason": finish}])
+            self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+            return
+        self._json(200, dict(base, object="chat.completion", usage=usage,
+                             choices=[{"index": 0, "message": message, "finish_reason": finish}]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI-compatible Groq endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8282)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args(argv)
+    server = FakeGroqServer((args.host, args.port), latency=args.latency, rate_limit_every=args.rate_limit_every)
+    print(f"Fake Groq API on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
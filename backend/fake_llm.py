@@ -0,0 +1,109 @@
+# fake_llm.py
+import re
+import ast
+import json
+import time
+import asyncio
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+
+def _text(messages: List[BaseMessage], kind) -> str:
+    return "\n".join(str(m.content) for m in messages if isinstance(m, kind))
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for ChatGroq that recognises this repo's prompts."""
+
+    model: str = "fake"
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def respond(self, messages: List[BaseMessage]) -> str:
+        system = _text(messages, SystemMessage)
+        question = _text(messages, HumanMessage).lower()
+        if "numbered user question" in system:
+            match = re.search(r"Available tables:\s*(\[.*?\])", system, re.S)
+            tables = ast.literal_eval(match.group(1)) if match else []
+            picked = {}
+            for line in question.splitlines():
+                number, _, text = line.partition(". ")
+                words = set(re.findall(r"[a-z]+", text))
+                picked[number] = [t for t in tables if set(t.lower().split("_")) & words][:2] or tables[:1]
+            return json.dumps(picked)
+        if "identify relevant tables" in system:
+            match = re.search(r"Available tables:\s*(\[.*?\])", system, re.S)
+            tables = ast.literal_eval(match.group(1)) if match else []
+            words = set(re.findall(r"[a-z]+", question))
+            picked = [t for t in tables if set(t.lower().split("_")) & words] or tables[:1]
+            return str(picked[:2])
+        if "assistant's memory" in system:
+            return " ".join(_text(messages, HumanMessage).split()[:60])
+        if "Result sample:" in system:
+            sample = system.split("Result sample:", 1)[1].strip().splitlines()
+            return f"Here is what I found: {' '.join(sample[:3])}"
+        return "I dont have enough information"
+
+    def generate_query(self, messages: List[BaseMessage]) -> dict:
+        checked = _text(messages, AIMessage)
+        if checked.startswith("SQLite query:"):
+            statement, _, reasoning = checked[len("SQLite query:"):].partition("\nReasoning:")
+            return {"statement": statement.strip(), "reasoning": reasoning.strip()}
+        system = _text(messages, SystemMessage)
+        question = _text(messages, HumanMessage).lower()
+        # Full DDL or the compact `table(col type, ...)` notation
+        tables = re.findall(r"CREATE TABLE\s+[`\"\[]?(\w+)|^[`\"\[]?(\w+)[`\"\]]?\(", system, re.M)
+        tables = [a or b for a, b in tables]
+        table = tables[0] if tables else "employee_information"
+        if re.search(r"\b(how many|count|number of)\b", question):
+            return {"statement": f"SELECT COUNT(*) FROM {table}", "reasoning": f"Count the rows of {table}."}
+        return {"statement": f"SELECT * FROM {table} LIMIT 10", "reasoning": f"Show a few rows of {table}."}
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        content = self.respond(messages)
+        prompt_tokens = sum(_tokens(str(m.content)) for m in messages)
+        return AIMessage(
+            content=content,
+            response_metadata={"model_name": self.model},
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": _tokens(content),
+                "total_tokens": prompt_tokens + _tokens(content),
+            },
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(messages):
+            if self.latency:
+                time.sleep(self.latency)
+            return schema(**self.generate_query(messages))
+
+        async def ainvoke(messages):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return schema(**self.generate_query(messages))
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"{self.model}-structured")
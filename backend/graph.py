@@ -1,35 +1,82 @@
-from nodes import (
-    select_relevant_schemas,
-    generate_query,
-    execute_query,
-    generate_answer,
-    general_chat,
-    check_question,
-    router,
-)
-from states import OverallState
-from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-
-def build_graph():
-    builder = StateGraph(state_schema=OverallState)
-
-    builder.add_node(select_relevant_schemas)
-    builder.add_node(generate_query)
-    builder.add_node(execute_query)
-    builder.add_node(generate_answer)
-    builder.add_node(general_chat)
-
-    builder.set_entry_point("select_relevant_schemas")
-    builder.add_conditional_edges("select_relevant_schemas", check_question)
-    builder.add_edge("generate_query", "execute_query")
-    builder.add_conditional_edges("execute_query", router)
-    builder.add_edge("generate_answer", END)
-    builder.add_edge("general_chat", END)
-
-    memory = MemorySaver()
-    graph = builder.compile(checkpointer=memory)
-
-    return graph
-
-graph = build_graph()
+from nodes import (
+    select_relevant_schemas,
+    generate_query,
+    execute_query,
+    generate_answer,
+    general_chat,
+    aselect_relevant_schemas,
+    agenerate_query,
+    aexecute_query,
+    agenerate_answer,
+    ageneral_chat,
+    speculative_select,
+    aspeculative_select,
+    check_question,
+    triage,
+    after_speculative_select,
+    speculative,
+    router,
+)
+from states import OverallState
+from langgraph.graph import StateGraph, START, END
+from checkpointer import make_checkpointer
+from langchain_core.runnables import RunnableLambda
+from concurrency import tenant_of
+from metrics import NODE_SECONDS
+import profiling
+
+def node(func, afunc, name=None):
+    # Same node for graph.invoke and graph.ainvoke; ainvoke uses the non-blocking variant
+    name = name or func.__name__
+
+    def timed(state, config):
+        with NODE_SECONDS.time(node=name, tenant=tenant_of(config)), profiling.node(name, thread=True):
+            return func(state, config)
+
+    async def atimed(state, config):
+        with NODE_SECONDS.time(node=name, tenant=tenant_of(config)), profiling.node(name, thread=False):
+            return await afunc(state, config)
+
+    return RunnableLambda(timed, afunc=atimed, name=name)
+
+def build_graph(checkpointer=None, persistent=True):
+    # persistent=False compiles without conversation state, for one-off runs such as batches
+    builder = StateGraph(state_schema=OverallState)
+
+    # SPECULATIVE_GRAPH=1: route on is_related before table selection and draft the general-chat
+    # answer while the LLM picks tables, keeping whichever branch routing settles on
+    spec = speculative()
+    if spec:
+        builder.add_node("select_relevant_schemas", node(speculative_select, aspeculative_select, name="select_relevant_schemas"))
+    else:
+        builder.add_node("select_relevant_schemas", node(select_relevant_schemas, aselect_relevant_schemas))
+    builder.add_node("generate_query", node(generate_query, agenerate_query))
+    builder.add_node("execute_query", node(execute_query, aexecute_query))
+    builder.add_node("generate_answer", node(generate_answer, agenerate_answer))
+    builder.add_node("general_chat", node(general_chat, ageneral_chat))
+
+    if spec:
+        builder.add_conditional_edges(START, triage)
+        builder.add_conditional_edges("select_relevant_schemas", after_speculative_select)
+    else:
+        builder.set_entry_point("select_relevant_schemas")
+        builder.add_conditional_edges("select_relevant_schemas", check_question)
+    builder.add_edge("generate_query", "execute_query")
+    builder.add_conditional_edges("execute_query", router)
+    builder.add_edge("generate_answer", END)
+    builder.add_edge("general_chat", END)
+
+    if checkpointer is None and persistent:
+        checkpointer = make_checkpointer()
+    graph = builder.compile(checkpointer=checkpointer)
+
+    return graph
+
+_graph = None
+
+def get_graph():
+    # Built on first use (or in the app lifespan), never at import, so pre-fork workers get their own
+    global _graph
+    if _graph is None:
+        _graph = build_graph()
+    return _graph
@@ -0,0 +1,96 @@
+# import_benchmark.py
+"""
+Worker boot time: `import app` plus the FastAPI lifespan startup, each in a fresh interpreter.
+
+    python import_benchmark.py --runs 5
+    python import_benchmark.py --runs 5 --preload        # heavy modules imported with the app
+    python import_benchmark.py --target 1.5              # exit 1 if the median boot is slower
+
+Uses SQLite, an in-memory checkpointer and no tracing, so nothing touches the network.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BOOT = """
+import json, time, asyncio
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+
+async def boot():
+    async with app.app.router.lifespan_context(app.app):
+        return time.perf_counter()
+
+t2 = asyncio.run(boot())
+print("BOOT " + json.dumps({"import_s": t1 - t0, "startup_s": t2 - t1, "boot_s": t2 - t0}))
+"""
+
+# "import time: self | cumulative | <two spaces per nesting level>module"
+IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s(\s*)(\S+)")
+
+
+def run_once(preload: bool) -> tuple:
+    env = dict(os.environ)
+    env.update({
+        "PRELOAD_MODULES": "1" if preload else "0",
+        "DB_BACKEND": "sqlite",
+        "CHECKPOINTER": "memory",
+        "LANGCHAIN_TRACING_V2": "false",
+        "GROQ_API_KEY": env.get("GROQ_API_KEY", "benchmark"),
+    })
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", BOOT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          env=env, capture_output=True, text=True)
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("BOOT ")), None)
+    if proc.returncode or line is None:
+        raise RuntimeError(f"boot failed:\n{proc.stderr[-2000:]}")
+    modules = {}
+    for self_us, cumulative_us, indent, name in IMPORTTIME.findall(proc.stderr):
+        # The app itself and what it imports directly
+        if len(indent) <= 2:
+            modules[name] = int(cumulative_us) / 1e6
+    return json.loads(line[5:]), modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure worker import and startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--preload", action="store_true", help="import the graph and its dependencies with the app")
+    parser.add_argument("--top", type=int, default=12, help="show the slowest top-level imports")
+    parser.add_argument("--target", type=float, help="fail if the median boot time exceeds this many seconds")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    runs, modules = [], {}
+    for _ in range(args.runs):
+        timing, mods = run_once(args.preload)
+        runs.append(timing)
+        for name, seconds in mods.items():
+            modules.setdefault(name, []).append(seconds)
+
+    report = {key: {"median": statistics.median(r[key] for r in runs), "min": min(r[key] for r in runs)}
+              for key in ("import_s", "startup_s", "boot_s")}
+    report["preload"] = args.preload
+    report["slowest_imports_s"] = dict(sorted(((n, statistics.median(v)) for n, v in modules.items()),
+                                              key=lambda item: -item[1])[:args.top])
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.runs} run(s), preload={'on' if args.preload else 'off'}")
+        for key in ("import_s", "startup_s", "boot_s"):
+            print(f"{key[:-2]:<8} median {report[key]['median'] * 1000:8.1f} ms   min {report[key]['min'] * 1000:8.1f} ms")
+        print("slowest top-level imports (cumulative):")
+        for name, seconds in report["slowest_imports_s"].items():
+            print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+    if args.target is not None and report["boot_s"]["median"] > args.target:
+        print(f"❌ median boot {report['boot_s']['median']:.2f}s exceeds target {args.target:.2f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+# llm.py
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable
+
+from metrics import Counter, Gauge, register, log_event
+
+LLM_COALESCED = register(Counter("sqlagent_llm_coalesced_total", "Calls served by an identical in-flight call", ("model",)))
+LLM_RETRIES = register(Counter("sqlagent_llm_retries_total", "Retried LLM calls after throttling or transient errors", ("model",)))
+LLM_IN_FLIGHT = register(Gauge("sqlagent_llm_in_flight", "Upstream LLM calls currently running", ("model",)))
+
+RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+                    "ServiceUnavailableError", "ConnectError", "ReadTimeout", "RemoteProtocolError"}
+
+_factory: Optional[Callable[[str], object]] = None
+
+
+def _env_int(name: str, model: str, default: int) -> int:
+    # Per-model override, e.g. LLM_CONCURRENCY_LLAMA_3_3_70B_VERSATILE=8
+    suffix = "".join(c if c.isalnum() else "_" for c in model).upper()
+    return int(os.getenv(f"{name}_{suffix}", os.getenv(name, str(default))))
+
+
+def _cache_key(model: str, schema: Optional[type], inputs: Any) -> str:
+    def plain(value):
+        if isinstance(value, PromptValue):
+            value = value.to_messages()
+        if isinstance(value, BaseMessage):
+            return [value.type, value.content]
+        if isinstance(value, (list, tuple)):
+            return [plain(v) for v in value]
+        if isinstance(value, dict):
+            return {k: plain(v) for k, v in sorted(value.items())}
+        return value
+
+    payload = json.dumps([model, getattr(schema, "__name__", None), plain(inputs)], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status in (429, 500, 502, 503, 504) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class ModelLimiter:
+    """Per-model concurrency cap and GCRA rate limit (requests per minute with a small burst)."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.concurrency = _env_int("LLM_MODEL_CONCURRENCY", model, 32)
+        rpm = _env_int("LLM_RPM", model, 0)
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.burst = _env_int("LLM_BURST", model, 5)
+        self.max_retries = _env_int("LLM_MAX_RETRIES", model, 3)
+        self._sync_sem = threading.BoundedSemaphore(self.concurrency)
+        self._async_sem: Optional[asyncio.Semaphore] = None
+        self._tat = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claim the next request slot; returns how long to wait before sending."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            self._tat = tat + self.interval
+            return max(0.0, tat - now - self.burst * self.interval)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        return _retry_after(error) or min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        with self._sync_sem:
+            for attempt in range(self.max_retries + 1):
+                delay = self.reserve()
+                if delay:
+                    time.sleep(delay)
+                LLM_IN_FLIGHT.inc(1, model=self.model)
+                try:
+                    return fn()
+                except Exception as e:
+                    if attempt == self.max_retries or not _retryable(e):
+                        raise
+                    LLM_RETRIES.inc(model=self.model)
+                    log_event("llm_retry", model=self.model, attempt=attempt + 1, error=type(e).__name__)
+                    time.sleep(self.backoff(attempt, e))
+                finally:
+                    LLM_IN_FLIGHT.inc(-1, model=self.model)
+
+    async def acall(self, fn: Callable[[], Any]) -> Any:
+        if self._async_sem is None:
+            self._async_sem = asyncio.Semaphore(self.concurrency)
+        async with self._async_sem:
+            for attempt in range(self.max_retries + 1):
+                delay = self.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                LLM_IN_FLIGHT.inc(1, model=self.model)
+                try:
+                    return await fn()
+                except Exception as e:
+                    if attempt == self.max_retries or not _retryable(e):
+                        raise
+                    LLM_RETRIES.inc(model=self.model)
+                    log_event("llm_retry", model=self.model, attempt=attempt + 1, error=type(e).__name__)
+                    await asyncio.sleep(self.backoff(attempt, e))
+                finally:
+                    LLM_IN_FLIGHT.inc(-1, model=self.model)
+
+
+class ManagedModel(Runnable):
+    """A shared chat model (or structured-output runnable) with request coalescing and per-model limits."""
+
+    def __init__(self, registry: "ModelRegistry", model: str, runnable: Runnable, schema: Optional[type] = None):
+        self.registry = registry
+        self.model = model
+        self.runnable = runnable
+        self.schema = schema
+        self.limiter = registry.limiter(model)
+        self._sync_inflight: Dict[str, Future] = {}
+        self._async_inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def InputType(self):
+        return self.runnable.InputType
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.registry.get(self.model, schema)
+
+    def invoke(self, input, config=None, **kwargs):
+        key = _cache_key(self.model, self.schema, input)
+        with self._lock:
+            waiting = self._sync_inflight.get(key)
+            if waiting is None:
+                future = self._sync_inflight[key] = Future()
+        if waiting is not None:
+            LLM_COALESCED.inc(model=self.model)
+            return waiting.result()
+        try:
+            result = self.limiter.call(lambda: self.runnable.invoke(input, config, **kwargs))
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._sync_inflight.pop(key, None)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        key = _cache_key(self.model, self.schema, input)
+        waiting = self._async_inflight.get(key)
+        if waiting is not None and waiting.get_loop() is asyncio.get_running_loop():
+            LLM_COALESCED.inc(model=self.model)
+            try:
+                # Shield so a cancelled follower doesn't cancel the leader's upstream call
+                return await asyncio.shield(waiting)
+            except asyncio.CancelledError:
+                # The leader was cancelled but this caller wasn't: make the call ourselves
+                if not waiting.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+        try:
+            result = await self.limiter.acall(lambda: self.runnable.ainvoke(input, config, **kwargs))
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark retrieved so an unobserved failure doesn't warn at shutdown
+                future.exception()
+            raise
+        finally:
+            if self._async_inflight.get(key) is future:
+                del self._async_inflight[key]
+
+
+class ModelRegistry:
+    """Builds each chat model and structured-output runnable once per process and shares HTTP connections."""
+
+    def __init__(self, factory: Optional[Callable[[str], object]] = None):
+        self.factory = factory or self._groq
+        self._models: Dict[tuple, ManagedModel] = {}
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._http_async_client = None
+
+    def _groq(self, model: str):
+        import httpx
+        from langchain_groq import ChatGroq
+
+        if self._http_client is None:
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("LLM_HTTP_KEEPALIVE", "20")),
+            )
+            timeout = httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT", "60")), connect=10.0)
+            self._http_client = httpx.Client(limits=limits, timeout=timeout)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        # Retries are handled by ModelLimiter so backoff and rate limits are shared across callers
+        return ChatGroq(model=model, max_retries=0, http_client=self._http_client,
+                        http_async_client=self._http_async_client)
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = ModelLimiter(model)
+            return self._limiters[model]
+
+    def get(self, model: str, schema: Optional[type] = None) -> ManagedModel:
+        key = (model, schema)
+        managed = self._models.get(key)
+        if managed is None:
+            base = self.factory(model)
+            runnable = base.with_structured_output(schema) if schema is not None else base
+            managed = ManagedModel(self, model, runnable, schema)
+            with self._lock:
+                managed = self._models.setdefault(key, managed)
+        return managed
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        if self._http_async_client is not None:
+            client, self._http_async_client = self._http_async_client, None
+            try:
+                asyncio.get_running_loop().create_task(client.aclose())
+            except RuntimeError:
+                asyncio.run(client.aclose())
+        self._models.clear()
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(_factory)
+    return _registry
+
+
+def set_chat_model_factory(factory: Optional[Callable[[str], object]]):
+    """Swap the chat model used by every node (e.g. a fake model for benchmarks). None restores ChatGroq."""
+    global _factory, _registry
+    _factory = factory
+    with _registry_lock:
+        _registry = None
+
+
+def chat_model(model: str):
+    return get_model_registry().get(model)
+
+
+def close_models():
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+            _registry = None
@@ -0,0 +1,212 @@
+# metrics.py
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.label_names = name, doc, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        return [line.replace(" counter", " gauge", 1) if line.startswith("# TYPE") else line
+                for line in super().render()]
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.label_names = name, doc, labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = _labels(self.label_names, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+NODE_SECONDS = Histogram("sqlagent_node_seconds", "Wall time per graph node", ("node", "tenant"))
+LLM_SECONDS = Histogram("sqlagent_llm_seconds", "LLM call latency per model", ("model",))
+LLM_TOKENS = Counter("sqlagent_llm_tokens_total", "LLM tokens per model and direction", ("model", "kind"))
+LLM_ERRORS = Counter("sqlagent_llm_errors_total", "Failed LLM calls per model", ("model",))
+DB_CONNECT_SECONDS = Histogram("sqlagent_db_connect_seconds", "Engine creation and metadata reflection per tenant", ("tenant",))
+DB_REFLECT_SECONDS = Histogram("sqlagent_db_reflect_seconds", "Schema catalog reflection per tenant", ("tenant",))
+DB_QUERY_SECONDS = Histogram("sqlagent_db_query_seconds", "Generated query execution per tenant", ("tenant", "outcome"))
+REQUEST_SECONDS = Histogram("sqlagent_request_seconds", "End-to-end request latency", ("endpoint",))
+CACHE_HIT_RATE = Gauge("sqlagent_cache_hit_ratio", "Query cache hit ratio per tier", ("tier",))
+CACHE_EVENTS = Gauge("sqlagent_cache_events", "Query cache hits and misses since start", ("event",))
+CHECKER_SKIPS = Gauge("sqlagent_sql_checker", "Generated queries that skipped or ran the LLM checker", ("outcome",))
+
+_metrics = [NODE_SECONDS, LLM_SECONDS, LLM_TOKENS, LLM_ERRORS, DB_CONNECT_SECONDS, DB_REFLECT_SECONDS,
+            DB_QUERY_SECONDS, REQUEST_SECONDS, CACHE_HIT_RATE, CACHE_EVENTS, CHECKER_SKIPS]
+_collectors: List[Callable[[], None]] = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(fn: Callable[[], None]):
+    """Called before every render to copy counters kept elsewhere into gauges."""
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            log_event("metrics_collector_failed", error=str(e))
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# -- structured logs ----------------------------------------------------------
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {"ts": round(record.created, 3), "level": record.levelname, "event": record.getMessage()}
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, default=str)
+
+
+logger = logging.getLogger("sqlagent")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    logger.log(level, event, extra={"fields": fields})
+
+
+# -- LLM callbacks ------------------------------------------------------------
+
+def _model_name(serialized: Optional[dict], metadata: Optional[dict], kwargs: dict) -> str:
+    metadata = metadata or {}
+    params = kwargs.get("invocation_params") or {}
+    return (metadata.get("ls_model_name") or params.get("model") or params.get("model_name")
+            or (serialized or {}).get("kwargs", {}).get("model") or "unknown")
+
+
+def _llm_handler():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMMetricsHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._runs: Dict[object, tuple] = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            self._runs[run_id] = (_model_name(serialized, metadata, kwargs), time.perf_counter())
+
+        def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+            self._runs[run_id] = (_model_name(serialized, metadata, kwargs), time.perf_counter())
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            model, start = self._runs.pop(run_id, ("unknown", None))
+            if start is not None:
+                LLM_SECONDS.observe(time.perf_counter() - start, model=model)
+            for generations in response.generations:
+                for gen in generations:
+                    usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                    if usage:
+                        LLM_TOKENS.inc(usage.get("input_tokens", 0), model=model, kind="input")
+                        LLM_TOKENS.inc(usage.get("output_tokens", 0), model=model, kind="output")
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            model, _ = self._runs.pop(run_id, ("unknown", None))
+            LLM_ERRORS.inc(model=model)
+
+    return LLMMetricsHandler()
+
+
+_llm_metrics_var: Optional[ContextVar] = None
+
+
+def install_llm_metrics():
+    """Attach the LLM metrics handler to every LangChain run in this process."""
+    global _llm_metrics_var
+    if _llm_metrics_var is not None:
+        return
+    from langchain_core.tracers.context import register_configure_hook
+
+    _llm_metrics_var = ContextVar("sqlagent_llm_metrics", default=_llm_handler())
+    register_configure_hook(_llm_metrics_var, inheritable=True)
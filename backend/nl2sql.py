@@ -0,0 +1,403 @@
+# nl2sql.py
+"""
+Local compiler for the question shapes we see most, so they skip SQL generation by the LLM:
+
+    how many X [in|where|with Y]          SELECT COUNT(*) FROM x [JOIN ...] [WHERE ...]
+    list X [in|where|with Y]              SELECT <name columns> FROM x [...]
+    count X by|per Y                      SELECT y, COUNT(*) FROM x [JOIN ...] GROUP BY y
+    top|bottom N X by Y                   SELECT <name columns>, y FROM x ORDER BY y DESC, limited to N
+
+Tables, columns and filter values are resolved against the schema catalog: identifier words (singular
+and plural), NL2SQL_SYNONYMS, sampled rows and, for filters, a cached DISTINCT lookup of text columns.
+Every word of the question must be accounted for; leftovers lower the confidence and below
+NL2SQL_MIN_CONFIDENCE the question goes to generate_query as before. Negations (not, except, without,
+...) always go there: a filter the compiler can't invert must never be dropped.
+"""
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from answer_render import singular
+from metrics import Counter, register, log_event
+
+NL2SQL = register(Counter("sqlagent_nl2sql_total", "Questions seen by the local SQL compiler", ("shape", "outcome")))
+
+NUMERIC = re.compile(r"INT|DEC|NUM|FLOAT|DOUBLE|REAL|MONEY", re.I)
+TEXTUAL = re.compile(r"CHAR|TEXT|STRING|CLOB", re.I)
+FILLER = {"the", "a", "an", "all", "of", "there", "are", "is", "do", "does", "we", "have", "exist", "me", "please",
+          "in", "with", "from", "where", "who", "that", "whose", "which", "for", "on", "at", "total", "records",
+          "and", "their", "its", "work", "works", "working", "belong", "belongs", "to", "currently", "show", "list"}
+COMPARISONS = {"greater than": ">", "more than": ">", "above": ">", "over": ">", "at least": ">=",
+               "less than": "<", "fewer than": "<", "below": "<", "under": "<", "at most": "<=",
+               "equal to": "=", "equals": "=", ">=": ">=", "<=": "<=", ">": ">", "<": "<", "=": "="}
+
+SHAPES = [
+    ("count_by", re.compile(r"^(?:how many|count(?: the)?|(?:what is )?the number of|number of) (?P<x>.+?)"
+                            r"(?: are there| do we have)? (?:by|per|in each|for each|grouped by) (?P<y>.+)$")),
+    ("top", re.compile(r"^(?:show |list |give me |what are |who are |which are )?(?:the )?(?P<dir>top|bottom) "
+                       r"(?P<n>\d+) (?P<x>.+?) (?:by|with the (?:highest|most)) (?P<y>.+)$")),
+    ("count", re.compile(r"^(?:how many|count(?: the)?|(?:what is )?the number of|number of) (?P<x>.+?)"
+                         r"(?: (?:are there|do we have|are|is|exist|work|works|working)\b(?P<rest>.*))?$")),
+    ("list", re.compile(r"^(?:list|show(?: me)?|give me|display|what are|who are|which are|name)"
+                        r"(?: all| every)?(?: the)? (?P<x>.+)$")),
+]
+NEGATION = re.compile(r"\b(not|no|none|never|nobody|except|excluding|without|besides|other than)\b|n't\b")
+FILTER_SPLIT = re.compile(r" (?:in|where|with|from|who|that|whose|which|for|on|at) ")
+
+
+class Compiled(BaseModel):
+    statement: str = Field(description="SQL in the tenant's dialect")
+    shape: str = Field(description="count, list, count_by or top")
+    confidence: float = Field(description="1.0 when every word of the question was resolved")
+
+
+def enabled() -> bool:
+    return os.getenv("NL2SQL", "true").lower() in ("1", "true", "yes")
+
+
+def min_confidence() -> float:
+    return float(os.getenv("NL2SQL_MIN_CONFIDENCE", "0.85"))
+
+
+def synonyms() -> dict:
+    """NL2SQL_SYNONYMS='{"staff": "employee_information", "pay": "salary"}' (table or column names)."""
+    try:
+        return {k.lower(): v for k, v in json.loads(os.getenv("NL2SQL_SYNONYMS", "{}")).items()}
+    except ValueError:
+        return {}
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def stems(name: str) -> List[str]:
+    """employee_information -> [employee, information]; HireDate -> [hire, date]."""
+    spaced = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    return [singular(w) for w in words(spaced.replace("_", " "))]
+
+
+def quote(name: str, dialect: str) -> str:
+    if dialect == "mssql":
+        return f"[{name}]"
+    if dialect == "mysql":
+        return f"`{name}`"
+    return f'"{name}"'
+
+
+def literal(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class Lexicon:
+    """Per catalog version: word stems of tables and columns, foreign keys and known text values."""
+
+    def __init__(self, snapshot: dict):
+        self.tables: Dict[str, dict] = snapshot["tables"]
+        extra = synonyms()
+        self.table_words = {t: set(stems(t)) | {singular(w) for w, v in extra.items() if v == t} for t in self.tables}
+        self.column_words = {
+            t: {c["name"]: set(stems(c["name"])) | {singular(w) for w, v in extra.items() if v == c["name"]}
+                for c in e["columns"]}
+            for t, e in self.tables.items()
+        }
+        self.values: Dict[Tuple[str, str], set] = {}
+        for t, e in self.tables.items():
+            names = [c["name"] for c in e["columns"]]
+            for row in e.get("sample_rows", []):
+                for column, value in zip(names, row):
+                    if isinstance(value, str) and 0 < len(value) <= 60:
+                        self.values.setdefault((t, column), set()).add(value)
+        self.fetched = set()
+
+    def column_type(self, table: str, column: str) -> str:
+        return next((c["type"] for c in self.tables[table]["columns"] if c["name"] == column), "")
+
+    def references(self, table: str) -> List[Tuple[str, str, str]]:
+        """(local column, referred table, referred column) for single-column foreign keys."""
+        return [(fk["columns"][0], fk["referred_table"], fk["referred_columns"][0])
+                for fk in self.tables[table].get("foreign_keys", [])
+                if len(fk["columns"]) == 1 and fk["referred_table"] in self.tables]
+
+    def display_columns(self, table: str) -> List[str]:
+        columns = [c["name"] for c in self.tables[table]["columns"]]
+        named = [c for c in columns if "name" in stems(c)]
+        first_last = [c for c in named if {"first", "last"} & set(stems(c))]
+        if len(first_last) >= 2:
+            return first_last[:2]
+        if named:
+            return named[:1]
+        titled = [c for c in columns if {"title", "label"} & set(stems(c))]
+        if titled:
+            return titled[:1]
+        pk = self.tables[table].get("primary_key") or []
+        text = [c for c in columns if c not in pk and TEXTUAL.search(self.column_type(table, c))]
+        return text[:1] or columns[:1]
+
+
+class Plan:
+    def __init__(self, table: str):
+        self.table = table
+        self.aliases = {table: "t0"}
+        self.joins: List[str] = []
+        self.where: List[str] = []
+        self.unresolved: List[str] = []
+        self.penalty = 0.0
+
+    def join(self, lexicon: Lexicon, table: str, dialect: str) -> Optional[str]:
+        if table in self.aliases:
+            return self.aliases[table]
+        for local, referred, column in lexicon.references(self.table):
+            if referred == table:
+                alias = f"t{len(self.aliases)}"
+                self.aliases[table] = alias
+                self.joins.append(f"JOIN {quote(table, dialect)} {alias} ON {alias}.{quote(column, dialect)} = "
+                                  f"t0.{quote(local, dialect)}")
+                return alias
+        return None
+
+    def source(self, dialect: str) -> str:
+        sql = f"FROM {quote(self.table, dialect)} t0"
+        if self.joins:
+            sql += " " + " ".join(self.joins)
+        if self.where:
+            sql += " WHERE " + " AND ".join(self.where)
+        return sql
+
+
+class Compiler:
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._lexicons: "OrderedDict[tuple, Lexicon]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lexicon(self, catalog) -> Lexicon:
+        key = (catalog.key, catalog.version)
+        with self._lock:
+            lexicon = self._lexicons.get(key)
+            if lexicon is not None:
+                self._lexicons.move_to_end(key)
+                return lexicon
+        lexicon = Lexicon(catalog.snapshot())
+        with self._lock:
+            self._lexicons[key] = lexicon
+            while len(self._lexicons) > self.max_entries:
+                self._lexicons.popitem(last=False)
+        return lexicon
+
+    # -- resolution ---------------------------------------------------------
+
+    def resolve_table(self, lexicon: Lexicon, phrase: List[str]) -> Tuple[Optional[str], List[str], float]:
+        """Best table for the words, the words it did not use, and a penalty for ambiguity."""
+        tokens = [singular(w) for w in phrase]
+        scored = []
+        for table, table_words in lexicon.table_words.items():
+            hits = [w for w in tokens if w in table_words]
+            if hits:
+                scored.append((len(hits), len(hits) / len(table_words), table, hits))
+        if not scored:
+            return None, phrase, 0.0
+        scored.sort(reverse=True)
+        best = scored[0]
+        penalty = 0.3 if len(scored) > 1 and scored[1][:2] == best[:2] else 0.0
+        rest = [w for w, t in zip(phrase, tokens) if t not in best[3]]
+        return best[2], rest, penalty
+
+    def resolve_column(self, lexicon: Lexicon, table: str, phrase: List[str], numeric: bool = False) -> Optional[str]:
+        tokens = {singular(w) for w in phrase} - FILLER
+        best, best_score = None, 0.0
+        for column, column_words in lexicon.column_words[table].items():
+            if numeric and not NUMERIC.search(lexicon.column_type(table, column)):
+                continue
+            if not tokens or not column_words:
+                continue
+            score = len(tokens & column_words) / len(tokens | column_words)
+            if score > best_score:
+                best, best_score = column, score
+        return best if best_score >= 0.5 else None
+
+    def distinct_values(self, lexicon: Lexicon, db, table: str, dialect: str):
+        # Sampled rows rarely hold the value a question filters on; read small text columns once per version
+        if db is None or table in lexicon.fetched or os.getenv("NL2SQL_VALUE_LOOKUP", "true").lower() not in ("1", "true", "yes"):
+            return
+        lexicon.fetched.add(table)
+        limit = int(os.getenv("NL2SQL_DISTINCT_VALUES", "200"))
+        for column in lexicon.tables[table]["columns"]:
+            if not TEXTUAL.search(column["type"]) or re.search(r"\((\d{4,}|max)\)|TEXT", column["type"], re.I):
+                continue
+            name = quote(column["name"], dialect)
+            top = f"TOP {limit} " if dialect == "mssql" else ""
+            tail = "" if dialect == "mssql" else f" LIMIT {limit}"
+            try:
+                with db._engine.connect() as conn:
+                    rows = conn.exec_driver_sql(
+                        f"SELECT DISTINCT {top}{name} FROM {quote(table, dialect)} WHERE {name} IS NOT NULL{tail}"
+                    ).fetchall()
+            except Exception as e:
+                log_event("nl2sql_value_lookup_failed", table=table, column=column["name"], error=str(e))
+                continue
+            values = {r[0] for r in rows if isinstance(r[0], str) and 0 < len(r[0]) <= 60}
+            if values:
+                lexicon.values.setdefault((table, column["name"]), set()).update(values)
+
+    def apply_filter(self, lexicon: Lexicon, plan: Plan, text: str, db, dialect: str):
+        """Turn 'in HR', 'with salary above 5000', 'department Sales' into WHERE terms; leftovers are recorded."""
+        text = f" {text.strip()} "
+        # Numeric comparison: <column words> <comparison> <number>
+        for phrase, op in sorted(COMPARISONS.items(), key=lambda item: -len(item[0])):
+            match = re.search(rf" ([a-z_ ]+?) (?:is |are )?{re.escape(phrase)} (-?\d+(?:\.\d+)?)\b", text)
+            if match:
+                column = self.resolve_column(lexicon, plan.table, words(match.group(1)), numeric=True)
+                if column is None:
+                    break
+                number = float(match.group(2)) if "." in match.group(2) else int(match.group(2))
+                plan.where.append(f"t0.{quote(column, dialect)} {op} {number}")
+                text = text[:match.start()] + " " + text[match.end():]
+                break
+        # Known values of the table or a table it references, longest first
+        scope = [plan.table] + [referred for _, referred, _ in lexicon.references(plan.table)]
+        for table in scope:
+            self.distinct_values(lexicon, db, table, dialect)
+        candidates = sorted(((value, table, column) for (table, column), values in lexicon.values.items()
+                             if table in scope for value in values), key=lambda item: -len(item[0]))
+        matched: "OrderedDict[str, List[str]]" = OrderedDict()  # alias.column -> values
+        for value, table, column in candidates:
+            pattern = rf"(?<![a-z0-9]){re.escape(value.lower())}(?![a-z0-9])"
+            if not re.search(pattern, text):
+                continue
+            alias = "t0" if table == plan.table else plan.join(lexicon, table, dialect)
+            if alias is None:
+                continue
+            matched.setdefault(f"{alias}.{quote(column, dialect)}", []).append(value)
+            text = re.sub(pattern, " ", text, count=1)
+            # 'department Sales': the column or table word naming the value is used up too
+            for word in set(words(text)):
+                if singular(word) in lexicon.column_words[table].get(column, set()) | lexicon.table_words[table]:
+                    text = re.sub(rf"\b{re.escape(word)}\b", " ", text)
+        # 'in HR and Engineering' means either department; '= HR AND = Engineering' matches nothing
+        for target, values in matched.items():
+            if len(values) == 1:
+                plan.where.append(f"{target} = {literal(values[0])}")
+            else:
+                plan.where.append(f"{target} IN ({', '.join(literal(v) for v in values)})")
+        plan.unresolved += [w for w in words(text) if w not in FILLER]
+
+    def group_label(self, lexicon: Lexicon, plan: Plan, phrase: List[str], dialect: str) -> Optional[str]:
+        tokens = {singular(w) for w in phrase} - FILLER
+        # A referenced table named by the words: group by its display column, not the raw key
+        for local, referred, _ in lexicon.references(plan.table):
+            if tokens and tokens <= lexicon.table_words[referred] | lexicon.column_words[plan.table][local]:
+                alias = plan.join(lexicon, referred, dialect)
+                label = lexicon.display_columns(referred)[0]
+                return f"{alias}.{quote(label, dialect)}"
+        column = self.resolve_column(lexicon, plan.table, phrase)
+        return f"t0.{quote(column, dialect)}" if column else None
+
+    # -- compile ------------------------------------------------------------
+
+    def compile(self, question: str, catalog, db=None) -> Optional[Compiled]:
+        text = " ".join(words(question.replace("'s", "")))
+        for shape, pattern in SHAPES:
+            match = pattern.match(text)
+            if match:
+                break
+        else:
+            return None
+        lexicon = self.lexicon(catalog)
+        dialect = catalog.dialect
+        x = match.group("x")
+        filter_text = ""
+        if shape != "top":
+            parts = FILTER_SPLIT.split(f" {x} ", maxsplit=1)
+            x = parts[0].strip()
+            filter_text = parts[1] if len(parts) > 1 else ""
+            if shape == "count":
+                filter_text += " " + (match.group("rest") or "")
+        y = ""
+        if shape in ("count_by", "top"):
+            # 'top 5 employees by salary in Sales': the filter can follow the ordering or grouping words too
+            parts = FILTER_SPLIT.split(f" {match.group('y')} ", maxsplit=1)
+            y = parts[0].strip()
+            filter_text += " " + (parts[1] if len(parts) > 1 else "")
+        table, rest, penalty = self.resolve_table(lexicon, words(x))
+        if table is None:
+            return None
+        plan = Plan(table)
+        plan.penalty += penalty
+        display = [f"t0.{quote(c, dialect)}" for c in lexicon.display_columns(table)]
+
+        if shape == "list":
+            # 'employee names' / 'emails of staff': words left after the table name the columns
+            asked = {singular(w) for w in rest}
+            named = [c for c, column_words in lexicon.column_words[table].items()
+                     if column_words and column_words <= asked]
+            if named:
+                used = set().union(*(lexicon.column_words[table][c] for c in named))
+                rest = [w for w in rest if singular(w) not in used]
+                display = [f"t0.{quote(c, dialect)}" for c in named[:4]]
+        self.apply_filter(lexicon, plan, " ".join(rest) + " " + filter_text, db, dialect)
+
+        if shape == "count":
+            select, tail = f"COUNT(*) AS {quote('count', dialect)}", ""
+        elif shape == "list":
+            select, tail = ", ".join(display), ""
+        elif shape == "count_by":
+            label = self.group_label(lexicon, plan, words(y), dialect)
+            if label is None:
+                return None
+            alias = quote("_".join(singular(w) for w in words(y) if w not in FILLER) or "group", dialect)
+            count = quote("count", dialect)
+            select = f"{label} AS {alias}, COUNT(*) AS {count}"
+            tail = f" GROUP BY {label} ORDER BY {count} DESC"
+        else:
+            column = self.resolve_column(lexicon, table, words(y), numeric=True)
+            if column is None:
+                return None
+            # resolve_column accepts a partial match; words it didn't use must still count against confidence
+            column_words = lexicon.column_words[table].get(column, set())
+            plan.unresolved += [w for w in words(y) if w not in FILLER and singular(w) not in column_words]
+            order = "ASC" if match.group("dir") == "bottom" else "DESC"
+            value = f"t0.{quote(column, dialect)}"
+            select = ", ".join(dict.fromkeys(display + [value]))
+            tail = f" ORDER BY {value} {order}"
+
+        statement = f"SELECT {select} {plan.source(dialect)}{tail}"
+        if shape == "top":
+            n = int(match.group("n"))
+            statement = (f"SELECT TOP {n} {statement[len('SELECT '):]}" if dialect == "mssql"
+                         else f"{statement} LIMIT {n}")
+        confidence = max(1.0 - plan.penalty - 0.2 * len(plan.unresolved), 0.0)
+        return Compiled(statement=statement, shape=shape, confidence=confidence)
+
+
+compiler = Compiler()
+
+
+def compile_question(question: str, catalog, db=None) -> Optional[Compiled]:
+    """SQL for a recognised question shape when confident enough, else None (and generate_query runs)."""
+    if not enabled() or catalog is None:
+        return None
+    if NEGATION.search(question.lower()):
+        NL2SQL.inc(shape="unknown", outcome="negation")
+        return None
+    try:
+        compiled = compiler.compile(question, catalog, db)
+    except Exception as e:
+        log_event("nl2sql_failed", question=question, error=str(e))
+        NL2SQL.inc(shape="unknown", outcome="error")
+        return None
+    if compiled is None:
+        NL2SQL.inc(shape="unknown", outcome="no_match")
+        return None
+    if compiled.confidence < min_confidence():
+        NL2SQL.inc(shape=compiled.shape, outcome="deferred")
+        return None
+    NL2SQL.inc(shape=compiled.shape, outcome="compiled")
+    return compiled
@@ -1,187 +1,660 @@
-# nodes.py
-import re
-import os
-import ast
-import urllib.parse
-from langchain_community.utilities import SQLDatabase
-from set_api_keys import *
-from prompts import *
-from states import *
-from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain_core.prompts import ChatPromptTemplate
-from typing import Literal
-
-
-def set_variables():
-    set_env("GROQ_API_KEY")
-    set_env("LANGCHAIN_API_KEY")
-    os.environ["LANGCHAIN_TRACING_V2"] = "true"
-    os.environ["LANGCHAIN_PROJECT"] = "sql-llm-agent-tracker"
-
-set_variables()
-
-
-def load_db(name: str, pwd: str, ht: str, dbname: str) -> SQLDatabase:
-    uri = f"mysql+pymysql://{name}:{pwd}@{ht}/{dbname}"
-    print(f"Attempting to connect to MySQL at: {ht} (db: {dbname})...")
-    try:
-        db = SQLDatabase.from_uri(uri, sample_rows_in_table_info=3)
-        print(f"✅ Successfully connected to MySQL at: {ht}")
-        return db
-    except Exception as e:
-        print(f"❌ Failed to connect to MySQL at: {ht}. Error: {e}")
-        raise
-
-
-def load_azure_db() -> SQLDatabase:
-    server   = os.getenv("AZURE_SQL_SERVER", "localhost")
-    database = os.getenv("AZURE_SQL_DATABASE")
-    user     = os.getenv("AZURE_SQL_USER")
-    pwd      = os.getenv("AZURE_SQL_PASSWORD")
-    driver   = os.getenv("AZURE_SQL_DRIVER", "ODBC Driver 18 for SQL Server")
-    driver_enc = urllib.parse.quote_plus(driver)
-
-    uri = (
-        f"mssql+pyodbc://{user}:{pwd}"
-        f"@{server}:1433/{database}"
-        f"?driver={driver_enc}"
-        f"&Encrypt=no"  # disable encryption for local SQL Edge
-        f"&TrustServerCertificate=yes"
-        f"&Connection+Timeout=30"
-    )
-
-    print(f"Attempting to connect to Azure SQL Edge at: {server} (db: {database})...")
-    try:
-        db = SQLDatabase.from_uri(uri, sample_rows_in_table_info=3)
-        print(f"✅ Successfully connected to Azure SQL Edge at: {server}")
-        return db
-    except Exception as e:
-        print(f"❌ Failed to connect to Azure SQL Edge. Error: {e}")
-        raise
-
-
-def parse(tables):
-    return ast.literal_eval(tables)
-
-
-def select_relevant_schemas(state: dict, config: dict) -> dict:
-    db = config["configurable"]["db"]
-    all_tables = list(db.get_usable_table_names())
-    # Prioritize employee tables and limit for token constraints
-    limited_tables = sorted(
-        all_tables,
-        key=lambda t: (
-            not ("employee" in t.lower() or "emp_" in t.lower()),
-            t
-        )
-    )[:25]
-
-    state['max_attempts'] = state.get('max_attempts', MAX_ATTEMPTS_DEFAULT)
-    question = state['question']
-
-    instruction = SystemMessage(content=SELECT_RELEVANT_TABLES_INSTRUCTION.format(table_names=limited_tables))
-    prompt = [instruction, HumanMessage(content=question)]
-    model = ChatGroq(model="llama-3.1-8b-instant")
-    try:
-        raw = model.invoke(prompt).content
-        tables = ast.literal_eval(raw)
-        relevant = [t for t in tables if t in limited_tables]
-    except Exception:
-        relevant = []
-    # Fallback
-    if not relevant and "employee" in question.lower():
-        if "employee_information" in limited_tables:
-            relevant = ["employee_information"]
-    if not relevant:
-        return {
-            "error_message": INVALID_QUESTION_ERROR,
-            "tables_info": "No relevant tables",
-            'attempts': 0,
-            'answer': '',
-            'reasoning': '',
-            'queries': []
-        }
-    return {"tables_info": db.get_table_info(relevant), 'attempts': 0, 'answer': '', 'error_message': '', 'reasoning': '', 'queries': []}
-
-
-def generate_query(state: dict, config: dict) -> dict:
-    db = config["configurable"]["db"]
-    question = state["question"]
-    tables_info = state["tables_info"]
-    queries = state.get("queries")
-    instructions = (FIX_QUERY_INSTRUCTIONS if queries and not queries[-1].is_valid else GENERATE_QUERY_INSTRUCTIONS)
-    instructions = instructions.format(info=tables_info, queries=queries, error_info=(queries[-1].error_info if queries else ''))
-
-    gen = ChatGroq(model="llama-3.1-8b-instant").with_structured_output(GenQueryResponse)
-    resp = gen.invoke([SystemMessage(content=instructions), HumanMessage(content=question)])
-
-    chk = ChatGroq(model="llama-3.3-70b-versatile").with_structured_output(GenQueryResponse)
-    corrected = chk.invoke([SystemMessage(content=QUERY_CHECK_INSTRUCTION), AIMessage(content=f"SQLite query: {resp.statement}\nReasoning:{resp.reasoning}")])
-    stmt = corrected.statement
-    reasoning = resp.reasoning if resp.statement == stmt else f"First: {resp.reasoning}\nCorrection: {corrected.reasoning}"
-    query = Query(statement=stmt, reasoning=reasoning)
-    return {**state, "queries": [query], "attempts": state.get("attempts",0) + 1}
-
-
-def execute_query(state: dict, config: dict) -> dict:
-    db = config["configurable"]["db"]
-    attempts = state.get("attempts",0)
-    max_attempts = state.get("max_attempts",0)
-    query = state["queries"][-1]
-    if attempts > max_attempts:
-        return {**state, "error_message": REACH_OUT_MAX_ATTEMPTS_ERROR}
-    try:
-        res = db.run(query.statement)
-        query.result = res if res else []
-    except Exception as e:
-        query.result = f"ERROR:{e}"
-        query.is_valid = False
-    return {**state, "attempts": attempts+1, "queries": state["queries"]}
-
-
-def generate_answer(state: dict, config: dict) -> dict:
-    # Directly format result for list queries to avoid token blow-up
-    query = state["queries"][-1]
-    question = state.get("question","").lower()
-    result = query.result
-    if isinstance(result, list) and question.startswith("list"):
-        # assume list of tuples
-        names = [" ".join(map(str,row)) for row in result]
-        answer = f"Here are the employee names: {', '.join(names)}"
-        return {**state, "answer": answer}
-    # Fallback: concise framing
-    info = f"SQL query:\n{query.statement}\nResult sample:\n{result[:10] if isinstance(result,list) else result}"
-    prompt = [SystemMessage(content=GENERATE_ANSWER_INSTRUCTION.format(query_info=info)), HumanMessage(content=state["question"])]
-    resp = ChatGroq(model="llama-3.1-8b-instant").invoke(prompt)
-    return {**state, "answer": resp.content}
-
-
-def general_chat(state: dict, config: dict) -> dict:
-    stmt = state['question']
-    hist = state.get("general_message",[])
-    pack = GeneralMessage(human=stmt, llm="")
-    instr = NORMAL_INSTRUCTION.format(history=hist)
-    chain = ChatPromptTemplate.from_messages([("system",instr),("placeholder","{messages}")]) | ChatGroq(model="llama-3.1-8b-instant")
-    out = chain.invoke({"messages":[stmt]})
-    pack.llm = out.content
-    return {"answer":out.content, "general_message":hist+[pack]}
-
-# Simple rule detection
-def is_related(state: dict) -> bool:
-    return bool(re.search(r"\b(select|count|list|how many|show)\b", state.get('question','').lower()))
-
-# Routing
-def check_question(state: dict) -> Literal["generate_query","generate_answer","general_chat"]:
-    if state.get("error_message")==INVALID_QUESTION_ERROR:
-        return "general_chat"
-    qs=state.get("queries",[])
-    if qs:
-        last=qs[-1]
-        return "generate_answer" if not str(last.result).startswith("ERROR") else "generate_query"
-    return "generate_query" if is_related(state) else "general_chat"
-
-def router(state: dict)->Literal["generate_query","generate_answer"]:
-    last=state["queries"][-1]
-    return "generate_query" if isinstance(last.result,str) and last.result.startswith("ERROR") else "generate_answer"
+# nodes.py
+from __future__ import annotations
+
+import re
+import os
+import ast
+import json
+import time
+import asyncio
+import urllib.parse
+from prompts import *
+from states import *
+from table_index import get_index, select_tables
+from concurrency import run_db, run_llm, tenant_of, llm_executor, submit
+from scheduler import StageTimeout, with_deadline
+from query_cache import get_cache
+from query_results import fetch_result
+from sql_guard import QueryRejected
+from replicas import NoHealthyEndpoint
+from nl2sql import compile_question
+from sql_repair import SQL_REPAIRS, max_repairs, repair as repair_sql
+from sql_validator import Validation, validate_sql, explain_sql, explain_enabled, needs_checker
+from llm import chat_model
+from schema_compact import compact_tables_info, enabled as compact_enabled
+from answer_render import render_answer, record as record_answer
+from conversation_memory import get_memory
+from metrics import DB_QUERY_SECONDS, Counter, register
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from settings import get_settings
+from typing import TYPE_CHECKING, Dict, Literal, Optional
+
+if TYPE_CHECKING:
+    from langchain_community.utilities import SQLDatabase
+
+SPECULATION = register(Counter("sqlagent_speculation_total", "Speculative routing outcomes", ("outcome",)))
+
+
+def mysql_uri(name: str, pwd: str, ht: str, dbname: str) -> str:
+    return f"mysql+pymysql://{name}:{pwd}@{ht}/{dbname}"
+
+
+def azure_uri(server: str, database: str, read_only: bool = False) -> str:
+    user     = os.getenv("AZURE_SQL_USER")
+    pwd      = os.getenv("AZURE_SQL_PASSWORD")
+    driver   = os.getenv("AZURE_SQL_DRIVER", "ODBC Driver 18 for SQL Server")
+    driver_enc = urllib.parse.quote_plus(driver)
+    uri = (
+        f"mssql+pyodbc://{user}:{pwd}"
+        f"@{server}:1433/{database}"
+        f"?driver={driver_enc}"
+        f"&Encrypt=no"  # disable encryption for local SQL Edge
+        f"&TrustServerCertificate=yes"
+        f"&Connection+Timeout=30"
+    )
+    # Readable secondaries only accept read-intent connections
+    return uri + "&ApplicationIntent=ReadOnly" if read_only else uri
+
+
+def load_db(name: str, pwd: str, ht: str, dbname: str, engine_args: Optional[dict] = None) -> SQLDatabase:
+    from langchain_community.utilities import SQLDatabase
+    uri = mysql_uri(name, pwd, ht, dbname)
+    print(f"Attempting to connect to MySQL at: {ht} (db: {dbname})...")
+    try:
+        db = SQLDatabase.from_uri(uri, engine_args=engine_args, sample_rows_in_table_info=3)
+        print(f"✅ Successfully connected to MySQL at: {ht}")
+        return db
+    except Exception as e:
+        print(f"❌ Failed to connect to MySQL at: {ht}. Error: {e}")
+        raise
+
+
+def load_azure_db(engine_args: Optional[dict] = None) -> SQLDatabase:
+    from langchain_community.utilities import SQLDatabase
+    server   = os.getenv("AZURE_SQL_SERVER", "localhost")
+    database = os.getenv("AZURE_SQL_DATABASE")
+    uri = azure_uri(server, database)
+
+    print(f"Attempting to connect to Azure SQL Edge at: {server} (db: {database})...")
+    try:
+        db = SQLDatabase.from_uri(uri, engine_args=engine_args, sample_rows_in_table_info=3)
+        print(f"✅ Successfully connected to Azure SQL Edge at: {server}")
+        return db
+    except Exception as e:
+        print(f"❌ Failed to connect to Azure SQL Edge. Error: {e}")
+        raise
+
+
+def load_sqlite_db(path: str, engine_args: Optional[dict] = None) -> SQLDatabase:
+    # Local tenant databases for benchmarks and offline testing
+    from langchain_community.utilities import SQLDatabase
+    print(f"Attempting to open SQLite database: {path}...")
+    try:
+        db = SQLDatabase.from_uri(f"sqlite:///{path}", engine_args=engine_args, sample_rows_in_table_info=3)
+        print(f"✅ Successfully opened SQLite database: {path}")
+        return db
+    except Exception as e:
+        print(f"❌ Failed to open SQLite database: {path}. Error: {e}")
+        raise
+
+
+def parse(tables):
+    return ast.literal_eval(tables)
+
+
+def table_selection_prompt(question: str, candidates: list) -> list:
+    instruction = SystemMessage(content=SELECT_RELEVANT_TABLES_INSTRUCTION.format(table_names=candidates))
+    return [instruction, HumanMessage(content=question)]
+
+
+def parse_selected_tables(raw: str, candidates: list) -> list:
+    try:
+        tables = ast.literal_eval(raw)
+        return [t for t in tables if t in candidates]
+    except Exception:
+        return []
+
+
+def llm_select_tables(question: str, candidates: list) -> list:
+    model = chat_model("llama-3.1-8b-instant")
+    try:
+        raw = model.invoke(table_selection_prompt(question, candidates)).content
+    except Exception:
+        return []
+    return parse_selected_tables(raw, candidates)
+
+
+async def allm_select_tables(question: str, candidates: list, tenant: str) -> list:
+    model = chat_model("llama-3.1-8b-instant")
+    try:
+        raw = (await run_llm(tenant, model, table_selection_prompt(question, candidates))).content
+    except Exception:
+        return []
+    return parse_selected_tables(raw, candidates)
+
+
+def employee_first(t: str):
+    return (not ("employee" in t.lower() or "emp_" in t.lower()), t)
+
+
+def batch_selection_prompt(questions: list, candidates: list) -> list:
+    numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+    instruction = SystemMessage(content=BATCH_SELECT_RELEVANT_TABLES_INSTRUCTION.format(table_names=candidates))
+    return [instruction, HumanMessage(content=numbered)]
+
+
+def parse_batch_selection(raw: str, count: int, candidates: list) -> list:
+    """One table list per question; None where the answer was missing or unreadable."""
+    try:
+        match = re.search(r"\{.*\}", raw, re.S)
+        picked = json.loads(match.group(0)) if match else {}
+    except ValueError:
+        picked = {}
+    selections = []
+    for i in range(1, count + 1):
+        tables = picked.get(str(i))
+        selections.append([t for t in tables if t in candidates] if isinstance(tables, list) else None)
+    return selections
+
+
+async def abatch_select_tables(questions: list, candidates: list, tenant: str) -> list:
+    """Pick tables for several questions with one LLM call."""
+    model = chat_model("llama-3.1-8b-instant")
+    try:
+        raw = (await run_llm(tenant, model, batch_selection_prompt(questions, candidates))).content
+    except Exception:
+        return [None] * len(questions)
+    return parse_batch_selection(raw, len(questions), candidates)
+
+
+def preselected_tables(config: dict) -> Optional[list]:
+    # Set by batch runs, which choose tables for many questions up front
+    return config["configurable"].get("relevant_tables")
+
+
+def rank_tables(db: SQLDatabase, catalog, question: str, preselected: Optional[list] = None):
+    """Return (all_tables, relevant, candidates); relevant is None when the LLM has to pick from candidates."""
+    if preselected is not None:
+        all_tables = catalog.table_names() if catalog else list(db.get_usable_table_names())
+        return all_tables, list(preselected), []
+    if catalog:
+        all_tables = catalog.table_names()
+        index = get_index(catalog)
+        ranked = index.rank(question)
+        relevant = select_tables(ranked, min_score=float(os.getenv("TABLE_INDEX_MIN_SCORE", index.min_score)))
+        if relevant is not None:
+            return all_tables, relevant, []
+        # Ambiguous scores: let the LLM choose among the best-ranked candidates
+        limit = int(os.getenv("TABLE_CANDIDATES", "25"))
+        hits = [t for t, score in ranked if score > 0][:limit]
+        return all_tables, None, hits or sorted(all_tables, key=employee_first)[:limit]
+    all_tables = list(db.get_usable_table_names())
+    # Prioritize employee tables and limit for token constraints
+    return all_tables, None, sorted(all_tables, key=employee_first)[:25]
+
+
+def table_infos(db: SQLDatabase, names: list) -> Dict[str, str]:
+    return {name: db.get_table_info([name]) for name in names}
+
+
+def tables_result(db: SQLDatabase, catalog, question: str, all_tables: list, relevant: list,
+                  infos: Optional[Dict[str, str]] = None) -> dict:
+    # Fallback
+    if not relevant and "employee" in question.lower():
+        if "employee_information" in all_tables:
+            relevant = ["employee_information"]
+    if not relevant:
+        return {
+            "error_message": INVALID_QUESTION_ERROR,
+            "tables_info": "No relevant tables",
+            'attempts': 0,
+            'answer': '',
+            'reasoning': '',
+            'queries': []
+        }
+    if infos and all(t in infos for t in relevant):
+        tables_info = "\n\n".join(infos[t] for t in relevant)
+    elif catalog and compact_enabled():
+        tables_info = compact_tables_info(catalog, relevant, question)
+    else:
+        tables_info = catalog.tables_info(relevant) if catalog else db.get_table_info(relevant)
+    return {"tables_info": tables_info, 'attempts': 0, 'answer': '', 'error_message': '', 'reasoning': '', 'queries': []}
+
+
+def select_relevant_schemas(state: dict, config: dict) -> dict:
+    db = config["configurable"]["db"]
+    catalog = config["configurable"].get("catalog")
+
+    state['max_attempts'] = state.get('max_attempts', MAX_ATTEMPTS_DEFAULT)
+    question = state['question']
+
+    all_tables, relevant, candidates = rank_tables(db, catalog, question, preselected_tables(config))
+    if relevant is None:
+        relevant = llm_select_tables(question, candidates)
+    return tables_result(db, catalog, question, all_tables, relevant)
+
+
+async def aselect_relevant_schemas(state: dict, config: dict) -> dict:
+    db = config["configurable"]["db"]
+    catalog = config["configurable"].get("catalog")
+    tenant = tenant_of(config)
+
+    state['max_attempts'] = state.get('max_attempts', MAX_ATTEMPTS_DEFAULT)
+    question = state['question']
+
+    # Ranking may reflect a cold catalog, so it runs off the event loop
+    all_tables, relevant, candidates = await run_db(tenant, rank_tables, db, catalog, question, preselected_tables(config))
+    if relevant is None:
+        relevant = await allm_select_tables(question, candidates, tenant)
+    return await run_db(tenant, tables_result, db, catalog, question, all_tables, relevant)
+
+
+# Speculative mode: the general-chat answer is drafted while the LLM picks tables
+
+def speculative() -> bool:
+    return get_settings().speculative_graph
+
+
+def prewarm_count(catalog) -> int:
+    # The catalog already holds every table's info; only the live DB path is worth warming
+    return 0 if catalog else int(os.getenv("SPECULATIVE_PREWARM_TABLES", "3"))
+
+
+def speculation_result(state: dict, config: dict, result: dict, chat: Optional[dict]) -> dict:
+    if result.get("error_message") == INVALID_QUESTION_ERROR and chat is not None:
+        SPECULATION.inc(outcome="chat")
+        # Only a draft that is actually returned becomes a conversation turn
+        remember_chat(state, config, chat["answer"])
+        return {**result, **chat}
+    SPECULATION.inc(outcome="sql")
+    return result
+
+
+def speculative_select(state: dict, config: dict) -> dict:
+    db = config["configurable"]["db"]
+    catalog = config["configurable"].get("catalog")
+
+    state['max_attempts'] = state.get('max_attempts', MAX_ATTEMPTS_DEFAULT)
+    question = state['question']
+
+    all_tables, relevant, candidates = rank_tables(db, catalog, question, preselected_tables(config))
+    if relevant is not None:
+        SPECULATION.inc(outcome="index")
+        return tables_result(db, catalog, question, all_tables, relevant)
+    chat = submit(llm_executor(), draft_chat, dict(state), config)
+    warm = submit(llm_executor(), table_infos, db, candidates[:prewarm_count(catalog)])
+    try:
+        relevant = llm_select_tables(question, candidates)
+        result = tables_result(db, catalog, question, all_tables, relevant, warm.result())
+        if result.get("error_message") != INVALID_QUESTION_ERROR:
+            return speculation_result(state, config, result, None)
+        return speculation_result(state, config, result, chat.result())
+    finally:
+        # A running thread can't be interrupted; its result is simply dropped
+        chat.cancel()
+        warm.cancel()
+
+
+def discard(task: Optional[asyncio.Task]):
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        # Retrieve the exception so a failed loser isn't reported as never retrieved
+        task.exception()
+
+
+async def aspeculative_select(state: dict, config: dict) -> dict:
+    db = config["configurable"]["db"]
+    catalog = config["configurable"].get("catalog")
+    tenant = tenant_of(config)
+
+    state['max_attempts'] = state.get('max_attempts', MAX_ATTEMPTS_DEFAULT)
+    question = state['question']
+
+    all_tables, relevant, candidates = await run_db(tenant, rank_tables, db, catalog, question, preselected_tables(config))
+    if relevant is not None:
+        SPECULATION.inc(outcome="index")
+        return await run_db(tenant, tables_result, db, catalog, question, all_tables, relevant)
+    chat = asyncio.create_task(adraft_chat(dict(state), config))
+    warmed = candidates[:prewarm_count(catalog)]
+    warm = asyncio.create_task(run_db(tenant, table_infos, db, warmed)) if warmed else None
+    try:
+        relevant = await allm_select_tables(question, candidates, tenant)
+        infos = await warm if warm is not None and relevant else None
+        result = await run_db(tenant, tables_result, db, catalog, question, all_tables, relevant, infos)
+        if result.get("error_message") != INVALID_QUESTION_ERROR:
+            return speculation_result(state, config, result, None)
+        return speculation_result(state, config, result, await chat)
+    finally:
+        discard(chat)
+        discard(warm)
+
+
+def query_instructions(state: dict) -> str:
+    tables_info = state["tables_info"]
+    queries = state.get("queries")
+    instructions = (FIX_QUERY_INSTRUCTIONS if queries and not queries[-1].is_valid else GENERATE_QUERY_INSTRUCTIONS)
+    return instructions.format(info=tables_info, queries=queries, error_info=(queries[-1].error_info if queries else ''))
+
+
+def check_prompt(resp: GenQueryResponse) -> list:
+    return [SystemMessage(content=QUERY_CHECK_INSTRUCTION), AIMessage(content=f"SQLite query: {resp.statement}\nReasoning:{resp.reasoning}")]
+
+
+def checked_query(state: dict, resp: GenQueryResponse, corrected: GenQueryResponse) -> dict:
+    stmt = corrected.statement
+    reasoning = resp.reasoning if resp.statement == stmt else f"First: {resp.reasoning}\nCorrection: {corrected.reasoning}"
+    query = Query(statement=stmt, reasoning=reasoning)
+    return {**state, "queries": [query], "attempts": state.get("attempts",0) + 1}
+
+
+def schema_version(config: dict) -> str:
+    catalog = config["configurable"].get("catalog")
+    return catalog.version if catalog else "live"
+
+
+def cached_query(state: dict, config: dict) -> Optional[dict]:
+    # Fresh questions only; a failed query must go through the LLM fix loop
+    cache = get_cache()
+    queries = state.get("queries")
+    if cache is None or (queries and not queries[-1].is_valid):
+        return None
+    hit = cache.get_sql(tenant_of(config), schema_version(config), state["question"])
+    if hit is None:
+        return None
+    query = Query(statement=hit["statement"], reasoning=hit["reasoning"])
+    return {**state, "queries": [query], "attempts": state.get("attempts",0) + 1}
+
+
+def compiled_query(state: dict, config: dict) -> Optional[dict]:
+    # Common question shapes compiled from the catalog; like the cache, fresh questions only
+    queries = state.get("queries")
+    if queries and not queries[-1].is_valid:
+        return None
+    compiled = compile_question(state["question"], config["configurable"].get("catalog"), config["configurable"]["db"])
+    if compiled is None:
+        return None
+    reasoning = f"Compiled locally from a '{compiled.shape}' question (confidence {compiled.confidence:.2f})."
+    query = Query(statement=compiled.statement, reasoning=reasoning)
+    return {**state, "queries": [query], "attempts": state.get("attempts",0) + 1}
+
+
+def static_check(statement: str, config: dict) -> Validation:
+    catalog = config["configurable"].get("catalog")
+    if catalog is None:
+        return Validation(ok=False, reason="No schema catalog to validate against")
+    return validate_sql(statement, catalog.columns(), catalog.dialect)
+
+
+def generate_query(state: dict, config: dict) -> dict:
+    cached = cached_query(state, config) or compiled_query(state, config)
+    if cached is not None:
+        return cached
+    question = state["question"]
+    instructions = query_instructions(state)
+
+    gen = chat_model("llama-3.1-8b-instant").with_structured_output(GenQueryResponse)
+    resp = gen.invoke([SystemMessage(content=instructions), HumanMessage(content=question)])
+
+    # Only pay for the 70B checker when the statement doesn't validate locally
+    validation = static_check(resp.statement, config)
+    if validation.ok and explain_enabled():
+        error = explain_sql(config["configurable"]["db"], resp.statement)
+        if error:
+            validation = Validation(ok=False, reason=error)
+    if not needs_checker(validation):
+        return checked_query(state, resp, resp)
+
+    chk = chat_model("llama-3.3-70b-versatile").with_structured_output(GenQueryResponse)
+    corrected = chk.invoke(check_prompt(resp))
+    return checked_query(state, resp, corrected)
+
+
+async def agenerate_query(state: dict, config: dict) -> dict:
+    tenant = tenant_of(config)
+    # The sqlite cache and the compiler's DISTINCT lookups (once per schema version) both block
+    local = await run_db(tenant, lambda: cached_query(state, config) or compiled_query(state, config))
+    if local is not None:
+        return local
+    question = state["question"]
+    instructions = query_instructions(state)
+
+    gen = chat_model("llama-3.1-8b-instant").with_structured_output(GenQueryResponse)
+    resp = await run_llm(tenant, gen, [SystemMessage(content=instructions), HumanMessage(content=question)])
+
+    validation = static_check(resp.statement, config)
+    if validation.ok and explain_enabled():
+        error = await run_db(tenant, explain_sql, config["configurable"]["db"], resp.statement)
+        if error:
+            validation = Validation(ok=False, reason=error)
+    if not needs_checker(validation):
+        return checked_query(state, resp, resp)
+
+    chk = chat_model("llama-3.3-70b-versatile").with_structured_output(GenQueryResponse)
+    corrected = await run_llm(tenant, chk, check_prompt(resp))
+    return checked_query(state, resp, corrected)
+
+
+def execute_statement(db: SQLDatabase, statement: str, config: dict) -> ResultSet:
+    # Generated SQL is read-only: run it on the least busy healthy replica when the tenant has any
+    replicas = config["configurable"].get("replicas")
+    if replicas is None:
+        return fetch_result(db, statement)
+    return replicas.run(lambda engine: fetch_result(db, statement, engine=engine))
+
+
+def fetch_with_repair(db: SQLDatabase, query: Query, config: dict) -> ResultSet:
+    # Unknown identifiers and dialect slips are fixed locally and re-run at once; the LLM fix loop gets the rest
+    catalog = config["configurable"].get("catalog")
+    repair = None
+    for step in range(max_repairs() + 1):
+        try:
+            result = execute_statement(db, query.statement, config)
+        except (QueryRejected, NoHealthyEndpoint):
+            # Not the statement's fault: nothing to repair
+            raise
+        except Exception as e:
+            if repair is not None:
+                SQL_REPAIRS.inc(kind=repair.kind, outcome="failed")
+            if catalog is None or step == max_repairs():
+                raise
+            repair = repair_sql(query.statement, str(e), catalog.columns(), db.dialect)
+            if repair is None:
+                raise
+            query.statement = repair.statement
+            query.reasoning = f"{query.reasoning}\nRepaired locally: {repair.detail}."
+            continue
+        if repair is not None:
+            SQL_REPAIRS.inc(kind=repair.kind, outcome="fixed")
+        return result
+
+
+def run_query(db: SQLDatabase, query: Query, config: dict, question: str = ""):
+    cache = get_cache()
+    tenant, version = tenant_of(config), schema_version(config)
+    if cache is not None:
+        hit = cache.get_result(tenant, version, query.statement)
+        if isinstance(hit, dict):
+            query.result = ResultSet(**hit)
+            DB_QUERY_SECONDS.observe(0.0, tenant=tenant, outcome="cached")
+            return
+    start = time.perf_counter()
+    try:
+        query.result = fetch_with_repair(db, query, config)
+    except QueryRejected as e:
+        # Cost or time limit: tell the fix loop why, not just that it failed
+        query.result = f"ERROR:{e}"
+        query.error = str(e)
+        query.is_valid = False
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, tenant=tenant, outcome="rejected")
+        return
+    except NoHealthyEndpoint:
+        # The statement may be fine; a rewrite by the fix loop can't help, so fail the request
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, tenant=tenant, outcome="unavailable")
+        raise
+    except Exception as e:
+        query.result = f"ERROR:{e}"
+        query.error = str(e)
+        query.is_valid = False
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, tenant=tenant, outcome="error")
+        return
+    DB_QUERY_SECONDS.observe(time.perf_counter() - start, tenant=tenant, outcome="ok")
+    if cache is not None:
+        cache.put_result(tenant, version, query.statement, query.result.model_dump())
+        if question:
+            cache.put_sql(tenant, version, question, query.statement, query.reasoning)
+
+
+def execute_query(state: dict, config: dict) -> dict:
+    db = config["configurable"]["db"]
+    attempts = state.get("attempts",0)
+    max_attempts = state.get("max_attempts",0)
+    query = state["queries"][-1]
+    if attempts > max_attempts:
+        return {**state, "error_message": REACH_OUT_MAX_ATTEMPTS_ERROR}
+    run_query(db, query, config, state.get("question", ""))
+    return {**state, "attempts": attempts+1, "queries": state["queries"]}
+
+
+async def aexecute_query(state: dict, config: dict) -> dict:
+    db = config["configurable"]["db"]
+    attempts = state.get("attempts",0)
+    max_attempts = state.get("max_attempts",0)
+    query = state["queries"][-1]
+    if attempts > max_attempts:
+        return {**state, "error_message": REACH_OUT_MAX_ATTEMPTS_ERROR}
+    try:
+        await with_deadline("sql", run_db(tenant_of(config), run_query, db, query, config, state.get("question", "")))
+    except StageTimeout as e:
+        # The worker thread keeps its DB slot until the statement ends, and only touches the Query object dropped here
+        failed = Query(statement=query.statement, reasoning=query.reasoning, is_valid=False, result=f"ERROR:{e}",
+                       error=str(e))
+        return {**state, "attempts": attempts+1, "queries": state["queries"][:-1] + [failed]}
+    return {**state, "attempts": attempts+1, "queries": state["queries"]}
+
+
+def direct_answer(state: dict, config: dict) -> Optional[str]:
+    # Render common result shapes (counts, single rows, lists, small group-bys) without the LLM
+    query = state["queries"][-1]
+    answer = render_answer(state.get("question",""), query.result)
+    if answer is not None:
+        record_answer("template")
+        return answer
+    # Then an answer the model already wrote for this statement and question, possibly in another worker
+    cache = get_cache()
+    if cache is not None:
+        answer = cache.get_answer(tenant_of(config), schema_version(config), query.statement, state.get("question",""))
+        if answer is not None:
+            record_answer("cache")
+            return answer
+    record_answer("llm")
+    return None
+
+
+def store_answer(state: dict, config: dict, answer: str):
+    cache = get_cache()
+    if cache is not None:
+        cache.put_answer(tenant_of(config), schema_version(config), state["queries"][-1].statement,
+                         state.get("question",""), answer)
+
+
+def answer_prompt(state: dict) -> list:
+    # Fallback: concise framing
+    query = state["queries"][-1]
+    result = query.result
+    info = f"SQL query:\n{query.statement}\nResult sample:\n{result.summary() if isinstance(result,ResultSet) else result}"
+    return [SystemMessage(content=GENERATE_ANSWER_INSTRUCTION.format(query_info=info)), HumanMessage(content=state["question"])]
+
+
+def generate_answer(state: dict, config: dict) -> dict:
+    answer = direct_answer(state, config)
+    if answer is not None:
+        return {**state, "answer": answer}
+    resp = chat_model("llama-3.1-8b-instant").invoke(answer_prompt(state))
+    store_answer(state, config, resp.content)
+    return {**state, "answer": resp.content}
+
+
+async def agenerate_answer(state: dict, config: dict) -> dict:
+    answer = direct_answer(state, config)
+    if answer is not None:
+        return {**state, "answer": answer}
+    resp = await run_llm(tenant_of(config), chat_model("llama-3.1-8b-instant"), answer_prompt(state))
+    store_answer(state, config, resp.content)
+    return {**state, "answer": resp.content}
+
+
+def session_of(config: dict) -> Optional[str]:
+    return config["configurable"].get("thread_id")
+
+
+def general_chat_chain(state: dict, config: dict):
+    # Summary + recent turns within MEMORY_TOKEN_BUDGET, so the prompt stops growing with the conversation
+    session = session_of(config)
+    hist = get_memory().render(session) if session else ""
+    instr = NORMAL_INSTRUCTION.format(history=hist)
+    # A message, not a template: the history may contain braces
+    return ChatPromptTemplate.from_messages([SystemMessage(content=instr),("placeholder","{messages}")]) | chat_model("llama-3.1-8b-instant")
+
+
+def remember_chat(state: dict, config: dict, answer: str):
+    session = session_of(config)
+    if session:
+        get_memory().add(session, state['question'], answer)
+
+
+def draft_chat(state: dict, config: dict) -> dict:
+    # Also drafted speculatively, so it leaves memory alone; whoever returns the answer records the turn
+    out = general_chat_chain(state, config).invoke({"messages":[state['question']]})
+    return {"answer":out.content}
+
+
+async def adraft_chat(state: dict, config: dict) -> dict:
+    out = await run_llm(tenant_of(config), general_chat_chain(state, config), {"messages":[state['question']]})
+    return {"answer":out.content}
+
+
+def general_chat(state: dict, config: dict) -> dict:
+    result = draft_chat(state, config)
+    remember_chat(state, config, result["answer"])
+    return result
+
+
+async def ageneral_chat(state: dict, config: dict) -> dict:
+    result = await adraft_chat(state, config)
+    remember_chat(state, config, result["answer"])
+    return result
+
+# Simple rule detection
+def is_related(state: dict) -> bool:
+    return bool(re.search(r"\b(select|count|list|how many|show)\b", state.get('question','').lower()))
+
+# Routing
+def check_question(state: dict) -> Literal["generate_query","generate_answer","general_chat"]:
+    if state.get("error_message")==INVALID_QUESTION_ERROR:
+        return "general_chat"
+    qs=state.get("queries",[])
+    if qs:
+        last=qs[-1]
+        return "generate_answer" if not str(last.result).startswith("ERROR") else "generate_query"
+    return "generate_query" if is_related(state) else "general_chat"
+
+def triage(state: dict) -> Literal["select_relevant_schemas","general_chat"]:
+    # Same outcome check_question would reach, without waiting for table selection
+    if is_related(state):
+        return "select_relevant_schemas"
+    SPECULATION.inc(outcome="skip_select")
+    return "general_chat"
+
+def after_speculative_select(state: dict) -> Literal["generate_query","general_chat","__end__"]:
+    # The drafted general-chat answer already won
+    if state.get("answer"):
+        return "__end__"
+    return check_question(state)
+
+def router(state: dict)->Literal["generate_query","generate_answer"]:
+    last=state["queries"][-1]
+    return "generate_query" if isinstance(last.result,str) and last.result.startswith("ERROR") else "generate_answer"
@@ -0,0 +1,292 @@
+# profiling.py
+"""
+On-demand sampling profiler for single /ask and /ask/stream requests (not /ask/batch).
+
+A request is profiled when it carries `X-Profile: 1` and `X-Admin-Key: $PROFILE_ADMIN_KEY`, or is picked
+by PROFILE_SAMPLE_RATE (optionally only for PROFILE_TENANTS). While it runs, a background thread reads
+the stacks of the threads and event-loop tasks working for it every PROFILE_INTERVAL_MS and writes
+
+    <PROFILE_DIR>/<id>.folded            collapsed stacks: tenant;node:<name>;frame;frame... count
+    <PROFILE_DIR>/<id>.speedscope.json   the same samples for https://www.speedscope.app
+    <PROFILE_DIR>/<id>.json              tenant, node timings and sample counts
+
+/ask returns the id in an X-Profile-Id header, /ask/stream in a final "profile" event. The files are
+written off the event loop, and the speedscope timeline keeps at most PROFILE_MAX_SAMPLES samples (the
+folded counts keep all of them).
+Nothing is traced when no request is being profiled: the hooks only read a ContextVar.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import functools
+import threading
+from collections import Counter as Tally
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from metrics import Counter, register, log_event
+
+PROFILES = register(Counter("sqlagent_profiles_total", "Profiled requests", ("tenant", "trigger")))
+
+MAX_DEPTH = 128
+
+_active: ContextVar[Optional["Profile"]] = ContextVar("sqlagent_profile", default=None)
+_node: ContextVar[str] = ContextVar("sqlagent_profile_node", default="request")
+
+
+def interval() -> float:
+    return float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+
+def max_samples() -> int:
+    return int(os.getenv("PROFILE_MAX_SAMPLES", "20000"))
+
+
+def output_dir() -> str:
+    return os.getenv("PROFILE_DIR", ".profiles")
+
+
+def trigger(headers, tenant: str) -> Optional[str]:
+    """'header' or 'sampled' when this request should be profiled, else None."""
+    key = os.getenv("PROFILE_ADMIN_KEY")
+    if headers.get("x-profile", "").lower() in ("1", "true", "yes"):
+        if key and headers.get("x-admin-key") == key:
+            return "header"
+        log_event("profile_denied", tenant=tenant)
+        return None
+    rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    tenants = {t.strip() for t in os.getenv("PROFILE_TENANTS", "").split(",") if t.strip()}
+    if rate > 0 and (not tenants or tenant in tenants) and random.random() < rate:
+        return "sampled"
+    return None
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def collapse(frame) -> tuple:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+class Profile:
+    def __init__(self, tenant: str, question: str, trigger: str):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{tenant}-{uuid.uuid4().hex[:8]}".replace("/", "_")
+        self.tenant = tenant
+        self.question = question
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples: Tally = Tally()  # (label, stack) -> count
+        self.timeline: List[tuple] = []  # (label, stack, seconds since the last sample)
+        self.max_timeline = max_samples()
+        self.dropped = 0
+        self.nodes: List[dict] = []
+        self.threads: Dict[int, str] = {}  # thread ident -> node label, while working for this request
+        self.tasks: Dict[asyncio.Task, str] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def add(self, label: str, frame, weight: float):
+        stack = collapse(frame)
+        with self._lock:
+            self.samples[(label, stack)] += 1
+            if len(self.timeline) < self.max_timeline:
+                self.timeline.append((label, stack, weight))
+            else:
+                self.dropped += 1
+
+    @contextmanager
+    def thread(self, label: str):
+        ident = threading.get_ident()
+        previous = self.threads.get(ident)
+        self.threads[ident] = label
+        try:
+            yield
+        finally:
+            if previous is None:
+                self.threads.pop(ident, None)
+            else:
+                self.threads[ident] = previous
+
+    @contextmanager
+    def task(self, label: str):
+        task = asyncio.current_task()
+        previous = self.tasks.get(task)
+        self.tasks[task] = label
+        try:
+            yield
+        finally:
+            if previous is None:
+                self.tasks.pop(task, None)
+            else:
+                self.tasks[task] = previous
+
+    # -- output -----------------------------------------------------------
+
+    def folded(self) -> str:
+        return "\n".join(f"{self.tenant};node:{label};{';'.join(stack)} {count}"
+                         for (label, stack), count in self.samples.most_common()) + "\n"
+
+    def speedscope(self) -> dict:
+        frames, index = [], {}
+        samples, weights = [], []
+        for label, stack, weight in self.timeline:
+            ids = []
+            for name in (f"node:{label}",) + stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                ids.append(index[name])
+            samples.append(ids)
+            weights.append(round(weight * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{"type": "sampled", "name": f"{self.tenant} {self.id}", "unit": "milliseconds",
+                          "startValue": 0, "endValue": round(sum(weights), 3), "samples": samples, "weights": weights}],
+            "name": self.id,
+            "exporter": "sqlagent-profiler",
+        }
+
+    def meta(self) -> dict:
+        by_node = Tally()
+        for (label, _), count in self.samples.items():
+            by_node[label] += count
+        return {
+            "id": self.id, "tenant": self.tenant, "trigger": self.trigger, "question": self.question[:200],
+            "started_at": self.started_at, "duration_ms": round(self.duration * 1000, 1),
+            "interval_ms": interval() * 1000, "samples": sum(self.samples.values()),
+            "samples_by_node": dict(by_node), "timeline_dropped": self.dropped, "nodes": self.nodes,
+        }
+
+    def save(self, directory: Optional[str] = None) -> str:
+        directory = directory or output_dir()
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+        with open(f"{base}.folded", "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f)
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(self.meta(), f, indent=2)
+        return base
+
+
+# -- sampler ------------------------------------------------------------------
+
+_profiles: set = set()
+_sampler: Optional[threading.Thread] = None
+_sampler_lock = threading.Lock()
+
+
+def _sample_loop():
+    global _sampler
+    last = time.perf_counter()
+    while True:
+        with _sampler_lock:
+            if not _profiles:
+                _sampler = None
+                return
+            profiles = list(_profiles)
+        time.sleep(interval())
+        now = time.perf_counter()
+        weight, last = now - last, now
+        frames = sys._current_frames()
+        for profile in profiles:
+            for ident, label in list(profile.threads.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.add(label, frame, weight)
+            if profile.loop is not None and profile.loop_thread not in profile.threads:
+                # Only while the loop is running one of this request's tasks, not another request's
+                task = asyncio.current_task(profile.loop)
+                label = profile.tasks.get(task) if task is not None else None
+                frame = frames.get(profile.loop_thread)
+                if label is not None and frame is not None:
+                    profile.add(label, frame, weight)
+
+
+def _start(profile: Profile):
+    global _sampler
+    with _sampler_lock:
+        _profiles.add(profile)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler", daemon=True)
+            _sampler.start()
+
+
+def _stop(profile: Profile):
+    with _sampler_lock:
+        _profiles.discard(profile)
+
+
+@asynccontextmanager
+async def profiled(tenant: str, question: str, trigger: str):
+    """Profile the enclosed graph run; yields the Profile, saved from a worker thread when the block exits."""
+    profile = Profile(tenant, question, trigger)
+    profile.loop = asyncio.get_running_loop()
+    profile.loop_thread = threading.get_ident()
+    token = _active.set(profile)
+    _start(profile)
+    try:
+        with profile.task("request"):
+            yield profile
+    finally:
+        _stop(profile)
+        _active.reset(token)
+        profile.duration = time.perf_counter() - profile.started
+        PROFILES.inc(tenant=tenant, trigger=trigger)
+        try:
+            path = await profile.loop.run_in_executor(None, profile.save)
+            log_event("profile_saved", tenant=tenant, profile=profile.id, path=path,
+                      samples=sum(profile.samples.values()), ms=round(profile.duration * 1000, 1))
+        except OSError as e:
+            log_event("profile_save_failed", tenant=tenant, profile=profile.id, error=str(e))
+
+
+# -- hooks --------------------------------------------------------------------
+
+@contextmanager
+def node(name: str, thread: bool):
+    """Around a graph node: record its timing and attribute samples of this thread (sync) or task (async)."""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    token = _node.set(name)
+    start = time.perf_counter()
+    try:
+        with (profile.thread(name) if thread else profile.task(name)):
+            yield
+    finally:
+        _node.reset(token)
+        profile.nodes.append({"node": name, "start_ms": round((start - profile.started) * 1000, 1),
+                              "ms": round((time.perf_counter() - start) * 1000, 1), "thread": thread})
+
+
+def in_thread(fn):
+    """Wrap a callable headed for a worker thread so its samples count toward the active profile."""
+    profile = _active.get()
+    if profile is None:
+        return fn
+    label = _node.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with profile.thread(label):
+            return fn(*args, **kwargs)
+
+    return run
@@ -0,0 +1,237 @@
+# query_cache.py
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, Counter
+from typing import Any, List, Optional
+
+from metrics import CACHE_EVENTS, CACHE_HIT_RATE, register_collector
+from settings import get_settings
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+# Filler words that never change what SQL a question needs; intent words (how many, list, top) are kept
+FILLER = {"a", "an", "the", "is", "are", "was", "were", "there", "please", "do", "does", "we", "our", "us",
+          "me", "i", "you", "can", "could", "would", "tell", "currently", "right", "now", "in", "total"}
+
+
+# Words two questions may differ by and still share SQL; everything else (values, names, before/after,
+# not, numbers) changes the query, so a near match needs the remaining words equal and in the same order
+STOP = {"of", "for", "to", "on", "at", "all", "any", "some", "so", "far", "just", "here", "what", "which",
+        "show", "give", "display", "get", "find", "let", "know", "see", "want", "need", "like"}
+
+
+def content_words(tokens: List[str]) -> List[str]:
+    return [t for t in tokens if t not in FILLER and t not in STOP]
+
+
+def content_key(question: str) -> Optional[str]:
+    # Questions differing only in filler and stop words share this key; a token-overlap score let
+    # "in Engineering" / "in Marketing" and "after 2020" / "before 2020" share SQL
+    words = content_words(normalize_question(question).split())
+    return " ".join(words) or None
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()  # (ns, scope, key) -> (value, expires)
+        self._scopes: dict = {}  # (ns, scope) -> set of keys
+        self._lock = threading.Lock()
+
+    def get(self, ns: str, scope: str, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get((ns, scope, key))
+            if item is None:
+                return None
+            value, expires = item
+            if expires and expires < time.time():
+                self._remove((ns, scope, key))
+                return None
+            self._data.move_to_end((ns, scope, key))
+            return value
+
+    def set(self, ns: str, scope: str, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[(ns, scope, key)] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end((ns, scope, key))
+            self._scopes.setdefault((ns, scope), set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)))
+
+    def keys(self, ns: str, scope: str) -> List[str]:
+        with self._lock:
+            return list(self._scopes.get((ns, scope), ()))
+
+    def _remove(self, full_key: tuple):
+        self._data.pop(full_key, None)
+        keys = self._scopes.get(full_key[:2])
+        if keys is not None:
+            keys.discard(full_key[2])
+            if not keys:
+                del self._scopes[full_key[:2]]
+
+
+class SqliteBackend:
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by every worker process; the timeout waits out another process's write lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (ns TEXT, scope TEXT, key TEXT, value TEXT, "
+            "expires REAL, last_access REAL, PRIMARY KEY (ns, scope, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+
+    def get(self, ns: str, scope: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE ns = ? AND scope = ? AND key = ?", (ns, scope, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] and row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE ns = ? AND scope = ? AND key = ?", (ns, scope, key))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET last_access = ? WHERE ns = ? AND scope = ? AND key = ?", (now, ns, scope, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, ns: str, scope: str, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                (ns, scope, key, json.dumps(value), now + ttl if ttl else None, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(now)
+
+    def keys(self, ns: str, scope: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM cache WHERE ns = ? AND scope = ?", (ns, scope)).fetchall()
+        return [r[0] for r in rows]
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+class QueryCache:
+    """
+    Tier 1: normalized question -> SQL. Tier 2: SQL -> result rows (with TTL). Tier 3: SQL + question -> the
+    model's answer (same TTL as the rows it was written from). All scoped by tenant and schema version.
+    """
+
+    def __init__(self, backend, near_matches: bool = True, result_ttl: float = 300):
+        self.backend = backend
+        self.near_matches = near_matches
+        self.result_ttl = result_ttl
+        self.stats = Counter()
+
+    def get_sql(self, tenant: str, version: str, question: str) -> Optional[dict]:
+        scope = f"{tenant}:{version}"
+        key = normalize_question(question)
+        hit = self.backend.get("sql", scope, key)
+        near = content_key(question) if hit is None and self.near_matches else None
+        if near is not None:
+            # Near match: one lookup of the content-word key put_sql stored next to the exact one
+            hit = self.backend.get("sql_near", scope, near)
+            if hit is not None:
+                self.stats["sql_near_hits"] += 1
+        self.stats["sql_hits" if hit is not None else "sql_misses"] += 1
+        return hit
+
+    def put_sql(self, tenant: str, version: str, question: str, statement: str, reasoning: str):
+        scope, value = f"{tenant}:{version}", {"statement": statement, "reasoning": reasoning}
+        self.backend.set("sql", scope, normalize_question(question), value)
+        near = content_key(question)
+        if self.near_matches and near is not None:
+            self.backend.set("sql_near", scope, near, value)
+
+    def get_result(self, tenant: str, version: str, statement: str) -> Optional[Any]:
+        hit = self.backend.get("result", f"{tenant}:{version}", statement.strip())
+        self.stats["result_hits" if hit is not None else "result_misses"] += 1
+        return hit
+
+    def put_result(self, tenant: str, version: str, statement: str, result: Any):
+        if self.result_ttl:
+            self.backend.set("result", f"{tenant}:{version}", statement.strip(), result, ttl=self.result_ttl)
+
+    def get_answer(self, tenant: str, version: str, statement: str, question: str) -> Optional[str]:
+        hit = self.backend.get("answer", f"{tenant}:{version}", f"{statement.strip()}\n{normalize_question(question)}")
+        self.stats["answer_hits" if hit is not None else "answer_misses"] += 1
+        return hit
+
+    def put_answer(self, tenant: str, version: str, statement: str, question: str, answer: str):
+        if self.result_ttl:
+            self.backend.set("answer", f"{tenant}:{version}", f"{statement.strip()}\n{normalize_question(question)}",
+                             answer, ttl=self.result_ttl)
+
+    def hit_rates(self) -> dict:
+        rates = {}
+        for tier in ("sql", "result", "answer"):
+            total = self.stats[f"{tier}_hits"] + self.stats[f"{tier}_misses"]
+            rates[tier] = self.stats[f"{tier}_hits"] / total if total else 0.0
+        return rates
+
+
+_cache: Optional[QueryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[QueryCache]:
+    """
+    Process-wide cache configured by QUERY_CACHE=memory|sqlite|off. With several workers the default is
+    sqlite, so every worker reads and fills the same WAL-mode file.
+    """
+    global _cache
+    kind = os.getenv("QUERY_CACHE", "sqlite" if get_settings().workers > 1 else "memory").lower()
+    if kind == "off":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_entries = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000"))
+                if kind == "sqlite":
+                    backend = SqliteBackend(os.getenv("QUERY_CACHE_PATH", ".cache/query_cache.sqlite"), max_entries)
+                else:
+                    backend = MemoryBackend(max_entries)
+                _cache = QueryCache(
+                    backend,
+                    near_matches=os.getenv("QUERY_CACHE_NEAR_MATCH", "true").lower() in ("1", "true", "yes"),
+                    result_ttl=float(os.getenv("QUERY_CACHE_RESULT_TTL", "300")),
+                )
+    return _cache
+
+
+@register_collector
+def _export_metrics():
+    if _cache is None:
+        return
+    for tier, rate in _cache.hit_rates().items():
+        CACHE_HIT_RATE.set(rate, tier=tier)
+    for event, count in _cache.stats.items():
+        CACHE_EVENTS.set(count, event=event)
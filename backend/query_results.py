@@ -0,0 +1,71 @@
+# query_results.py
+import os
+import re
+from typing import Optional
+
+from sqlalchemy import text
+from langchain_community.utilities import SQLDatabase
+
+from states import ResultSet
+from sql_guard import guarded
+
+TOP_PATTERN = re.compile(r"^\s*select\s+((distinct|all)\s+)?top\s*\(?\s*\d+", re.I)
+SELECT_PATTERN = re.compile(r"^(\s*select\s+(?:(?:distinct|all)\s+)?)", re.I)
+LIMIT_PATTERN = re.compile(r"\blimit\s+\d+(\s*,\s*\d+)?(\s+offset\s+\d+)?\s*$", re.I)
+# T-SQL paging; SQL Server rejects TOP next to it, and fetchmany(limit + 1) bounds the rows anyway
+OFFSET_PATTERN = re.compile(r"\boffset\s+\d+\s+rows?\b(\s+fetch\s+(first|next)\s+\d+\s+rows?\s+only)?\s*$", re.I)
+ORDER_BY_PATTERN = re.compile(r"\border\s+by\s+[^()]*$", re.I)
+
+
+def max_rows() -> int:
+    return int(os.getenv("QUERY_MAX_ROWS", "500"))
+
+
+def limit_statement(statement: str, dialect: str, limit: int) -> str:
+    """Add a server-side row cap (TOP for T-SQL, LIMIT elsewhere) unless the query already has one."""
+    stmt = statement.strip().rstrip(";").strip()
+    if dialect == "mssql":
+        if TOP_PATTERN.match(stmt) or OFFSET_PATTERN.search(stmt) or not SELECT_PATTERN.match(stmt):
+            return stmt
+        return SELECT_PATTERN.sub(rf"\1TOP {limit} ", stmt, count=1)
+    if LIMIT_PATTERN.search(stmt) or not re.match(r"^\s*(select|with)\b", stmt, re.I):
+        return stmt
+    return f"{stmt} LIMIT {limit}"
+
+
+def count_statement(statement: str) -> Optional[str]:
+    """COUNT(*) over the statement, or None when its own LIMIT/OFFSET makes the count unknowable this way."""
+    stmt = statement.strip().rstrip(";").strip()
+    # Stripping the ORDER BY below would take a trailing LIMIT or OFFSET ... FETCH with it
+    if LIMIT_PATTERN.search(stmt) or OFFSET_PATTERN.search(stmt):
+        return None
+    # ORDER BY is meaningless for a count and invalid inside a T-SQL derived table
+    stmt = ORDER_BY_PATTERN.sub("", stmt).strip()
+    return f"SELECT COUNT(*) FROM ({stmt}) AS counted_rows"
+
+
+def fetch_result(db: SQLDatabase, statement: str, limit: int = None, engine=None) -> ResultSet:
+    """
+    Run a statement with a row cap, the execution guard and a streamed cursor so memory stays bounded.
+    engine picks a replica of the database; the default is db's own (primary) engine.
+    """
+    limit = limit or max_rows()
+    capped = limit_statement(statement, db.dialect, limit + 1)
+    engine = engine if engine is not None else db._engine
+    with engine.connect() as conn, guarded(conn, capped, db.dialect):
+        cursor = conn.execution_options(stream_results=True).execute(text(capped))
+        if not cursor.returns_rows:
+            return ResultSet()
+        columns = list(cursor.keys())
+        rows = [tuple(row) for row in cursor.fetchmany(limit + 1)]
+        cursor.close()
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        total = None if truncated else len(rows)
+        counting = count_statement(statement) if truncated else None
+        if counting and os.getenv("QUERY_COUNT_TOTAL", "true").lower() in ("1", "true", "yes"):
+            try:
+                total = conn.execute(text(counting)).scalar()
+            except Exception as e:
+                print(f"Could not count total rows: {e}")
+    return ResultSet(columns=columns, rows=rows, total_rows=total, truncated=truncated)
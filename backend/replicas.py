@@ -0,0 +1,178 @@
+# replicas.py
+"""
+Read-replica routing for generated SQL. Every statement is a read-only SELECT, so execute_query can
+run on any replica of the tenant's database:
+
+    pick       least outstanding requests among replicas whose breaker allows traffic
+    breaker    REPLICA_FAILURE_THRESHOLD consecutive connection failures open it for REPLICA_COOLDOWN
+               seconds; then one probe request decides between closed and open again
+    failover   a connection failure moves the statement to the next replica, and to the primary
+               when no replica is left (REPLICA_FALLBACK_PRIMARY)
+
+Statement errors (syntax, unknown column, guard rejections) are the query's fault, not the node's:
+they are raised as-is and never trip a breaker.
+"""
+import os
+import re
+import time
+import random
+import threading
+from typing import Callable, List, Optional
+
+from sql_guard import QueryRejected
+from metrics import Counter, Gauge, register, register_collector, log_event
+
+REPLICA_REQUESTS = register(Counter("sqlagent_replica_requests_total", "Statements by endpoint",
+                                    ("tenant", "endpoint", "outcome")))
+REPLICA_OUTSTANDING = register(Gauge("sqlagent_replica_outstanding", "Statements running per endpoint", ("tenant", "endpoint")))
+REPLICA_BREAKER = register(Gauge("sqlagent_replica_breaker_open", "1 while an endpoint's circuit breaker is open",
+                                 ("tenant", "endpoint")))
+
+CONNECTION_ERRORS = re.compile(
+    r"can'?t connect|could not connect|connection refused|lost connection|server has gone away|"
+    r"communication link failure|login timeout|unable to open database file|connection reset|"
+    r"name or service not known|\b08001\b|\b08S01\b|\(2003\b|\(2006\b|\(2013\b", re.I)
+
+
+class NoHealthyEndpoint(Exception):
+    def __init__(self, tenant: str, retry_after: float):
+        super().__init__(f"The database for {tenant} is unavailable right now, please try again shortly")
+        self.tenant = tenant
+        self.retry_after = retry_after
+
+
+def is_connection_error(error: Exception) -> bool:
+    if isinstance(error, QueryRejected):
+        return False
+    return bool(getattr(error, "connection_invalidated", False)) or bool(CONNECTION_ERRORS.search(str(error)))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """True if a request may go through; claims the single probe when the cooldown is over."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self) -> bool:
+        """Record a connection failure; True if this opened (or re-opened) the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return True
+            return False
+
+
+class Endpoint:
+    def __init__(self, name: str, engine, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.engine = engine
+        self.breaker = breaker or CircuitBreaker()
+        self.outstanding = 0
+
+
+class ReplicaSet:
+    """The replicas of one tenant database plus its primary, used only when no replica can serve."""
+
+    def __init__(self, tenant: str, replicas: List[Endpoint], primary=None, fallback_primary: bool = True):
+        self.tenant = tenant
+        self.replicas = replicas
+        self.primary = Endpoint("primary", primary, breaker_from_env()) if primary is not None else None
+        self.fallback_primary = fallback_primary
+        self._lock = threading.Lock()
+        _sets.add(self)
+
+    def pick(self, exclude: set) -> Optional[Endpoint]:
+        with self._lock:
+            ranked = sorted((r for r in self.replicas if r.name not in exclude),
+                            key=lambda r: (r.outstanding, random.random()))
+        for replica in ranked:
+            if replica.breaker.allow():
+                return replica
+        return None
+
+    def run(self, fn: Callable):
+        """fn(engine) on the least busy healthy replica, failing over on connection errors."""
+        tried = set()
+        while True:
+            endpoint = self.pick(tried)
+            if endpoint is None:
+                if self.primary is None or not self.fallback_primary or "primary" in tried:
+                    REPLICA_REQUESTS.inc(tenant=self.tenant, endpoint="none", outcome="unavailable")
+                    raise NoHealthyEndpoint(self.tenant, self.retry_after())
+                endpoint = self.primary
+            tried.add(endpoint.name)
+            with self._lock:
+                endpoint.outstanding += 1
+            try:
+                result = fn(endpoint.engine)
+            except Exception as e:
+                if not is_connection_error(e):
+                    endpoint.breaker.success()
+                    REPLICA_REQUESTS.inc(tenant=self.tenant, endpoint=endpoint.name, outcome="statement_error")
+                    raise
+                opened = endpoint.breaker.failure()
+                REPLICA_REQUESTS.inc(tenant=self.tenant, endpoint=endpoint.name, outcome="connection_error")
+                log_event("replica_failed", tenant=self.tenant, endpoint=endpoint.name, breaker_open=opened, error=str(e))
+                continue
+            finally:
+                with self._lock:
+                    endpoint.outstanding -= 1
+            endpoint.breaker.success()
+            REPLICA_REQUESTS.inc(tenant=self.tenant, endpoint=endpoint.name, outcome="ok")
+            return result
+
+    def retry_after(self) -> float:
+        """Seconds until the first open breaker allows a probe."""
+        now = time.monotonic()
+        waits = [e.breaker.cooldown - (now - e.breaker.opened_at) for e in self.endpoints() if e.breaker.opened_at is not None]
+        return max(1.0, min(waits)) if waits else 1.0
+
+    def endpoints(self) -> List[Endpoint]:
+        return self.replicas + ([self.primary] if self.primary is not None else [])
+
+    def close(self):
+        # The primary engine belongs to the tenant's SQLDatabase and is disposed with it
+        _sets.discard(self)
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+
+_sets: set = set()
+
+
+def breaker_from_env() -> CircuitBreaker:
+    return CircuitBreaker(threshold=int(os.getenv("REPLICA_FAILURE_THRESHOLD", "3")),
+                          cooldown=float(os.getenv("REPLICA_COOLDOWN", "30")))
+
+
+@register_collector
+def _export_metrics():
+    for replica_set in list(_sets):
+        for endpoint in replica_set.endpoints():
+            REPLICA_OUTSTANDING.set(endpoint.outstanding, tenant=replica_set.tenant, endpoint=endpoint.name)
+            REPLICA_BREAKER.set(1 if endpoint.breaker.open else 0, tenant=replica_set.tenant, endpoint=endpoint.name)
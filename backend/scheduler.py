@@ -0,0 +1,193 @@
+# scheduler.py
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from metrics import Counter, Gauge, Histogram, register, log_event
+
+QUEUE_DEPTH = register(Gauge("sqlagent_queue_depth", "Requests waiting for a slot", ("tenant",)))
+QUEUE_RUNNING = register(Gauge("sqlagent_queue_running", "Requests holding a slot", ("tenant",)))
+QUEUE_WAIT_SECONDS = register(Histogram("sqlagent_queue_wait_seconds", "Time spent waiting for a slot", ("tenant",)))
+QUEUE_REJECTED = register(Counter("sqlagent_queue_rejected_total", "Requests rejected with 429", ("tenant",)))
+STAGE_TIMEOUTS = register(Counter("sqlagent_stage_timeouts_total", "Stages cancelled at their deadline", ("stage",)))
+
+
+class Overloaded(Exception):
+    def __init__(self, tenant: str, retry_after: float):
+        super().__init__(f"Too many queued requests for {tenant}")
+        self.tenant = tenant
+        self.retry_after = retry_after
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"{stage} stage exceeded its {seconds:g}s deadline")
+        self.stage = stage
+        self.seconds = seconds
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    # TENANT_WEIGHTS="acme=3,globex=0.5"
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        try:
+            weights[name.strip()] = max(float(weight), 0.01)
+        except ValueError:
+            print(f"Ignoring bad TENANT_WEIGHTS entry: {item}")
+    return weights
+
+
+class TenantQueue:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.running = 0
+        # Virtual time of this tenant's next dispatch; advances by 1/weight per request
+        self.vtime = 0.0
+
+
+class FairScheduler:
+    """
+    Admission control for graph runs: global and per-tenant concurrency caps, per-tenant FIFO queues
+    served by weighted fair (stride) scheduling, and 429s once a tenant's queue is too deep.
+    """
+
+    def __init__(self, global_limit: int, tenant_limit: int, max_depth: int, max_total_depth: int,
+                 weights: Optional[Dict[str, float]] = None):
+        self.global_limit = global_limit
+        self.tenant_limit = tenant_limit
+        self.max_depth = max_depth
+        self.max_total_depth = max_total_depth
+        self.weights = weights or {}
+        self.tenants: Dict[str, TenantQueue] = {}
+        self.running = 0
+        self.waiting = 0
+        self.vtime = 0.0
+        # EWMA of slot hold time, used for Retry-After
+        self.service_time = 1.0
+
+    def _tenant(self, tenant: str) -> TenantQueue:
+        queue = self.tenants.get(tenant)
+        if queue is None:
+            queue = self.tenants[tenant] = TenantQueue(self.weights.get(tenant, 1.0))
+        return queue
+
+    def retry_after(self, tenant: str) -> float:
+        queue = self._tenant(tenant)
+        share = max(1, min(self.tenant_limit, self.global_limit))
+        return max(1.0, round((len(queue.waiters) + 1) * self.service_time / share, 1))
+
+    def check(self, tenant: str):
+        """Raise Overloaded if a new request for this tenant would exceed the queue limits."""
+        queue = self._tenant(tenant)
+        if self._can_run(queue) and not queue.waiters:
+            return
+        if len(queue.waiters) >= self.max_depth or self.waiting >= self.max_total_depth:
+            QUEUE_REJECTED.inc(tenant=tenant)
+            retry = self.retry_after(tenant)
+            log_event("request_rejected", tenant=tenant, queued=len(queue.waiters), retry_after=retry)
+            raise Overloaded(tenant, retry)
+
+    def _can_run(self, queue: TenantQueue) -> bool:
+        return self.running < self.global_limit and queue.running < self.tenant_limit
+
+    def _start(self, tenant: str, queue: TenantQueue):
+        self.running += 1
+        queue.running += 1
+        self.vtime = max(self.vtime, queue.vtime)
+        queue.vtime = max(queue.vtime, self.vtime) + 1.0 / queue.weight
+        QUEUE_RUNNING.set(queue.running, tenant=tenant)
+
+    def _dispatch(self):
+        while self.running < self.global_limit:
+            ready = [(q.vtime, name, q) for name, q in self.tenants.items()
+                     if q.waiters and q.running < self.tenant_limit]
+            if not ready:
+                return
+            _, name, queue = min(ready, key=lambda item: item[0])
+            waiter = queue.waiters.popleft()
+            self.waiting -= 1
+            QUEUE_DEPTH.set(len(queue.waiters), tenant=name)
+            if waiter.done():
+                continue
+            self._start(name, queue)
+            waiter.set_result(None)
+
+    async def acquire(self, tenant: str):
+        self.check(tenant)
+        queue = self._tenant(tenant)
+        start = time.perf_counter()
+        if self._can_run(queue) and not queue.waiters:
+            # An idle tenant rejoins at the current virtual time instead of spending banked credit
+            queue.vtime = max(queue.vtime, self.vtime)
+            self._start(tenant, queue)
+        else:
+            if not queue.waiters and not queue.running:
+                queue.vtime = max(queue.vtime, self.vtime)
+            waiter = asyncio.get_running_loop().create_future()
+            queue.waiters.append(waiter)
+            self.waiting += 1
+            QUEUE_DEPTH.set(len(queue.waiters), tenant=tenant)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Granted just as we were cancelled: hand the slot on
+                    self.release(tenant)
+                elif waiter in queue.waiters:
+                    queue.waiters.remove(waiter)
+                    self.waiting -= 1
+                    QUEUE_DEPTH.set(len(queue.waiters), tenant=tenant)
+                raise
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, tenant=tenant)
+
+    def release(self, tenant: str, held: Optional[float] = None):
+        queue = self._tenant(tenant)
+        self.running -= 1
+        queue.running -= 1
+        QUEUE_RUNNING.set(queue.running, tenant=tenant)
+        if held is not None:
+            self.service_time = 0.9 * self.service_time + 0.1 * held
+        self._dispatch()
+        if not queue.running and not queue.waiters and len(self.tenants) > 1024:
+            del self.tenants[tenant]
+
+    @asynccontextmanager
+    async def slot(self, tenant: str):
+        await self.acquire(tenant)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(tenant, time.perf_counter() - start)
+
+
+scheduler = FairScheduler(
+    global_limit=int(os.getenv("MAX_CONCURRENT_REQUESTS", "512")),
+    tenant_limit=int(os.getenv("MAX_CONCURRENT_REQUESTS_PER_TENANT", "64")),
+    max_depth=int(os.getenv("MAX_QUEUED_REQUESTS_PER_TENANT", "256")),
+    max_total_depth=int(os.getenv("MAX_QUEUED_REQUESTS", "4096")),
+    weights=parse_weights(os.getenv("TENANT_WEIGHTS", "")),
+)
+
+
+def stage_deadline(stage: str) -> Optional[float]:
+    # LLM_STAGE_TIMEOUT / SQL_STAGE_TIMEOUT, seconds; 0 disables
+    value = float(os.getenv(f"{stage.upper()}_STAGE_TIMEOUT", {"llm": "60", "sql": "30"}.get(stage, "0")))
+    return value or None
+
+
+async def with_deadline(stage: str, awaitable):
+    """Await the stage, cancelling it and raising StageTimeout once its deadline passes."""
+    seconds = stage_deadline(stage)
+    if seconds is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=seconds)
+    except asyncio.TimeoutError:
+        STAGE_TIMEOUTS.inc(stage=stage)
+        raise StageTimeout(stage, seconds) from None
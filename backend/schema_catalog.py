@@ -0,0 +1,263 @@
+# schema_catalog.py
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, select, text
+from langchain_community.utilities import SQLDatabase
+
+from metrics import DB_REFLECT_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, each worker may reflect on its own
+    fcntl = None
+
+
+# Per-table DDL fingerprints. Only run by the background refresh, never on the request path.
+SIGNATURE_QUERIES = {
+    "mysql": (
+        "SELECT TABLE_NAME, MD5(GROUP_CONCAT(COLUMN_NAME, ':', COLUMN_TYPE, ':', IS_NULLABLE, ':', COLUMN_KEY "
+        "ORDER BY ORDINAL_POSITION)) FROM INFORMATION_SCHEMA.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() GROUP BY TABLE_NAME"
+    ),
+    "mssql": (
+        "SELECT t.name, CONVERT(varchar(33), t.modify_date, 126) FROM sys.tables t "
+        "WHERE SCHEMA_NAME(t.schema_id) = SCHEMA_NAME()"
+    ),
+    "sqlite": "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'",
+}
+
+
+def _plain(value):
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return str(value)[:100]
+
+
+class SchemaCatalog:
+    """
+    In-memory (and on-disk) snapshot of a tenant's tables, columns, keys and sample rows. The file is
+    shared by every worker process: one builds or refreshes it under a file lock, the others reuse it.
+    """
+
+    def __init__(self, key: str, db: SQLDatabase, cache_dir: Optional[str] = None,
+                 refresh_interval: float = 300, sample_rows: int = 3):
+        self.key = key
+        self.db = db
+        self.dialect = db.dialect
+        self.cache_dir = cache_dir or os.getenv("CATALOG_DIR", ".catalog_cache")
+        self.refresh_interval = refresh_interval
+        self.sample_rows = sample_rows
+        self._snapshot: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._columns = None
+
+    # -- hot path ---------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    # Another worker may be reflecting the same database; wait for it and load its file
+                    with self._shared_lock():
+                        self._snapshot = self._load()
+                        if self._snapshot is None:
+                            self._snapshot = self._build(self._signatures() or self._snapshot_tables(), None)
+                            self._save()
+        if time.time() - self._snapshot["checked_at"] > self.refresh_interval:
+            self.refresh_in_background()
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self.snapshot()["version"]
+
+    def table_names(self) -> List[str]:
+        return sorted(self.snapshot()["tables"])
+
+    def table(self, name: str) -> dict:
+        return self.snapshot()["tables"][name]
+
+    def columns(self) -> Dict[str, List[str]]:
+        snapshot = self.snapshot()
+        if self._columns is None or self._columns[0] != snapshot["version"]:
+            self._columns = (snapshot["version"], {
+                name: [c["name"] for c in table["columns"]] for name, table in snapshot["tables"].items()
+            })
+        return self._columns[1]
+
+    def tables_info(self, names: List[str]) -> str:
+        tables = self.snapshot()["tables"]
+        return "\n\n".join(tables[n]["info"] for n in names if n in tables)
+
+    # -- refresh ----------------------------------------------------------
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_worker, name=f"catalog-refresh-{self.key}", daemon=True).start()
+
+    def _refresh_worker(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"❌ Schema catalog refresh failed for {self.key}: {e}")
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        with self._shared_lock():
+            shared = self._read()
+            if shared is not None and time.time() - shared["checked_at"] < self.refresh_interval:
+                # A sibling worker checked the live schema moments ago
+                self._snapshot = shared
+                return
+            if shared is not None and (self._snapshot is None or shared["checked_at"] > self._snapshot["checked_at"]):
+                self._snapshot = shared
+            self._refresh()
+
+    def _refresh(self):
+        signatures = self._signatures()
+        old = self._snapshot
+        if old is None or signatures is None:
+            snapshot = self._build(signatures or self._snapshot_tables(), None)
+        else:
+            changed = [t for t, sig in signatures.items() if old["tables"].get(t, {}).get("signature") != sig]
+            removed = set(old["tables"]) - set(signatures)
+            if not changed and not removed:
+                self._snapshot = {**old, "checked_at": time.time()}
+                self._save()
+                return
+            print(f"Schema change detected for {self.key}: {len(changed)} changed, {len(removed)} removed")
+            snapshot = self._build({t: signatures[t] for t in changed}, old, keep=set(signatures))
+        self._snapshot = snapshot
+        self._save()
+
+    def _signatures(self) -> Optional[Dict[str, str]]:
+        query = SIGNATURE_QUERIES.get(self.dialect)
+        if query is None:
+            return None
+        with self.db._engine.connect() as conn:
+            rows = conn.execute(text(query)).fetchall()
+        return {
+            name: hashlib.sha1(str(sig).encode()).hexdigest()
+            for name, sig in rows if self._usable(name)
+        }
+
+    def _usable(self, name: str) -> bool:
+        if self.db._include_tables:
+            return name in self.db._include_tables
+        return name not in self.db._ignore_tables
+
+    def _snapshot_tables(self) -> Dict[str, Optional[str]]:
+        return {name: None for name in self.db.get_usable_table_names()}
+
+    def _build(self, tables: Dict[str, Optional[str]], old: Optional[dict], keep: Optional[set] = None) -> dict:
+        start = time.perf_counter()
+        self._reflect(list(tables))
+        inspector = inspect(self.db._engine)
+        entries = {t: e for t, e in (old or {}).get("tables", {}).items() if keep is None or t in keep}
+        for name, signature in tables.items():
+            entries[name] = self._describe(inspector, name, signature)
+        version = hashlib.sha1(
+            json.dumps({t: e["signature"] or e["info"] for t, e in sorted(entries.items())}).encode()
+        ).hexdigest()[:16]
+        elapsed = time.perf_counter() - start
+        DB_REFLECT_SECONDS.observe(elapsed, tenant=self.key)
+        print(f"Schema catalog for {self.key}: reflected {len(tables)} table(s) in {elapsed:.2f}s")
+        now = time.time()
+        return {"key": self.key, "dialect": self.dialect, "version": version,
+                "built_at": now, "checked_at": now, "tables": entries}
+
+    def _reflect(self, names: List[str]):
+        # SQLDatabase reflects once at construction; keep its metadata in step with DDL changes
+        if not names:
+            return
+        metadata = self.db._metadata
+        for name in names:
+            table = metadata.tables.get(name if not self.db._schema else f"{self.db._schema}.{name}")
+            if table is not None:
+                metadata.remove(table)
+        metadata.reflect(bind=self.db._engine, only=names, schema=self.db._schema, views=self.db._view_support)
+        self.db._all_tables = set(self.db._all_tables) | set(names)
+
+    def _describe(self, inspector, name: str, signature: Optional[str]) -> dict:
+        schema = self.db._schema
+        columns = inspector.get_columns(name, schema=schema)
+        pk = inspector.get_pk_constraint(name, schema=schema).get("constrained_columns") or []
+        fks = [
+            {"columns": fk["constrained_columns"], "referred_table": fk["referred_table"],
+             "referred_columns": fk["referred_columns"]}
+            for fk in inspector.get_foreign_keys(name, schema=schema)
+        ]
+        try:
+            comment = inspector.get_table_comment(name, schema=schema).get("text") or ""
+        except NotImplementedError:
+            comment = ""
+        sample = []
+        if self.sample_rows:
+            table = self.db._metadata.tables[name if not schema else f"{schema}.{name}"]
+            try:
+                with self.db._engine.connect() as conn:
+                    rows = conn.execute(select(table).limit(self.sample_rows)).fetchall()
+                sample = [[_plain(v) for v in row] for row in rows]
+            except Exception:
+                sample = []
+        return {
+            "columns": [{"name": c["name"], "type": str(c["type"]), "comment": c.get("comment") or ""} for c in columns],
+            "primary_key": pk,
+            "foreign_keys": fks,
+            "comment": comment,
+            "sample_rows": sample,
+            "info": self.db.get_table_info_no_throw([name]),
+            "signature": signature,
+        }
+
+    # -- persistence ------------------------------------------------------
+
+    def _path(self) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.key)
+        return os.path.join(self.cache_dir, f"{safe}.json")
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self._path(), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return snapshot if snapshot.get("key") == self.key else None
+
+    def _load(self) -> Optional[dict]:
+        snapshot = self._read()
+        if snapshot is not None:
+            # Kept checked_at: a stale file is validated against the live schema in the background
+            print(f"Loaded schema catalog for {self.key} from {self._path()}")
+        return snapshot
+
+    @contextmanager
+    def _shared_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(f"{self._path()}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{self._path()}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._snapshot, f)
+        os.replace(tmp, self._path())
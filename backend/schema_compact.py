@@ -0,0 +1,188 @@
+# schema_compact.py
+"""
+Compact schema text for the query-generation prompts.
+
+Instead of full CREATE TABLE DDL plus sample rows, each table becomes one line such as
+
+    employee_information(EmployeeID INTEGER PK, first_name TEXT, department_id INTEGER FK->departments.department_id)
+      e.g. first_name: John | Maria; department_id: 3 | 7
+
+Columns are pruned to the keys and the ones the question mentions, and the whole block is kept
+under SCHEMA_TOKEN_BUDGET (estimated at ~4 characters per token).
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from table_index import tokenize
+from metrics import Counter, register
+
+SCHEMA_TOKENS = register(Counter("sqlagent_schema_tokens_total", "Estimated schema prompt tokens", ("kind",)))
+
+QUOTES = {"mysql": "`{}`", "mssql": "[{}]"}
+
+
+def enabled() -> bool:
+    return os.getenv("SCHEMA_COMPACT", "1").lower() not in ("0", "false", "no")
+
+
+def token_budget() -> int:
+    return int(os.getenv("SCHEMA_TOKEN_BUDGET", "1500"))
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _quote(name: str, dialect: str) -> str:
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+        return name
+    return QUOTES.get(dialect, '"{}"').format(name)
+
+
+def _short_type(type_name: str) -> str:
+    # VARCHAR(255) COLLATE "utf8mb4_bin" -> VARCHAR
+    return re.sub(r"\(.*?\)|\s+COLLATE.*$", "", type_name or "").strip() or "?"
+
+
+def _value(value, width: int) -> str:
+    text = " ".join(str(value).split())
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def relevant_columns(table: dict, terms: set, keep_all: int) -> Tuple[str, ...]:
+    """Keys plus the columns the question mentions (by name, comment or sample value), in table order."""
+    columns = table["columns"]
+    if len(columns) <= keep_all:
+        return tuple(c["name"] for c in columns)
+    keys = set(table.get("primary_key") or [])
+    for fk in table.get("foreign_keys") or []:
+        keys.update(fk["columns"])
+    names = [c["name"] for c in columns]
+    matched = set()
+    for i, column in enumerate(columns):
+        words = set(tokenize(column["name"])) | set(tokenize(column.get("comment", "")))
+        for row in table.get("sample_rows") or []:
+            if i < len(row) and isinstance(row[i], str):
+                words.update(tokenize(row[i]))
+        if words & terms:
+            matched.add(column["name"])
+    picked = keys | matched
+    # Fill with leading columns (usually names and descriptive fields) so the model has some context
+    for name in names:
+        if len(picked) >= keep_all:
+            break
+        picked.add(name)
+    return tuple(n for n in names if n in picked)
+
+
+def render_table(name: str, table: dict, columns: Tuple[str, ...], dialect: str,
+                 samples: int, width: int) -> str:
+    pk = set(table.get("primary_key") or [])
+    fk = {}
+    for ref in table.get("foreign_keys") or []:
+        for col, target in zip(ref["columns"], ref["referred_columns"]):
+            fk[col] = f"{ref['referred_table']}.{target}"
+    by_name = {c["name"]: (i, c) for i, c in enumerate(table["columns"])}
+    parts = []
+    for col in columns:
+        _, column = by_name[col]
+        part = f"{_quote(col, dialect)} {_short_type(column['type'])}"
+        if col in pk:
+            part += " PK"
+        if col in fk:
+            part += f" FK->{fk[col]}"
+        parts.append(part)
+    hidden = len(table["columns"]) - len(columns)
+    if hidden:
+        parts.append(f"+{hidden} more")
+    line = f"{_quote(name, dialect)}({', '.join(parts)})"
+    if table.get("comment"):
+        line += f"  -- {_value(table['comment'], 80)}"
+    if samples:
+        examples = []
+        for col in columns:
+            if col in pk:
+                continue
+            i, _ = by_name[col]
+            seen = []
+            for row in table.get("sample_rows") or []:
+                value = row[i] if i < len(row) else None
+                if value is None or value == "":
+                    continue
+                value = _value(value, width)
+                if value not in seen:
+                    seen.append(value)
+                if len(seen) == samples:
+                    break
+            if seen:
+                examples.append(f"{col}: {' | '.join(seen)}")
+        if examples:
+            line += "\n  e.g. " + "; ".join(examples)
+    return line
+
+
+class SchemaCompactor:
+    """Memoized compaction; entries are keyed by tenant, schema version and the exact pruned column sets."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._memo: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compact(self, catalog, names: List[str], question: str, budget: Optional[int] = None) -> str:
+        budget = budget or token_budget()
+        snapshot = catalog.snapshot()
+        tables = snapshot["tables"]
+        names = [n for n in names if n in tables]
+        terms = set(tokenize(question))
+        keep_all = int(os.getenv("SCHEMA_MAX_COLUMNS", "8"))
+        plan = tuple((n, relevant_columns(tables[n], terms, keep_all)) for n in names)
+        key = (catalog.key, snapshot["version"], plan, budget)
+        with self._lock:
+            text = self._memo.get(key)
+            if text is not None:
+                self._memo.move_to_end(key)
+                return text
+        text = self._render(tables, plan, terms, snapshot.get("dialect", ""), budget)
+        full = sum(estimate_tokens(tables[n]["info"]) for n in names)
+        SCHEMA_TOKENS.inc(full, kind="full")
+        SCHEMA_TOKENS.inc(estimate_tokens(text), kind="compact")
+        with self._lock:
+            self._memo[key] = text
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return text
+
+    def _render(self, tables: dict, plan: tuple, terms: set, dialect: str, budget: int) -> str:
+        samples = int(os.getenv("SCHEMA_SAMPLE_VALUES", "3"))
+        width = int(os.getenv("SCHEMA_SAMPLE_WIDTH", "24"))
+
+        def render(plan, samples):
+            return "\n".join(render_table(n, tables[n], cols, dialect, samples, width) for n, cols in plan)
+
+        # Shed detail until the block fits: fewer samples, no samples, keys and matched columns only,
+        # then trailing (lowest-ranked) tables
+        text = render(plan, samples)
+        for fewer in range(samples - 1, -1, -1):
+            if estimate_tokens(text) <= budget:
+                return text
+            text = render(plan, fewer)
+        if estimate_tokens(text) > budget:
+            plan = tuple((n, relevant_columns(tables[n], terms, 0) or cols[:1]) for n, cols in plan)
+            text = render(plan, 0)
+        while estimate_tokens(text) > budget and len(plan) > 1:
+            plan = plan[:-1]
+            text = render(plan, 0)
+        if estimate_tokens(text) > budget:
+            text = text[:budget * 4 - 1] + "…"
+        return text
+
+
+_compactor = SchemaCompactor()
+
+
+def compact_tables_info(catalog, names: List[str], question: str, budget: Optional[int] = None) -> str:
+    return _compactor.compact(catalog, names, question, budget)
@@ -0,0 +1,99 @@
+# settings.py
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from set_api_keys import set_env
+
+TRUE = ("1", "true", "yes")
+
+
+def _flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in TRUE
+
+
+def _workers() -> int:
+    value = os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", "1")).lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(int(value), 1)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Startup configuration, read from the environment (and .env) once per process."""
+
+    groq_api_key: Optional[str]
+    langchain_tracing: bool
+    langchain_api_key: Optional[str]
+    langchain_project: str
+    db_backend: str
+    checkpointer: str
+    speculative_graph: bool
+    preload: bool
+    host: str
+    port: int
+    workers: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        langchain_api_key = os.getenv("LANGCHAIN_API_KEY")
+        # Tracing is opt-in: explicit LANGCHAIN_TRACING_V2, or implied by having a LangSmith key
+        tracing = os.getenv("LANGCHAIN_TRACING_V2")
+        backend = os.getenv("DB_BACKEND") or ("azure" if _flag("USE_AZURE", "true") else "mysql")
+        return cls(
+            groq_api_key=os.getenv("GROQ_API_KEY"),
+            langchain_tracing=tracing.lower() in TRUE if tracing else bool(langchain_api_key),
+            langchain_api_key=langchain_api_key,
+            langchain_project=os.getenv("LANGCHAIN_PROJECT", "sql-llm-agent-tracker"),
+            db_backend=backend.lower(),
+            checkpointer=os.getenv("CHECKPOINTER", "sqlite").lower(),
+            speculative_graph=_flag("SPECULATIVE_GRAPH"),
+            preload=_flag("PRELOAD_MODULES"),
+            host=os.getenv("HOST", "0.0.0.0"),
+            port=int(os.getenv("PORT", "8181")),
+            workers=_workers(),
+        )
+
+
+_settings: Optional[Settings] = None
+_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                load_dotenv()
+                _settings = Settings.from_env()
+    return _settings
+
+
+def reset_settings():
+    """Re-read the environment on next access (benchmarks and scripts that change env vars)."""
+    global _settings
+    with _lock:
+        _settings = None
+
+
+def configure_environment(settings: Settings, interactive: Optional[bool] = None):
+    """
+    Export the settings LangChain reads from os.environ. Missing keys are prompted for only on an
+    interactive terminal; servers and pre-forked workers never block on getpass.
+    """
+    if interactive is None:
+        interactive = sys.stdin is not None and sys.stdin.isatty()
+    if interactive:
+        set_env("GROQ_API_KEY")
+    elif not settings.groq_api_key:
+        print("⚠️ GROQ_API_KEY is not set; LLM calls will fail until it is")
+    os.environ["LANGCHAIN_TRACING_V2"] = "true" if settings.langchain_tracing else "false"
+    if settings.langchain_tracing:
+        if interactive:
+            set_env("LANGCHAIN_API_KEY")
+        os.environ.setdefault("LANGCHAIN_PROJECT", settings.langchain_project)
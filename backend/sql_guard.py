@@ -0,0 +1,248 @@
+# sql_guard.py
+"""
+Execution guard for generated SQL: estimate the plan cost before running a statement, refuse
+the expensive ones, and run the rest under a server-side time limit.
+
+    MySQL      EXPLAIN FORMAT=JSON query_cost       SET SESSION MAX_EXECUTION_TIME
+    Azure SQL  SHOWPLAN_XML StatementSubtreeCost    SET QUERY_GOVERNOR_COST_LIMIT + ODBC query timeout
+    SQLite     EXPLAIN QUERY PLAN (rows of scanned tables)   progress handler
+"""
+import os
+import re
+import time
+import json
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from metrics import Counter, Histogram, register, log_event
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # aliases are then read from FROM/JOIN clauses with a regex
+    sqlglot = None
+
+SQL_GUARD = register(Counter("sqlagent_sql_guard_total", "Execution guard outcomes", ("dialect", "outcome")))
+SQL_PLAN_COST = register(Histogram("sqlagent_sql_plan_cost", "Estimated plan cost of generated SQL", ("dialect",),
+                                   buckets=(10, 100, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)))
+
+# Cost units differ: MySQL and the SQLite estimate are roughly rows touched, T-SQL is optimizer units
+DEFAULT_MAX_COST = {"mysql": 5e6, "sqlite": 5e7, "mssql": 200.0}
+TIMEOUT_ERRORS = re.compile(r"max(imum)?[_ ]statement[_ ]execution[_ ]time|execution was interrupted|"
+                            r"\binterrupted\b|query timeout expired|HYT00|timeout expired", re.I)
+
+
+class PlanEstimate(BaseModel):
+    cost: Optional[float] = Field(None, description="Estimated cost in the dialect's units")
+    rows: Optional[float] = Field(None, description="Estimated rows produced")
+    full_scans: List[str] = Field(default_factory=list, description="Tables read without an index")
+
+
+class QueryRejected(Exception):
+    """Raised instead of running a statement; the message is written for the fix-query prompt."""
+
+
+def enabled() -> bool:
+    return os.getenv("SQL_GUARD", "true").lower() in ("1", "true", "yes")
+
+
+def max_cost(dialect: str) -> float:
+    value = os.getenv(f"SQL_MAX_COST_{dialect.upper()}", os.getenv("SQL_MAX_COST"))
+    return float(value) if value else DEFAULT_MAX_COST.get(dialect, 5e6)
+
+
+def execution_timeout() -> float:
+    # Below SQL_STAGE_TIMEOUT so the database gives up first and reports a real error
+    return float(os.getenv("SQL_EXECUTION_TIMEOUT", "25"))
+
+
+# -- plan estimates -------------------------------------------------------------
+
+def _mysql_plan(conn, statement: str) -> PlanEstimate:
+    raw = conn.exec_driver_sql(f"EXPLAIN FORMAT=JSON {statement}").scalar()
+    plan = json.loads(raw)
+    block = plan.get("query_block", {})
+    cost = float(block.get("cost_info", {}).get("query_cost", 0) or 0)
+    scans, rows = [], None
+
+    def walk(node):
+        nonlocal rows
+        if isinstance(node, dict):
+            table = node.get("table")
+            if isinstance(table, dict):
+                if table.get("access_type") == "ALL":
+                    scans.append(table.get("table_name", "?"))
+                produced = table.get("rows_produced_per_join")
+                if produced is not None:
+                    rows = float(produced)
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(block)
+    return PlanEstimate(cost=cost, rows=rows, full_scans=scans)
+
+
+def _mssql_plan(conn, statement: str) -> PlanEstimate:
+    conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+    try:
+        xml = "".join(str(row[0]) for row in conn.exec_driver_sql(statement).fetchall())
+    finally:
+        conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+    costs = [float(v) for v in re.findall(r'StatementSubTreeCost="([\d.eE+-]+)"', xml)]
+    rows = [float(v) for v in re.findall(r'StatementEstRows="([\d.eE+-]+)"', xml)]
+    scans = re.findall(r'PhysicalOp="(?:Table Scan|Clustered Index Scan)".*?Table="\[?([^\]"]+)\]?"', xml, re.S)
+    return PlanEstimate(cost=sum(costs) if costs else None, rows=max(rows) if rows else None,
+                        full_scans=sorted(set(scans)))
+
+
+TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+[`\"\[]?(\w+)[`\"\]]?(?:\s+(?:AS\s+)?(\w+))?", re.I)
+NOT_ALIASES = {"on", "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "using",
+               "group", "order", "limit", "having", "union", "except", "intersect", "window"}
+
+
+def table_aliases(statement: str) -> Dict[str, str]:
+    """Lower-cased alias (and bare table name) -> table name, for reading plans that show aliases."""
+    aliases: Dict[str, str] = {}
+    if sqlglot is not None:
+        try:
+            for tree in sqlglot.parse(statement, read="sqlite"):
+                for table in (tree.find_all(exp.Table) if tree is not None else ()):
+                    aliases[table.name.lower()] = table.name
+                    if table.alias:
+                        aliases[table.alias.lower()] = table.name
+            return aliases
+        except sqlglot.errors.ParseError:
+            aliases.clear()
+    for table, alias in TABLE_ALIAS.findall(statement):
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _sqlite_plan(conn, statement: str) -> PlanEstimate:
+    # SQLite has no cost model: multiply the sizes of tables scanned in the same loop nest
+    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    children: Dict[int, list] = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    sizes: Dict[str, float] = {}
+    scans: List[str] = []
+    # Newer SQLite versions name tables by their alias in the plan ("SCAN e")
+    aliases = table_aliases(statement)
+
+    def size(table: str) -> float:
+        if table not in sizes:
+            try:
+                sizes[table] = float(conn.exec_driver_sql(f'SELECT MAX(rowid) FROM "{table}"').scalar() or 0)
+            except Exception:
+                sizes[table] = 1000.0
+        return sizes[table]
+
+    def cost(parent: int) -> float:
+        loops, nested = 1.0, 0.0
+        for node_id, detail in children.get(parent, []):
+            scan = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+            if scan and scan.group(1) not in ("CONSTANT", "SUBQUERY"):
+                table = aliases.get(scan.group(1).lower(), scan.group(1))
+                scans.append(table)
+                loops *= max(size(table), 1.0)
+            elif not detail.startswith("SEARCH"):
+                nested += cost(node_id)
+        return loops + nested
+
+    total = cost(0)
+    return PlanEstimate(cost=total, rows=None, full_scans=scans)
+
+
+PLANNERS = {"mysql": _mysql_plan, "mssql": _mssql_plan, "sqlite": _sqlite_plan}
+
+
+def estimate_plan(conn, statement: str, dialect: str) -> Optional[PlanEstimate]:
+    planner = PLANNERS.get(dialect)
+    return planner(conn, statement) if planner else None
+
+
+def check_cost(conn, statement: str, dialect: str):
+    try:
+        plan = estimate_plan(conn, statement, dialect)
+    except Exception as e:
+        # An unplannable statement fails on execution too, with the error the fix loop needs
+        SQL_GUARD.inc(dialect=dialect, outcome="plan_failed")
+        log_event("sql_plan_failed", dialect=dialect, error=str(e))
+        return
+    if plan is None or plan.cost is None:
+        return
+    SQL_PLAN_COST.observe(plan.cost, dialect=dialect)
+    limit = max_cost(dialect)
+    if plan.cost > limit:
+        SQL_GUARD.inc(dialect=dialect, outcome="rejected_cost")
+        scans = ", ".join(dict.fromkeys(plan.full_scans)) or "none"
+        hint = " Check for a missing join condition." if len(plan.full_scans) > 1 else ""
+        raise QueryRejected(
+            f"Query rejected before execution: estimated cost {plan.cost:.3g} exceeds the limit of {limit:.3g}. "
+            f"Full table scans: {scans}.{hint} Add selective filters, join on keys or aggregate instead."
+        )
+
+
+# -- server-side timeouts -----------------------------------------------------------
+
+@contextmanager
+def execution_limit(conn, dialect: str, seconds: float):
+    """Apply a per-statement time limit on this connection for the duration of the block."""
+    dbapi = conn.connection.dbapi_connection
+    if dialect == "mysql":
+        conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {int(seconds * 1000)}")
+        try:
+            yield
+        finally:
+            conn.exec_driver_sql("SET SESSION MAX_EXECUTION_TIME = 0")
+    elif dialect == "mssql":
+        previous = getattr(dbapi, "timeout", 0)
+        # The governor refuses plans above the cost limit server-side; the ODBC timeout bounds run time
+        conn.exec_driver_sql(f"SET QUERY_GOVERNOR_COST_LIMIT {int(max_cost('mssql'))}")
+        dbapi.timeout = int(seconds)
+        try:
+            yield
+        finally:
+            dbapi.timeout = previous
+            conn.exec_driver_sql("SET QUERY_GOVERNOR_COST_LIMIT 0")
+    elif dialect == "sqlite":
+        deadline = time.monotonic() + seconds
+        dbapi.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        try:
+            yield
+        finally:
+            dbapi.set_progress_handler(None, 10000)
+    else:
+        yield
+
+
+@contextmanager
+def guarded(conn, statement: str, dialect: str):
+    """Cost-check the statement, then run the block under the execution time limit."""
+    if not enabled():
+        yield
+        return
+    check_cost(conn, statement, dialect)
+    seconds = execution_timeout()
+    try:
+        with execution_limit(conn, dialect, seconds):
+            yield
+    except QueryRejected:
+        raise
+    except Exception as e:
+        if TIMEOUT_ERRORS.search(str(e)):
+            SQL_GUARD.inc(dialect=dialect, outcome="timeout")
+            raise QueryRejected(
+                f"Query cancelled after the {seconds:g}s execution limit. "
+                "Make it cheaper: filter earlier, avoid cross joins and return fewer rows."
+            ) from e
+        SQL_GUARD.inc(dialect=dialect, outcome="error")
+        raise
+    SQL_GUARD.inc(dialect=dialect, outcome="ok")
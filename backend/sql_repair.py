@@ -0,0 +1,227 @@
+# sql_repair.py
+"""
+Local repair of generated SQL from the driver's error, tried before the LLM fix loop:
+
+    unknown column / table    Unknown column 'salry' | Invalid column name | no such column
+                              -> closest identifier in the schema catalog, typos only (edit distance)
+    dialect syntax            LIMIT <-> TOP, `x` <-> [x], NOW() <-> GETDATE(), IFNULL <-> ISNULL, ...
+
+A repair returns a new statement to run immediately; None means the error needs the model. A column
+that lives in a table the statement doesn't read is a missing join, and department -> department_id
+changes what is compared: both still run and return wrong rows, so they are left to the model.
+"""
+import os
+import re
+import difflib
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from metrics import Counter, register, log_event
+
+SQL_REPAIRS = register(Counter("sqlagent_sql_repairs_total", "Local SQL repairs", ("kind", "outcome")))
+
+UNKNOWN_COLUMN = (
+    re.compile(r"Unknown column '([^']+)'", re.I),                          # MySQL 1054
+    re.compile(r"Invalid column name '([^']+)'", re.I),                     # SQL Server 207
+    re.compile(r"multi-part identifier \"([^\"]+)\" could not be bound", re.I),  # SQL Server 4104
+    re.compile(r"no such column: ([\w.]+)", re.I),                          # SQLite
+)
+UNKNOWN_TABLE = (
+    re.compile(r"Table '(?:[^'.]+\.)?([^'.]+)' doesn't exist", re.I),
+    re.compile(r"Invalid object name '(?:[^'.]+\.)?([^'.]+)'", re.I),
+    re.compile(r"no such table: (?:\w+\.)?(\w+)", re.I),
+)
+SYNTAX = re.compile(r"error in your SQL syntax|Incorrect syntax near|syntax error|near \"?\w+\"?: syntax", re.I)
+LITERAL = re.compile(r"('(?:[^']|'')*')")
+KEY_SUFFIX = re.compile(r"_?(id|name|code|key|no|num|number)$", re.I)
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+[`\"\[]?(\w+)[`\"\]]?(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|INNER|LEFT|RIGHT|"
+                       r"FULL|CROSS|GROUP|ORDER|LIMIT|HAVING|UNION)\b)(\w+))?", re.I)
+
+# (pattern, replacement) applied outside string literals
+TO_MSSQL = [
+    (re.compile(r"`([^`]+)`"), r"[\1]"),
+    (re.compile(r"\bNOW\s*\(\s*\)", re.I), "GETDATE()"),
+    (re.compile(r"\bCURDATE\s*\(\s*\)", re.I), "CAST(GETDATE() AS date)"),
+    (re.compile(r"\bIFNULL\s*\(", re.I), "ISNULL("),
+    (re.compile(r"\b(?:CHAR_)?LENGTH\s*\(", re.I), "LEN("),
+]
+TO_MYSQL = [
+    (re.compile(r"\[([^\]]+)\]"), r"`\1`"),
+    (re.compile(r"\bGETDATE\s*\(\s*\)", re.I), "NOW()"),
+    (re.compile(r"\bISNULL\s*\(", re.I), "IFNULL("),
+    (re.compile(r"\bLEN\s*\(", re.I), "CHAR_LENGTH("),
+]
+TO_SQLITE = [
+    (re.compile(r"\[([^\]]+)\]"), r'"\1"'),
+    (re.compile(r"\b(?:GETDATE|NOW)\s*\(\s*\)", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bISNULL\s*\(", re.I), "IFNULL("),
+    (re.compile(r"\bLEN\s*\(", re.I), "LENGTH("),
+]
+RULES = {"mssql": TO_MSSQL, "mysql": TO_MYSQL, "sqlite": TO_SQLITE}
+
+
+class Repair(BaseModel):
+    statement: str = Field(description="Statement to run instead")
+    kind: str = Field(description="unknown_column, unknown_table or syntax")
+    detail: str = Field("", description="What was changed, for the query reasoning")
+
+
+def enabled() -> bool:
+    return os.getenv("SQL_REPAIR", "true").lower() in ("1", "true", "yes")
+
+
+def max_repairs() -> int:
+    # One error is reported at a time, so two misspelled columns take two rounds
+    return int(os.getenv("SQL_REPAIR_MAX_STEPS", "3"))
+
+
+def cutoff() -> float:
+    return float(os.getenv("SQL_REPAIR_CUTOFF", "0.75"))
+
+
+def classify(error: str) -> tuple:
+    """(kind, identifier) for the errors local repair understands, else ("other", None)."""
+    for pattern in UNKNOWN_COLUMN:
+        match = pattern.search(error)
+        if match:
+            return "unknown_column", match.group(1)
+    for pattern in UNKNOWN_TABLE:
+        match = pattern.search(error)
+        if match:
+            return "unknown_table", match.group(1)
+    if SYNTAX.search(error):
+        return "syntax", None
+    return "other", None
+
+
+def _outside_literals(statement: str, fn) -> str:
+    parts = LITERAL.split(statement)
+    for i in range(0, len(parts), 2):
+        parts[i] = fn(parts[i])
+    return "".join(parts)
+
+
+def _norm(name: str) -> str:
+    return name.lower().replace("_", "")
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def is_typo(name: str, candidate: str) -> bool:
+    """salry -> salary, yes; department -> department_id or department_name -> department_id, no."""
+    if KEY_SUFFIX.sub("", name.lower()) == KEY_SUFFIX.sub("", candidate.lower()):
+        return False
+    a, b = _norm(name), _norm(candidate)
+    return edit_distance(a, b) <= max(1, min(2, len(a) // 4))
+
+
+def closest(name: str, candidates: List[str]) -> Optional[str]:
+    """Exact match ignoring case and underscores first (firstname -> first_name), then a difflib typo match."""
+    by_norm = {}
+    for candidate in candidates:
+        by_norm.setdefault(_norm(candidate), candidate)
+    if _norm(name) in by_norm:
+        return by_norm[_norm(name)]
+    for match in difflib.get_close_matches(_norm(name), list(by_norm), n=3, cutoff=cutoff()):
+        if is_typo(name, by_norm[match]):
+            return by_norm[match]
+    return None
+
+
+def referenced_tables(statement: str, tables: Dict[str, List[str]]) -> Dict[str, str]:
+    """alias (or table name) -> catalog table, for the tables the statement reads."""
+    lookup = {t.lower(): t for t in tables}
+    refs = {}
+    for table, alias in TABLE_REF.findall(statement):
+        name = lookup.get(table.lower())
+        if name:
+            refs[table.lower()] = name
+            if alias:
+                refs[alias.lower()] = name
+    return refs
+
+
+def replace_identifier(statement: str, old: str, new: str) -> str:
+    pattern = re.compile(rf"(?<![\w$]){re.escape(old)}(?![\w$])", re.I)
+    return _outside_literals(statement, lambda part: pattern.sub(new, part))
+
+
+def fix_column(statement: str, identifier: str, tables: Dict[str, List[str]]) -> Optional[Repair]:
+    qualifier, _, column = identifier.rpartition(".")
+    refs = referenced_tables(statement, tables)
+    if qualifier and qualifier.lower() in refs:
+        scope = [refs[qualifier.lower()]]
+    else:
+        scope = sorted(set(refs.values())) or list(tables)
+    # A real column of a table the statement doesn't read needs a join, not a rename
+    if any(c.lower() == column.lower() for t in tables if t not in scope for c in tables[t]):
+        return None
+    candidates = [c for t in scope for c in tables.get(t, [])]
+    match = closest(column, candidates)
+    if match is None or match == column:
+        return None
+    fixed = replace_identifier(statement, column, match)
+    if fixed == statement:
+        return None
+    return Repair(statement=fixed, kind="unknown_column", detail=f"column {column} -> {match}")
+
+
+def fix_table(statement: str, identifier: str, tables: Dict[str, List[str]]) -> Optional[Repair]:
+    match = closest(identifier, list(tables))
+    if match is None or match == identifier:
+        return None
+    fixed = replace_identifier(statement, identifier, match)
+    if fixed == statement:
+        return None
+    return Repair(statement=fixed, kind="unknown_table", detail=f"table {identifier} -> {match}")
+
+
+def transpile(statement: str, dialect: str) -> str:
+    """Rewrite the other dialects' row limits, identifier quoting and functions into this one."""
+    sql = statement.strip().rstrip(";").rstrip()
+    if dialect == "mssql":
+        limit = re.search(r"\s+LIMIT\s+(\d+)\s*$", sql, re.I)
+        if limit and not re.match(r"^\s*SELECT\s+(DISTINCT\s+)?TOP\b", sql, re.I):
+            sql = re.sub(r"^\s*SELECT\s+(DISTINCT\s+)?", lambda m: f"SELECT {m.group(1) or ''}TOP {limit.group(1)} ",
+                         sql[:limit.start()], count=1, flags=re.I)
+    elif dialect in ("mysql", "sqlite"):
+        top = re.match(r"^\s*SELECT\s+(DISTINCT\s+)?TOP\s*\(?\s*(\d+)\s*\)?\s+", sql, re.I)
+        if top and not re.search(r"\bLIMIT\s+\d+\s*$", sql, re.I):
+            sql = f"SELECT {top.group(1) or ''}{sql[top.end():]} LIMIT {top.group(2)}"
+
+    def rewrite(part: str) -> str:
+        for pattern, replacement in RULES.get(dialect, ()):
+            part = pattern.sub(replacement, part)
+        return part
+
+    return _outside_literals(sql, rewrite)
+
+
+def repair(statement: str, error: str, tables: Dict[str, List[str]], dialect: str) -> Optional[Repair]:
+    """A corrected statement for a driver error, or None when the LLM fix loop should handle it."""
+    if not enabled():
+        return None
+    kind, identifier = classify(error)
+    fix = None
+    if kind == "unknown_column":
+        fix = fix_column(statement, identifier, tables)
+    elif kind == "unknown_table":
+        fix = fix_table(statement, identifier, tables)
+    elif kind == "syntax":
+        fixed = transpile(statement, dialect)
+        if fixed != statement.strip().rstrip(";").rstrip():
+            fix = Repair(statement=fixed, kind="syntax", detail=f"rewritten for {dialect}")
+    if fix is None:
+        SQL_REPAIRS.inc(kind=kind, outcome="none")
+        return None
+    log_event("sql_repaired", kind=fix.kind, detail=fix.detail)
+    return fix
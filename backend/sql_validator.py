@@ -0,0 +1,131 @@
+# sql_validator.py
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from metrics import CHECKER_SKIPS, register_collector
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # validation degrades to a keyword check and the LLM checker keeps running
+    sqlglot = None
+
+SQLGLOT_DIALECTS = {"mysql": "mysql", "mssql": "tsql", "sqlite": "sqlite"}
+DML_PATTERN = re.compile(r"\b(insert|update|delete|drop|alter|create|truncate|merge|grant|revoke|exec|execute)\b", re.I)
+
+# How often generate_query could skip the 70B checker
+stats = Counter()
+
+
+class Validation(BaseModel):
+    ok: bool = Field(description="Statement parsed and matched the schema")
+    reason: str = Field("", description="Why validation failed")
+    confidence: float = Field(0.0, description="How sure we are the statement needs no LLM review")
+
+
+def min_confidence() -> float:
+    return float(os.getenv("SQL_VALIDATION_MIN_CONFIDENCE", "0.8"))
+
+
+def explain_enabled() -> bool:
+    return os.getenv("SQL_VALIDATE_EXPLAIN", "false").lower() in ("1", "true", "yes")
+
+
+def needs_checker(validation: Validation) -> bool:
+    skip = validation.ok and validation.confidence >= min_confidence()
+    stats["checker_skipped" if skip else "checker_run"] += 1
+    if not validation.ok:
+        print(f"Local SQL validation failed, running checker: {validation.reason}")
+    return not skip
+
+
+def skip_rate() -> float:
+    total = stats["checker_skipped"] + stats["checker_run"]
+    return stats["checker_skipped"] / total if total else 0.0
+
+
+@register_collector
+def _export_metrics():
+    CHECKER_SKIPS.set(stats["checker_skipped"], outcome="skipped")
+    CHECKER_SKIPS.set(stats["checker_run"], outcome="run")
+
+
+def validate_sql(statement: str, tables: Dict[str, List[str]], dialect: str) -> Validation:
+    """Check a generated statement against the cached schema: single read-only SELECT, known tables and columns."""
+    if sqlglot is None:
+        if DML_PATTERN.search(statement):
+            return Validation(ok=False, reason="Statement contains DML/DDL")
+        return Validation(ok=True, confidence=0.5)
+
+    try:
+        parsed = [p for p in sqlglot.parse(statement, read=SQLGLOT_DIALECTS.get(dialect)) if p is not None]
+    except sqlglot.errors.ParseError as e:
+        return Validation(ok=False, reason=f"Parse error: {e}")
+    if len(parsed) != 1:
+        return Validation(ok=False, reason="Expected exactly one statement")
+    tree = parsed[0]
+    if not isinstance(tree, (exp.Select, exp.Union)) or tree.find(
+        exp.Insert, exp.Update, exp.Delete, exp.Drop, exp.Create, exp.Alter, exp.Command
+    ):
+        return Validation(ok=False, reason="Only read-only SELECT statements are allowed")
+
+    lookup = {name.lower(): {c.lower() for c in columns} for name, columns in tables.items()}
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    aliases = {}
+    for table in tree.find_all(exp.Table):
+        name = table.name.lower()
+        if name in ctes:
+            continue
+        if name not in lookup:
+            return Validation(ok=False, reason=f"Unknown table: {table.name}")
+        aliases[(table.alias or table.name).lower()] = name
+
+    derived = bool(ctes) or any(isinstance(s.this, exp.Select) for s in tree.find_all(exp.Subquery))
+    projections = {e.alias.lower() for e in tree.find_all(exp.Alias)}
+    known = set().union(*(lookup[t] for t in aliases.values())) if aliases else set()
+    for column in tree.find_all(exp.Column):
+        name = column.name.lower()
+        if not name or name == "*":
+            continue
+        qualifier = column.table.lower()
+        if qualifier:
+            if qualifier in aliases:
+                if name not in lookup[aliases[qualifier]]:
+                    return Validation(ok=False, reason=f"Unknown column: {column.table}.{column.name}")
+            elif not derived:
+                return Validation(ok=False, reason=f"Unknown table alias: {column.table}")
+        elif name not in known and name not in projections and not derived:
+            return Validation(ok=False, reason=f"Unknown column: {column.name}")
+
+    confidence = 1.0
+    if derived:
+        confidence -= 0.3  # columns of CTEs/derived tables are not checked
+    if len(aliases) > 2:
+        confidence -= 0.1 * (len(aliases) - 2)
+    if tree.find(exp.Window):
+        confidence -= 0.2
+    return Validation(ok=True, confidence=max(confidence, 0.0))
+
+
+def explain_sql(db, statement: str) -> Optional[str]:
+    """Ask the database to plan the statement without running it. Returns an error message or None."""
+    dialect = db.dialect
+    try:
+        with db._engine.connect() as conn:
+            if dialect == "mssql":
+                conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+                try:
+                    conn.exec_driver_sql(statement).fetchall()
+                finally:
+                    conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+            elif dialect == "sqlite":
+                conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+            else:
+                conn.exec_driver_sql(f"EXPLAIN {statement}").fetchall()
+    except Exception as e:
+        return str(e)
+    return None
@@ -1,57 +1,86 @@
-from pydantic import BaseModel, Field
-from typing import List, Any, Dict
-import operator
-from typing_extensions import TypedDict
-from typing import Annotated
-from langchain_community.utilities import SQLDatabase
-
-class Query(BaseModel):
-    statement: str = Field(description="The SQL query to execute")
-    reasoning: str = Field(description="Reasoning behind the query")
-    is_valid: bool = Field(True,description="Indicates if the statement is valid")
-    result: str = Field("",description="query result")
-    error: str = Field("",description="Error message if applicable")
-    
-    @property
-    def info(self) -> str:
-        return (f"SQL query:\n{self.statement}\n\n"
-    f"The reasoning you used to create that query was:\n{self.reasoning}\n\n"
-    f"And this is the result you get:\n{self.result}")
-    @property
-    def error_info(self) -> str:
-        return(f"Wrong SQL query:\n{self.statement}\n\n"
-    f"The reasoning you used to create that query was:\n{self.reasoning}\n\n"
-    f"And this is the error you got when excuted it: {self.error}")
-
-class GeneralMessage(BaseModel):
-    human: str = Field("",description="Human message")
-    llm: str = Field("",description="answer by LLM")        
-
-class InputState(TypedDict):
-  question: str
-  max_attempts: int
-  general_message: Annotated[List[GeneralMessage],operator.add]
-  db: SQLDatabase  
-  
-
-class OutputState(TypedDict):
-  answer: str
-  error_message: str
-  general_message: Annotated[List[GeneralMessage],operator.add]
-  
-class OverallState(TypedDict):
-    question: str
-    max_attempts: int
-    attempts: int
-    answer: str
-    error_message: str
-    tables_info: str
-    reasoning: str
-    queries: List[Query]
-    db: SQLDatabase  # ✅ Add this to propagate DB instance
-
-
-
-class GenQueryResponse(BaseModel):
-    statement: str= Field(description="Query statement to be executed")
+from pydantic import BaseModel, Field
+from typing import List, Any, Dict, Optional, Tuple, Union
+import operator
+from typing_extensions import TypedDict
+from typing import Annotated
+from langchain_community.utilities import SQLDatabase
+
+class ResultSet(BaseModel):
+    columns: List[str] = Field(default_factory=list, description="Column names")
+    rows: List[Tuple[Any, ...]] = Field(default_factory=list, description="Fetched rows, at most the row limit")
+    total_rows: Optional[int] = Field(None, description="Rows the query would return, if known")
+    truncated: bool = Field(False, description="More rows exist than were fetched")
+
+    def summary(self, head: int = 10) -> str:
+        shown = self.rows[:head]
+        if self.total_rows is not None:
+            count = f"{self.total_rows} row(s)"
+        elif self.truncated:
+            count = f"more than {len(self.rows)} row(s)"
+        else:
+            count = f"{len(self.rows)} row(s)"
+        lines = [f"Columns: {', '.join(self.columns)}", f"Total: {count}, showing {len(shown)}"]
+        lines += [str(tuple(row)) for row in shown]
+        aggregates = []
+        for i, col in enumerate(self.columns):
+            values = [row[i] for row in self.rows if isinstance(row[i], (int, float)) and not isinstance(row[i], bool)]
+            if len(values) > 1 and len(values) == len(self.rows):
+                aggregates.append(f"{col}: min={min(values)}, max={max(values)}, avg={sum(values) / len(values):.2f}")
+        if aggregates:
+            scope = "fetched rows" if self.truncated else "all rows"
+            lines.append(f"Aggregates over {scope}: " + "; ".join(aggregates))
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.summary()
+
+class Query(BaseModel):
+    statement: str = Field(description="The SQL query to execute")
+    reasoning: str = Field(description="Reasoning behind the query")
+    is_valid: bool = Field(True,description="Indicates if the statement is valid")
+    result: Union[ResultSet, str] = Field("",description="query result")
+    error: str = Field("",description="Error message if applicable")
+    
+    @property
+    def info(self) -> str:
+        return (f"SQL query:\n{self.statement}\n\n"
+    f"The reasoning you used to create that query was:\n{self.reasoning}\n\n"
+    f"And this is the result you get:\n{self.result}")
+    @property
+    def error_info(self) -> str:
+        return(f"Wrong SQL query:\n{self.statement}\n\n"
+    f"The reasoning you used to create that query was:\n{self.reasoning}\n\n"
+    f"And this is the error you got when excuted it: {self.error}")
+
+class GeneralMessage(BaseModel):
+    human: str = Field("",description="Human message")
+    llm: str = Field("",description="answer by LLM")        
+
+class InputState(TypedDict):
+  question: str
+  max_attempts: int
+  general_message: Annotated[List[GeneralMessage],operator.add]
+  db: SQLDatabase  
+  
+
+class OutputState(TypedDict):
+  answer: str
+  error_message: str
+  general_message: Annotated[List[GeneralMessage],operator.add]
+  
+class OverallState(TypedDict):
+    question: str
+    max_attempts: int
+    attempts: int
+    answer: str
+    error_message: str
+    tables_info: str
+    reasoning: str
+    queries: List[Query]
+    db: SQLDatabase  # ✅ Add this to propagate DB instance
+
+
+
+class GenQueryResponse(BaseModel):
+    statement: str= Field(description="Query statement to be executed")
     reasoning: str= Field(description="Reasoning used to define the query")
\ No newline at end of file
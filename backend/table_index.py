@@ -0,0 +1,145 @@
+# table_index.py
+import os
+import re
+import math
+import zlib
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "with", "and", "or", "is", "are", "was", "were",
+    "be", "me", "my", "we", "our", "us", "i", "you", "your", "do", "does", "did", "have", "has", "what",
+    "which", "who", "whom", "how", "many", "much", "show", "list", "give", "get", "find", "tell", "all",
+    "each", "every", "there", "that", "this", "these", "those", "from", "at", "as", "it", "its", "please",
+    "select", "count", "number", "total", "hello", "hi", "am", "can", "could", "would",
+}
+
+
+def tokenize(value: str) -> List[str]:
+    # emp_firstName -> emp first name
+    value = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(value))
+    tokens = []
+    for tok in re.findall(r"[a-z0-9]+", value.lower()):
+        if tok in STOPWORDS or len(tok) < 2:
+            continue
+        if len(tok) > 3 and tok.endswith("ies"):
+            tok = tok[:-3] + "y"
+        elif len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+def table_document(name: str, table: dict) -> List[str]:
+    """Bag of tokens describing a catalog table; names weigh more than sample values."""
+    tokens = tokenize(name) * 3 + tokenize(table.get("comment", ""))
+    for column in table.get("columns", []):
+        tokens += tokenize(column["name"]) * 2 + tokenize(column.get("comment", ""))
+    for row in table.get("sample_rows", []):
+        tokens += [t for v in row if isinstance(v, str) for t in tokenize(v)]
+    return tokens
+
+
+class BM25Index:
+    # Roughly one distinctive term matched in a table or column name
+    min_score = 1.0
+
+    def __init__(self, docs: Dict[str, List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.names = list(docs)
+        self.tfs = [Counter(docs[n]) for n in self.names]
+        self.lengths = [len(docs[n]) for n in self.names]
+        self.avg_len = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        df = Counter(t for tf in self.tfs for t in tf)
+        n = len(self.names)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def rank(self, question: str) -> List[Tuple[str, float]]:
+        terms = [t for t in set(tokenize(question)) if t in self.idf]
+        scores = []
+        for name, tf, length in zip(self.names, self.tfs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_len) if self.avg_len else self.k1
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    score += self.idf[t] * f * (self.k1 + 1) / (f + norm)
+            scores.append((name, score))
+        scores.sort(key=lambda x: (-x[1], x[0]))
+        return scores
+
+
+def hashing_embedder(dim: int = 512) -> Callable[[List[str]], "np.ndarray"]:
+    """Offline default embedding: hashed bag of tokens and character trigrams."""
+    import numpy as np
+
+    def embed(texts: List[str]):
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for tok in tokenize(text):
+                out[i, zlib.crc32(tok.encode()) % dim] += 1.0
+                for j in range(len(tok) - 2):
+                    out[i, zlib.crc32(tok[j:j + 3].encode()) % dim] += 0.5
+        return out
+
+    return embed
+
+
+class EmbeddingIndex:
+    min_score = 0.2
+
+    def __init__(self, docs: Dict[str, List[str]], embed: Optional[Callable] = None):
+        import numpy as np
+
+        self._np = np
+        self.embed = embed or hashing_embedder()
+        self.names = list(docs)
+        matrix = np.asarray(self.embed([" ".join(docs[n]) for n in self.names]), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+
+    def rank(self, question: str) -> List[Tuple[str, float]]:
+        np = self._np
+        q = np.asarray(self.embed([question]), dtype=np.float32)[0]
+        norm = np.linalg.norm(q)
+        if not norm or not self.names:
+            return [(n, 0.0) for n in sorted(self.names)]
+        scores = self.matrix @ (q / norm)
+        order = np.argsort(-scores, kind="stable")
+        return [(self.names[i], float(scores[i])) for i in order]
+
+
+def select_tables(ranked: List[Tuple[str, float]], min_score: float, relative: float = 0.25,
+                  max_tables: int = 5) -> Optional[List[str]]:
+    """Pick tables from index scores, or return None when the ranking is too ambiguous to trust."""
+    if not ranked or ranked[0][1] < min_score:
+        return None
+    top = ranked[0][1]
+    picked = [name for name, score in ranked if score >= top * relative]
+    if len(picked) > max_tables:
+        return None
+    return picked
+
+
+_indexes: Dict[Tuple[str, str], object] = {}
+_lock = threading.Lock()
+
+
+def get_index(catalog):
+    """Index for the catalog's current snapshot; rebuilt only when the schema version changes."""
+    snapshot = catalog.snapshot()
+    key = (catalog.key, snapshot["version"])
+    index = _indexes.get(key)
+    if index is None:
+        docs = {name: table_document(name, table) for name, table in snapshot["tables"].items()}
+        if os.getenv("TABLE_INDEX", "bm25").lower() == "embedding":
+            index = EmbeddingIndex(docs)
+        else:
+            index = BM25Index(docs)
+        with _lock:
+            for stale in [k for k in _indexes if k[0] == catalog.key]:
+                del _indexes[stale]
+            _indexes[key] = index
+    return index
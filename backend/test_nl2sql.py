@@ -0,0 +1,75 @@
+# test_nl2sql.py
+import sqlite3
+
+import nl2sql
+
+
+class Engine:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def exec_driver_sql(self, sql):
+        return self.conn.execute(sql)
+
+
+class DB:
+    def __init__(self, conn):
+        self._engine = Engine(conn)
+
+
+class Catalog:
+    key = "test"
+    version = "v1"
+    dialect = "sqlite"
+
+    def snapshot(self):
+        return {"tables": {
+            "departments": {
+                "columns": [{"name": "id", "type": "INTEGER"}, {"name": "name", "type": "VARCHAR(50)"}],
+                "primary_key": ["id"], "foreign_keys": [], "sample_rows": [[1, "HR"]],
+            },
+            "employee_information": {
+                "columns": [{"name": "id", "type": "INTEGER"}, {"name": "first_name", "type": "VARCHAR(50)"},
+                            {"name": "last_name", "type": "VARCHAR(50)"}, {"name": "salary", "type": "INTEGER"},
+                            {"name": "department_id", "type": "INTEGER"}],
+                "primary_key": ["id"],
+                "foreign_keys": [{"columns": ["department_id"], "referred_table": "departments", "referred_columns": ["id"]}],
+                "sample_rows": [[1, "Ann", "Lee", 5000, 1]],
+            },
+        }}
+
+
+def setup_db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE departments (id INTEGER PRIMARY KEY, name VARCHAR(50));
+        CREATE TABLE employee_information (id INTEGER PRIMARY KEY, first_name VARCHAR(50), last_name VARCHAR(50),
+                                           salary INTEGER, department_id INTEGER REFERENCES departments(id));
+        INSERT INTO departments VALUES (1, 'HR'), (2, 'Sales');
+        INSERT INTO employee_information VALUES (1, 'Ann', 'Lee', 5000, 1), (2, 'Bob', 'Ray', 7000, 2),
+                                                (3, 'Cy', 'Oh', 9000, 1), (4, 'Di', 'Xu', 3000, 2);
+    """)
+    return conn
+
+
+def test_top_filter_in_either_word_order():
+    conn = setup_db()
+    for question in ("top 1 employees by salary in Sales", "top 1 employees in Sales by salary"):
+        compiled = nl2sql.compile_question(question, Catalog(), DB(conn))
+        assert compiled is not None, question
+        assert "'Sales'" in compiled.statement, question
+        assert conn.execute(compiled.statement).fetchall() == [("Bob", "Ray", 7000)], question
+
+
+def test_top_with_unused_words_defers():
+    conn = setup_db()
+    assert nl2sql.compile_question("top 1 employees by salary sales", Catalog(), DB(conn)) is None